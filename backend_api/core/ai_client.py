@@ -1,50 +1,11 @@
-import requests
+from backend_api.core import http_client
 import json
-import time
 import base64
 import os
-import random
-import threading
 from backend_api.core.config import get_settings
 
 settings = get_settings()
 
-class RateLimiter:
-    """
-    Token Bucket Rate Limiter to control AI API usage.
-    """
-    def __init__(self, max_tokens=2, refill_rate=15):
-        self.capacity = max_tokens
-        self.tokens = max_tokens
-        self.refill_rate = refill_rate / 60.0 # Tokens per second
-        self.last_refill = time.time()
-        self.lock = threading.Lock()
-
-    def acquire(self):
-        with self.lock:
-            now = time.time()
-            elapsed = now - self.last_refill
-            new_tokens = elapsed * self.refill_rate
-            
-            if new_tokens > 0:
-                self.tokens = min(self.capacity, self.tokens + new_tokens)
-                self.last_refill = now
-            
-            if self.tokens >= 1:
-                self.tokens -= 1
-                time.sleep(random.uniform(0.1, 0.5))
-                return
-            else:
-                deficit = 1 - self.tokens
-                wait_time = deficit / self.refill_rate
-                time.sleep(wait_time)
-                self.last_refill = time.time()
-                self.tokens = 0
-                time.sleep(random.uniform(0.1, 0.3))
-                return
-
-_global_rate_limiter = RateLimiter(max_tokens=2, refill_rate=15)
-
 class AIIdentityAnalyst:
     """
     Lightweight client for processing identity deductions using Google Gemini.
@@ -54,7 +15,6 @@ class AIIdentityAnalyst:
         self.api_key = settings.GOOGLE_API_KEY
         self.enabled = bool(self.api_key)
         self.base_url = f"https://generativelanguage.googleapis.com/v1beta/models/{settings.AI_MODEL}:generateContent"
-        self.limiter = _global_rate_limiter
 
     def analizar_email(self, email: str) -> dict:
         if not self.enabled: return {"error": "IA Desactivada"}
@@ -260,7 +220,7 @@ class AIIdentityAnalyst:
                     "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
                     "Referer": "https://www.google.com/"
                 }
-                resp = requests.get(image_path, headers=headers, timeout=15)
+                resp = http_client.get(image_path, headers=headers, timeout=15)
                 if resp.status_code == 200:
                     image_data = base64.b64encode(resp.content).decode('utf-8')
                 else:
@@ -444,9 +404,9 @@ class AIIdentityAnalyst:
             "contents": [{"parts": [{"text": prompt}]}],
             "generationConfig": {"response_mime_type": "application/json"}
         }
-        self.limiter.acquire()
+        # El límite de tasa de Gemini lo aplica core.http_client (limitador 'gemini', sin bloquear el loop)
         try:
-            response = requests.post(f"{self.base_url}?key={self.api_key}", headers=headers, json=payload, timeout=30)
+            response = http_client.post(f"{self.base_url}?key={self.api_key}", headers=headers, json=payload, timeout=30)
             if response.status_code == 200:
                 return self._clean_json_response(response.json()["candidates"][0]["content"]["parts"][0]["text"])
             return {"error": f"Error API: {response.status_code}"}
@@ -455,9 +415,8 @@ class AIIdentityAnalyst:
 
     def _call_gemini_raw(self, payload: dict) -> dict:
         headers = {"Content-Type": "application/json"}
-        self.limiter.acquire()
         try:
-            response = requests.post(f"{self.base_url}?key={self.api_key}", headers=headers, json=payload, timeout=30)
+            response = http_client.post(f"{self.base_url}?key={self.api_key}", headers=headers, json=payload, timeout=30)
             if response.status_code == 200:
                  return self._clean_json_response(response.json()["candidates"][0]["content"]["parts"][0]["text"])
             return {"error": f"Error API: {response.status_code}"}
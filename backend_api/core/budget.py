@@ -0,0 +1,144 @@
+import contextvars
+import threading
+import time
+from typing import Any, Awaitable, List, Optional
+
+from backend_api.core.config import settings
+
+
+class PresupuestoAgotado(Exception):
+    """La investigación ha agotado su plazo o su cupo de llamadas externas."""
+
+
+class Presupuesto:
+    """
+    Plazo y cupo de llamadas externas de una investigación.
+    Viaja en un ContextVar: las tareas del motor lo heredan, core.executor lo copia a los hilos
+    del pool y core.http_client lo consulta en cada petición (recorta timeouts y descuenta llamadas).
+    Los aciertos de caché no consumen cupo.
+    """
+    def __init__(self, plazo: Optional[float] = None, max_llamadas: Optional[int] = None):
+        self.plazo = plazo or settings.INVESTIGATION_DEADLINE
+        self.max_llamadas = max_llamadas or settings.INVESTIGATION_MAX_CALLS
+        self.inicio = time.monotonic()
+        self.limite = self.inicio + self.plazo
+        self.llamadas = 0
+        self.motivo: Optional[str] = None # 'plazo' o 'llamadas' cuando se agota
+        self.rechazos = 0 # Llamadas denegadas por plazo, cupo o turno del limitador fuera de plazo
+        self._lock = threading.Lock()
+
+    def restante(self) -> float:
+        return self.limite - time.monotonic()
+
+    def transcurrido(self) -> float:
+        return time.monotonic() - self.inicio
+
+    def marcar_motivo(self) -> Optional[str]:
+        """Fija el motivo 'plazo' si el plazo ya venció; devuelve el motivo de agotamiento (None si queda presupuesto)."""
+        if self.motivo is None and self.restante() <= 0:
+            self.motivo = 'plazo'
+        return self.motivo
+
+    @property
+    def agotado(self) -> bool:
+        return self.marcar_motivo() is not None
+
+    def registrar_rechazo(self):
+        with self._lock:
+            self.rechazos += 1
+
+    def comprobar(self):
+        if self.agotado:
+            self.registrar_rechazo()
+            raise PresupuestoAgotado(f"Presupuesto de investigación agotado ({self.motivo})")
+
+    def consumir(self, unidades: int = 1):
+        """Descuenta una llamada externa; lanza PresupuestoAgotado si ya no queda plazo o cupo."""
+        self.comprobar()
+        with self._lock:
+            if self.llamadas + unidades > self.max_llamadas:
+                self.motivo = 'llamadas'
+            else:
+                self.llamadas += unidades
+        self.comprobar()
+
+    def resumen(self) -> dict:
+        return {
+            "plazo_segundos": self.plazo,
+            "duracion_segundos": round(self.transcurrido(), 2),
+            "llamadas": self.llamadas,
+            "max_llamadas": self.max_llamadas,
+            "agotado": self.motivo
+        }
+
+
+class PresupuestoCompartido(Presupuesto):
+    """
+    Presupuesto de una consulta compartida (core.singleflight) entre varias investigaciones.
+    Su plazo es el del solicitante que más tiempo tiene de los que siguen esperando (None: sin
+    investigación, plazo por defecto) y cada llamada externa se descuenta a los solicitantes que
+    aún tienen cupo; solo se deniega cuando ninguno lo tiene.
+    """
+    def __init__(self):
+        super().__init__()
+        self.solicitantes: List[Optional[Presupuesto]] = []
+
+    def unir(self, presupuesto: Optional[Presupuesto]):
+        with self._lock:
+            self.solicitantes.append(presupuesto)
+
+    def separar(self, presupuesto: Optional[Presupuesto]):
+        with self._lock:
+            self.solicitantes.remove(presupuesto)
+
+    def restante(self) -> float:
+        with self._lock:
+            solicitantes = list(self.solicitantes)
+        propio = super().restante()
+        if not solicitantes:
+            return propio
+        return max(propio if p is None else p.restante() for p in solicitantes)
+
+    def consumir(self, unidades: int = 1):
+        self.comprobar()
+        with self._lock:
+            solicitantes = list(self.solicitantes)
+        cargada = not solicitantes or None in solicitantes
+        for p in solicitantes:
+            if p is None:
+                continue
+            try:
+                p.consumir(unidades)
+                cargada = True
+            except PresupuestoAgotado:
+                pass
+        if not cargada:
+            self.motivo = 'llamadas'
+        super().consumir(unidades)
+
+
+_actual: contextvars.ContextVar = contextvars.ContextVar("presupuesto", default=None)
+
+
+def presupuesto_actual() -> Optional[Presupuesto]:
+    return _actual.get()
+
+
+def comprobar():
+    """Lanza PresupuestoAgotado si la investigación en curso ya no tiene presupuesto."""
+    p = _actual.get()
+    if p is not None:
+        p.comprobar()
+
+
+def consumir(unidades: int = 1):
+    """Descuenta del presupuesto en curso, si lo hay (llamadas externas que no pasan por http_client)."""
+    p = _actual.get()
+    if p is not None:
+        p.consumir(unidades)
+
+
+async def bajo_presupuesto(presupuesto: Presupuesto, aw: Awaitable[Any]) -> Any:
+    """Ejecuta aw con el presupuesto activo. Debe envolver la corrutina raíz de cada tarea (contexto propio)."""
+    _actual.set(presupuesto)
+    return await aw
@@ -0,0 +1,233 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from backend_api.core.config import settings
+from backend_api.core.executor import ejecutar_sync
+
+
+class CacheTTL:
+    """
+    Caché en memoria de resultados de proveedores.
+    Cada entrada caduca según el TTL de su proveedor y, al superar max_entradas,
+    se expulsa la usada hace más tiempo (LRU). Es segura entre hilos.
+    """
+    def __init__(self, max_entradas: int = 5000, persistente: Optional["CacheSQLite"] = None):
+        self.max_entradas = max_entradas
+        # Segundo nivel opcional en disco, compartido entre workers y redeploys
+        self.persistente = persistente
+        self._hits_disco: Dict[str, int] = {}
+        self._datos: "OrderedDict[str, Tuple[Any, float, float]]" = OrderedDict() # clave -> (valor, creado, expira)
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._expulsiones = 0
+
+    def obtener(self, clave: str) -> Optional[Tuple[Any, float]]:
+        """Devuelve (valor, edad_en_segundos) o None si no está o ha caducado."""
+        proveedor = clave.split("|", 1)[0]
+        ahora = time.time()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[2] <= ahora:
+                if entrada is not None:
+                    del self._datos[clave]
+                self._misses[proveedor] = self._misses.get(proveedor, 0) + 1
+                return None
+            self._datos.move_to_end(clave)
+            self._hits[proveedor] = self._hits.get(proveedor, 0) + 1
+            valor, creado, _ = entrada
+        # Copia profunda: los consumidores (p.ej. el correlador) mutan los resultados
+        return copy.deepcopy(valor), ahora - creado
+
+    def guardar(self, clave: str, valor: Any, ttl: float, creado: Optional[float] = None):
+        if ttl <= 0:
+            return
+        creado = creado or time.time()
+        entrada = (copy.deepcopy(valor), creado, creado + ttl)
+        with self._lock:
+            self._datos[clave] = entrada
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self._expulsiones += 1
+
+    async def obtener_async(self, clave: str) -> Optional[Tuple[Any, float]]:
+        """Memoria primero; si falla, nivel en disco (en el pool de hilos) y promoción a memoria."""
+        en_memoria = self.obtener(clave)
+        if en_memoria is not None or self.persistente is None:
+            return en_memoria
+        en_disco = await ejecutar_sync(self.persistente.obtener, clave)
+        if en_disco is None:
+            return None
+        valor, creado, expira = en_disco
+        self.guardar(clave, valor, expira - creado, creado=creado)
+        proveedor = clave.split("|", 1)[0]
+        with self._lock:
+            self._hits_disco[proveedor] = self._hits_disco.get(proveedor, 0) + 1
+        return valor, time.time() - creado
+
+    async def guardar_async(self, clave: str, valor: Any, ttl: float, persistir: bool = True):
+        self.guardar(clave, valor, ttl)
+        if persistir and ttl > 0 and self.persistente is not None:
+            ahora = time.time()
+            await ejecutar_sync(self.persistente.guardar, clave, valor, ahora, ahora + ttl)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            proveedores = sorted(set(self._hits) | set(self._misses))
+            stats = {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "expulsiones": self._expulsiones,
+                "hits": sum(self._hits.values()),
+                "misses": sum(self._misses.values()),
+                "hits_disco": sum(self._hits_disco.values()),
+                "por_proveedor": {
+                    p: {
+                        "hits": self._hits.get(p, 0),
+                        "misses": self._misses.get(p, 0),
+                        "hits_disco": self._hits_disco.get(p, 0)
+                    } for p in proveedores
+                }
+            }
+        if self.persistente is not None:
+            stats["disco"] = self.persistente.estadisticas()
+        return stats
+
+
+class CacheSQLite:
+    """
+    Nivel persistente de la caché: fichero SQLite local en modo WAL, compartido por los workers de uvicorn
+    y que sobrevive a los redeploys si la ruta está en un disco persistente.
+    Los valores se guardan como JSON comprimido (zlib) con un índice por fecha de expiración.
+    Sus métodos son bloqueantes: desde el event loop se llaman vía ejecutar_sync.
+    """
+    def __init__(self, ruta: str, purgar_cada: int = 500):
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self.ruta = ruta
+        self.purgar_cada = purgar_cada
+        self._escrituras = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS resultados ("
+            " clave TEXT PRIMARY KEY,"
+            " proveedor TEXT NOT NULL,"
+            " creado REAL NOT NULL,"
+            " expira REAL NOT NULL,"
+            " valor BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_resultados_expira ON resultados (expira)")
+
+    def obtener(self, clave: str) -> Optional[Tuple[Any, float, float]]:
+        """Devuelve (valor, creado, expira) o None si no existe o ha caducado."""
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT valor, creado, expira FROM resultados WHERE clave = ? AND expira > ?",
+                (clave, time.time())
+            ).fetchone()
+        if fila is None:
+            return None
+        try:
+            valor = json.loads(zlib.decompress(fila[0]).decode("utf-8"))
+        except Exception:
+            return None
+        return valor, fila[1], fila[2]
+
+    def guardar(self, clave: str, valor: Any, creado: float, expira: float):
+        blob = zlib.compress(json.dumps(valor, ensure_ascii=False, default=str).encode("utf-8"))
+        proveedor = clave.split("|", 1)[0]
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO resultados (clave, proveedor, creado, expira, valor) VALUES (?, ?, ?, ?, ?)",
+                (clave, proveedor, creado, expira, blob)
+            )
+            self._escrituras += 1
+            if self._escrituras % self.purgar_cada == 0:
+                self._conn.execute("DELETE FROM resultados WHERE expira <= ?", (time.time(),))
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            total, bytes_valor = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(valor)), 0) FROM resultados WHERE expira > ?", (time.time(),)
+            ).fetchone()
+        return {"ruta": self.ruta, "entradas_vigentes": total, "bytes_comprimidos": bytes_valor}
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+
+def crear_cache() -> CacheTTL:
+    """Caché de dos niveles (memoria + SQLite) según Settings; sin ruta configurada solo memoria."""
+    persistente = None
+    if settings.CACHE_SQLITE_PATH:
+        persistente = CacheSQLite(settings.CACHE_SQLITE_PATH)
+    return CacheTTL(settings.CACHE_MAX_ENTRIES, persistente=persistente)
+
+
+def normalizar_indicador(tipo: str, valor: Any) -> str:
+    """
+    Forma canónica del indicador para la clave (wallets y alias conservan mayúsculas).
+    De una URL solo se normalizan esquema y host: ruta y query distinguen mayúsculas. Los dominios
+    conservan 'www.' (puede resolver a otro host y otro certificado).
+    """
+    v = str(valor or "").strip()
+    if tipo in ('ip', 'email'):
+        return v.lower()
+    if tipo == 'url':
+        try:
+            partes = urlsplit(v)
+        except ValueError:
+            return v
+        if not partes.scheme or not partes.netloc:
+            return v
+        return urlunsplit((partes.scheme.lower(), partes.netloc.lower(), partes.path, partes.query, partes.fragment))
+    if tipo == 'domain':
+        return v.lower().rstrip(".").rstrip("/")
+    return v
+
+
+def clave_cache(proveedor: str, indicador: str, *params: Any) -> str:
+    return f"{proveedor}|{indicador}|{json.dumps(params, ensure_ascii=False, default=str)}"
+
+
+def ttl_para(proveedor: str, negativo: bool = False) -> float:
+    """TTL en segundos del proveedor (0 = no cachear). Los errores se guardan como negativos poco tiempo."""
+    ttl = getattr(settings, f"CACHE_TTL_{proveedor.upper()}", 0)
+    if negativo and ttl:
+        return min(ttl, settings.CACHE_NEGATIVE_TTL)
+    return ttl
+
+
+def _con_fallo(resultado: Dict[str, Any]) -> bool:
+    return ('exito' in resultado and not resultado.get('exito')) or bool(resultado.get('error'))
+
+
+def es_negativo(resultado: Any) -> bool:
+    """
+    Error o resultado degradado (TTL negativo, sin persistir): falla el propio resultado o alguno de los
+    proveedores anidados en 'datos' (p.ej. un 429 de VirusTotal junto a un dominio correcto).
+    """
+    if not isinstance(resultado, dict):
+        return True
+    if 'exito' not in resultado and 'error' in resultado:
+        return True
+    if _con_fallo(resultado):
+        return True
+    datos = resultado.get('datos')
+    if isinstance(datos, dict):
+        return any(isinstance(v, dict) and _con_fallo(v) for v in datos.values())
+    return False
@@ -42,6 +42,104 @@ class Settings(BaseSettings):
     # Discord
     DISCORD_BOT_TOKEN: Optional[str] = ""
 
+    # Motor de análisis
+    # Nº máximo de items de un mismo nivel BFS analizados a la vez
+    ANALYSIS_MAX_CONCURRENT_ITEMS: int = 8
+    # Hilos del pool compartido para proveedores síncronos (whois, dns, vysion, requests...)
+    PROVIDER_THREAD_POOL_SIZE: int = 32
+    # Plazo global (s) para el conjunto de sondas de ServicioDominio
+    DOMAIN_PROBE_DEADLINE: float = 20.0
+    # Límites de lectura de crt.sh y Wayback CDX (filas por consulta y subdominios distintos por fuente):
+    # las respuestas se procesan en streaming y se cortan al alcanzarlos
+    DOMAIN_CRTSH_MAX_ROWS: int = 2000
+    DOMAIN_WAYBACK_MAX_ROWS: int = 1500
+    DOMAIN_MAX_SUBDOMAINS: int = 2000
+    # Resolución DNS en bloque de subdominios (core.dns_resolver): consultas en vuelo en todo el proceso,
+    # timeout por consulta, plazo de la etapa en ServicioDominio y caché (TTL máximo y negativo, en segundos)
+    DNS_CONCURRENCY: int = 200
+    DNS_TIMEOUT: float = 3.0
+    DNS_BULK_DEADLINE: float = 10.0
+    DNS_CACHE_MAX_ENTRIES: int = 50000
+    DNS_MAX_TTL: float = 3600
+    DNS_NEGATIVE_TTL: float = 300
+    # Servidores DNS separados por comas; vacío = los del sistema
+    DNS_NAMESERVERS: str = ""
+    # Sondas de perfiles de ServicioUsuario en vuelo a la vez, sumando todas las búsquedas de usuario del proceso
+    USERNAME_PROBE_CONCURRENCY: int = 32
+    # Catálogo de sitios (JSON; vacío = services/sitios_usuario.json), plazo (s) de las sondas de una búsqueda
+    # y bytes del cuerpo que puede leer como mucho una regla de marcador
+    USERNAME_SITES_CATALOG: str = ""
+    USERNAME_PROBE_DEADLINE: float = 15.0
+    USERNAME_MARKER_MAX_BYTES: int = 65536
+    # Presupuesto por investigación: plazo total (s) y máximo de llamadas externas (los aciertos de caché no cuentan)
+    INVESTIGATION_DEADLINE: float = 90.0
+    INVESTIGATION_MAX_CALLS: int = 600
+    # Frontera de pivots: máximo de pivots que aporta cada resultado y que se expanden por nivel
+    PIVOT_MAX_PER_PARENT: int = 25
+    PIVOT_MAX_PER_LEVEL: int = 40
+
+    # Tamaño del grafo: hijos visibles por padre y tipo de relación (el resto se agrupa en un nodo agregado)
+    GRAPH_MAX_FANOUT: int = 20
+    # Grafos completos que se conservan para paginar sus agregados y segundos que se guardan
+    GRAPH_STORE_MAX: int = 200
+    GRAPH_STORE_TTL: float = 3600
+
+    # Cliente HTTP compartido (core.http_client)
+    HTTP2_ENABLED: bool = True
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 40
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_TIMEOUT: float = 10.0
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+
+    # Límites de tasa por proveedor (core.rate_limit): peticiones/minuto y ráfaga permitida
+    RATE_LIMIT_GEMINI_PER_MIN: float = 15
+    RATE_LIMIT_GEMINI_BURST: int = 2
+    RATE_LIMIT_VIRUSTOTAL_PER_MIN: float = 4
+    RATE_LIMIT_VIRUSTOTAL_BURST: int = 4
+    RATE_LIMIT_HIBP_PER_MIN: float = 10
+    RATE_LIMIT_HIBP_BURST: int = 1
+    RATE_LIMIT_ABUSEIPDB_PER_MIN: float = 60
+    RATE_LIMIT_ABUSEIPDB_BURST: int = 5
+    RATE_LIMIT_URLSCAN_PER_MIN: float = 60
+    RATE_LIMIT_URLSCAN_BURST: int = 5
+    RATE_LIMIT_VYSION_PER_MIN: float = 60
+    RATE_LIMIT_VYSION_BURST: int = 5
+    RATE_LIMIT_CRTSH_PER_MIN: float = 30
+    RATE_LIMIT_CRTSH_BURST: int = 4
+    # Espera máxima por un turno (s) fuera de una investigación y desde los hilos del pool de proveedores
+    RATE_LIMIT_MAX_WAIT: float = 60.0
+    RATE_LIMIT_MAX_SYNC_WAIT: float = 5.0
+
+    # Caché de resultados de proveedores (core.cache): TTL en segundos por proveedor (0 = sin caché)
+    CACHE_MAX_ENTRIES: int = 5000
+    CACHE_NEGATIVE_TTL: float = 60
+    # Segundo nivel persistente (SQLite WAL); vacío = solo memoria. En Render, apuntar a un disco persistente
+    CACHE_SQLITE_PATH: str = ".cache/osint_cache.sqlite3"
+    CACHE_TTL_IP: float = 21600
+    CACHE_TTL_VIRUSTOTAL: float = 21600
+    CACHE_TTL_DOMAIN: float = 21600
+    CACHE_TTL_URLSCAN: float = 3600
+    CACHE_TTL_EMAIL: float = 43200
+    CACHE_TTL_USER: float = 21600
+    CACHE_TTL_VYSION: float = 43200
+    CACHE_TTL_IA: float = 86400
+
+    # Investigaciones en segundo plano (core.jobs)
+    JOBS_WORKERS: int = 4
+    JOBS_MAX_QUEUE: int = 100
+    JOBS_MAX_PER_USER: int = 3
+    # Proxies de confianza delante de la API (Render: 1). Con 0 se ignora X-Forwarded-For y se usa la IP de la conexión
+    TRUSTED_PROXY_HOPS: int = 1
+    # Segundos que se conservan los resultados de una investigación terminada
+    JOBS_RESULT_TTL: float = 3600
+
+    # Triage masivo de IOCs (/api/v1/search/bulk)
+    BULK_MAX_INDICATORS: int = 5000
+    # Indicadores de un mismo tipo (mismos proveedores) analizados a la vez
+    BULK_CONCURRENCY_PER_TYPE: int = 4
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -1,283 +1,462 @@
-from typing import Dict, Any, List
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Tuple, Optional, Callable, Union
+
+# --- Tablas de consulta (se construyen una vez al importar) ---
+
+# Dominios de infraestructura gestionada: un correo bajo ellos no implica personal del objetivo
+INFRA_DOMAINS = ('cloudflare.com', 'akamaitechnologies.com', 'google.com', 'amazon.com', 'azure.com', 'godaddy.com')
+PAISES_HOSTILES = frozenset({'russia', 'china', 'north korea', 'iran'})
+ISP_ANONIMIZACION = ('tor', 'vpn')
+# Palabras clave de ubicación -> país normalizado (en orden de prioridad)
+PAISES_UBICACION = (
+    (('spain', 'españa'), 'Spain'),
+    (('usa', 'united states', 'eeuu'), 'United States'),
+    (('uk', 'united kingdom'), 'United Kingdom'),
+    (('france', 'francia'), 'France'),
+    (('germany', 'alemania'), 'Germany'),
+    (('russia', 'rusia'), 'Russia'),
+    (('china',), 'China'),
+    (('brazil', 'brasil'), 'Brazil'),
+)
+ESTADOS_PERFIL_ACTIVO = frozenset({'Encontrado', 'Verificar Manualmente'})
+TIPOS_USUARIO = ('user', 'usuario')
+
+# Los servicios anidan los datos por proveedor (p.ej. datos['dominio']); las reglas leen esa vista
+DATOS_PROVEEDOR = {'domain': 'dominio', 'ip': 'ip_api', 'user': 'username', 'usuario': 'username'}
+
+
+def _pais_de_ubicacion(ubicacion: str) -> Optional[str]:
+    for claves, pais in PAISES_UBICACION:
+        for clave in claves:
+            if clave in ubicacion:
+                return pais
+    return None
+
+
+class VistaItem:
+    """
+    Vista de un item preparada una sola vez para las reglas: datos del proveedor, valores en minúsculas,
+    país y perfiles activos. Las reglas y los índices de SesionCorrelacion trabajan sobre ella.
+    """
+    __slots__ = ('item', 'tipo', 'input', 'valor', 'datos', 'adicional', 'dominio_correo', 'usuario_correo', 'perfiles_activos', 'pais')
+
+    def __init__(self, item: Dict[str, Any]):
+        self.item = item
+        self.tipo = item.get('tipo')
+        self.input = item.get('input')
+        self.valor = str(self.input or '').lower()
+        d = item.get('datos') or {}
+        clave = DATOS_PROVEEDOR.get(self.tipo)
+        self.datos = d[clave] if clave and isinstance(d.get(clave), dict) else d
+        self.adicional = dict(item.get('analisis_adicional') or {})
+        # VirusTotal llega como proveedor anidado en datos
+        if 'virustotal' not in self.adicional and isinstance(d.get('virustotal'), dict):
+            self.adicional['virustotal'] = d['virustotal']
+        self.dominio_correo = str(self.datos.get('dominio') or '').lower() if self.tipo == 'email' else ''
+        self.usuario_correo = str(self.datos.get('usuario') or '').lower() if self.tipo == 'email' else ''
+        self.perfiles_activos = []
+        if self.tipo in TIPOS_USUARIO:
+            self.perfiles_activos = [p for p in self.datos.get('perfiles_encontrados', []) if p.get('estado') in ESTADOS_PERFIL_ACTIVO]
+        self.pais = self._extraer_pais()
+
+    def _extraer_pais(self) -> Optional[str]:
+        if self.tipo in ('ip', 'phone'):
+            return self.datos.get('pais')
+        if self.tipo in TIPOS_USUARIO:
+            for p in self.datos.get('perfiles_encontrados', []):
+                ubicacion = p.get('metadatos', {}).get('ubicacion')
+                # Texto libre no reconocido: se sigue con el siguiente perfil
+                pais = _pais_de_ubicacion(str(ubicacion).lower()) if ubicacion else None
+                if pais:
+                    return pais
+        return None
+
+
+class ReglaCorrelacion:
+    """
+    Regla de correlación declarativa.
+    - tipos: tipos de item a los que aplica (individual) o par de tipos (cruzada); None aplica a todos.
+    - cuando: predicado sobre las vistas; devuelve None si no hay correlación o un dict con los campos de la plantilla.
+    - relacion / descripcion: plantillas str.format con esos campos y los de base (t, t_mayus, input | va, vb, ta, tb).
+    - nivel: severidad fija o función de los campos. efecto: acción opcional sobre las vistas al disparar.
+    """
+    def __init__(self, nombre: str, tipos: Optional[Tuple[str, ...]], cuando: Callable[..., Optional[Dict[str, Any]]],
+                 tipo: str, relacion: str, descripcion: str, nivel: Union[str, Callable[[Dict[str, Any]], str]],
+                 efecto: Optional[Callable[..., None]] = None):
+        self.nombre = nombre
+        self.tipos = tipos
+        self.cuando = cuando
+        self.tipo = tipo
+        self.relacion = relacion
+        self.descripcion = descripcion
+        self.nivel = nivel
+        self.efecto = efecto
+        # Perfil de evaluación
+        self.evaluaciones = 0
+        self.disparos = 0
+        self.tiempo_ns = 0
+
+    def evaluar(self, vistas: Tuple[VistaItem, ...], base: Dict[str, Any], lista_corr: List[Dict[str, Any]]):
+        inicio = time.perf_counter_ns()
+        campos = self.cuando(*vistas)
+        if campos is not None:
+            campos = {**base, **campos}
+            lista_corr.append({
+                "tipo": self.tipo,
+                "relacion": self.relacion.format(**campos),
+                "descripcion": self.descripcion.format(**campos),
+                "nivel": self.nivel(campos) if callable(self.nivel) else self.nivel
+            })
+            if self.efecto:
+                self.efecto(*vistas)
+            self.disparos += 1
+        self.evaluaciones += 1
+        self.tiempo_ns += time.perf_counter_ns() - inicio
+
+    def perfil(self) -> Dict[str, Any]:
+        return {
+            "regla": self.nombre,
+            "tipos": list(self.tipos) if self.tipos else "*",
+            "evaluaciones": self.evaluaciones,
+            "disparos": self.disparos,
+            "tiempo_ms": round(self.tiempo_ns / 1e6, 3)
+        }
+
+
+# --- Predicados de reglas individuales ---
+
+def _cti_victima(v: VistaItem):
+    cti = v.adicional.get('cti_ransomware') or {}
+    return {} if cti.get('en_lista_victimas') else None
+
+
+def _virustotal_malicioso(v: VistaItem):
+    vt = v.adicional.get('virustotal') or {}
+    hits = vt.get('malicioso', 0) or 0
+    if hits <= 0:
+        return None
+    motores = ", ".join(d['motor'] for d in vt.get('detectores_positivos', [])[:3])
+    return {"hits": hits, "motores": motores}
+
+
+def _ip_pais_hostil(v: VistaItem):
+    pais = v.datos.get('pais')
+    if pais and pais.lower() in PAISES_HOSTILES:
+        return {"ip": v.datos.get('ip'), "pais": pais}
+    return None
+
+
+def _ip_anonimizada(v: VistaItem):
+    isp = str(v.datos.get('isp') or '')
+    isp_l = isp.lower()
+    return {"isp": isp} if any(k in isp_l for k in ISP_ANONIMIZACION) else None
+
+
+def _email_desechable(v: VistaItem):
+    return {} if v.datos.get('es_desechable') else None
+
+
+def _huella_extensa(v: VistaItem):
+    return {"n": len(v.perfiles_activos)} if len(v.perfiles_activos) > 5 else None
+
+
+def _nombres_inconsistentes(v: VistaItem):
+    nombres = set()
+    for p in v.perfiles_activos:
+        n = p.get('metadatos', {}).get('nombre_real')
+        if n: nombres.add(n)
+    return {"nombres": ', '.join(list(nombres)[:3])} if len(nombres) > 1 else None
+
+
+# --- Predicados de reglas cruzadas (vistas en orden canónico de tipo: a.tipo <= b.tipo) ---
+
+def _mismo_dominio_correo(a: VistaItem, b: VistaItem):
+    if a.dominio_correo and a.dominio_correo == b.dominio_correo:
+        return {"dominio": a.datos.get('dominio')}
+    return None
+
+
+def _correo_bajo_dominio(a: VistaItem, b: VistaItem) -> bool:
+    dom = b.dominio_correo
+    return bool(dom) and (dom == a.valor or dom.endswith(f".{a.valor}"))
+
+
+def _es_infra(v: VistaItem) -> bool:
+    return any(d in v.valor for d in INFRA_DOMAINS)
+
+
+def _correo_corporativo(a: VistaItem, b: VistaItem):
+    return {} if _correo_bajo_dominio(a, b) and not _es_infra(a) else None
+
+
+def _correo_infraestructura(a: VistaItem, b: VistaItem):
+    return {} if _correo_bajo_dominio(a, b) and _es_infra(a) else None
+
+
+def _resolucion(a: VistaItem, b: VistaItem, waf: bool, bypass: Optional[bool] = None):
+    ip = a.datos.get('ip_asociada')
+    if not ip or ip != b.input:
+        return None
+    if bool(a.datos.get('es_waf', False)) != waf:
+        return None
+    if bypass is not None and bool(a.datos.get('bypass_exito', False)) != bypass:
+        return None
+    return {"waf": a.datos.get('waf_proveedor', 'WAF')}
+
+
+def _mismo_alias(a: VistaItem, b: VistaItem):
+    return {} if a.valor == b.valor else None
+
+
+def _alias_en_correo(a: VistaItem, b: VistaItem):
+    if a.usuario_correo and a.usuario_correo == b.valor:
+        return {"alias": a.datos.get('usuario')}
+    return None
+
+
+def _derivar_hibp(a: VistaItem, b: VistaItem):
+    """Propaga al usuario el compromiso del correo con su mismo alias."""
+    email_hibp = a.datos.get('hibp_data')
+    if email_hibp and (email_hibp.get('found') or (email_hibp.get('email_breaches') and email_hibp['email_breaches'].get('found'))):
+        if not b.datos.get('hibp_data'):
+            b.datos['hibp_data'] = {'found': False, 'breaches': [], 'breaches_count': 0}
+        b.datos['hibp_data']['found'] = True
+        b.datos['hibp_data']['derived_risk'] = True
+        b.datos['hibp_data']['derived_via'] = a.input # The email address string
+
+
+def _dominio_con_alias(a: VistaItem, b: VistaItem):
+    alias = b.valor.replace(" ", "")
+    return {} if alias and (alias in a.valor or a.valor in alias) else None
+
+
+def _mismo_pais(a: VistaItem, b: VistaItem):
+    return {"pais": a.pais} if a.pais and a.pais == b.pais else None
+
+
+REGLAS_INDIVIDUALES = [
+    ReglaCorrelacion(
+        'cti_victima', None, _cti_victima, "AMENAZA_CRITICA", "Identificador Comprometido ({t_mayus})",
+        "El objetivo '{input}' figura en listas de víctimas de Ransomware.", "Crítica"),
+    ReglaCorrelacion(
+        'virustotal_malicioso', None, _virustotal_malicioso, "MALWARE_DETECTADO", "VirusTotal ({hits} hits)",
+        "⚠️ ALERTA: El identificador '{t}' fue marcado como malicioso por {hits} motores antivirus ({motores}).",
+        lambda c: "Crítica" if c['hits'] > 2 else "Alta"),
+    ReglaCorrelacion(
+        'ip_pais_hostil', ('ip',), _ip_pais_hostil, "RIESGO_GEO", "Jurisdicción Hostil",
+        "La IP {ip} está ubicada en {pais}, zona de alto riesgo para ciberseguridad.", "Media"),
+    ReglaCorrelacion(
+        'ip_anonimizada', ('ip',), _ip_anonimizada, "ANONIMIZACION", "Uso de Proxy/VPN",
+        "El ISP ({isp}) sugiere el uso de redes de anonimización.", "Alta"),
+    ReglaCorrelacion(
+        'email_desechable', ('email',), _email_desechable, "FRAUDE", "Email Temporal",
+        "Correo desechable detectado.", "Alta"),
+    ReglaCorrelacion(
+        'huella_extensa', TIPOS_USUARIO, _huella_extensa, "HUELLA_DIGITAL", "Presencia Extensa",
+        "👤 Alta Exposición: Se han localizado {n} perfiles activos. Esto facilita un perfilado exhaustivo del objetivo.", "Informativa"),
+    ReglaCorrelacion(
+        'nombres_inconsistentes', TIPOS_USUARIO, _nombres_inconsistentes, "IDENTIDAD_MULTIPLE", "Nombres Inconsistentes",
+        "⚠️ Discrepancia: El usuario utiliza diferentes nombres reales en sus redes: {nombres}. Posible uso de identidades falsas o alias.", "Media"),
+]
+
+REGLAS_CRUZADAS = [
+    ReglaCorrelacion(
+        'mismo_dominio_correo', ('email', 'email'), _mismo_dominio_correo, "VINCULO_ORGANIZATIVO", "Mismo Dominio de Correo",
+        "💡 Análisis de Organización: Ambos correos ({va} y {vb}) operan bajo la misma empresa o entidad '{dominio}'. Esto indica una relación laboral o institucional directa.", "Baja"),
+    ReglaCorrelacion(
+        'correo_infraestructura', ('domain', 'email'), _correo_infraestructura, "DEPENDENCIA_TECNICA", "Servicio de Terceros",
+        "🛠️ Infraestructura Externa: El correo {vb} ({va}) indica el uso de servicios gestionados por proveedores externos, no necesariamente personal del objetivo.", "Informativa"),
+    ReglaCorrelacion(
+        'correo_corporativo', ('domain', 'email'), _correo_corporativo, "JERARQUIA", "Email Corporativo",
+        "🔍 Estructura Corporativa: El correo {vb} utiliza el dominio {va}, lo que confirma que es una dirección oficial gestionada por dicha organización.", "Fuerte"),
+    ReglaCorrelacion(
+        'waf_evadido', ('domain', 'ip'), lambda a, b: _resolucion(a, b, waf=True, bypass=True), "INFRAESTRUCTURA_CRITICA", "Bypass de WAF Exitoso",
+        "🔓 WAF Evadido: Se ha descubierto la IP real ({vb}) oculta detrás de {waf}. Esto permite atacar directamente al servidor origen.", "Crítica"),
+    ReglaCorrelacion(
+        'waf_detectado', ('domain', 'ip'), lambda a, b: _resolucion(a, b, waf=True, bypass=False), "INFRAESTRUCTURA_PROTEGIDA", "Protección Detectada ({waf})",
+        "🛡️ Infraestructura Proxy: El sitio utiliza {waf}. La IP {vb} es solo una 'máscara' de seguridad y no el servidor real.", "Informativa"),
+    ReglaCorrelacion(
+        'alojamiento', ('domain', 'ip'), lambda a, b: _resolucion(a, b, waf=False), "INFRAESTRUCTURA", "Alojamiento Detectado",
+        "🖥️ Infraestructura Digital: El sitio web {va} está alojado físicamente en el servidor con IP {vb}. Es su 'dirección digital' real.", "Fuerte"),
+    ReglaCorrelacion(
+        'alias_reutilizado', ('user', 'user'), _mismo_alias, "IDENTIDAD", "Alias Reutilizado",
+        "👤 Perfilado de Usuario: El alias '{va}' aparece en múltiples plataformas. Dado que es un nombre de usuario idéntico, es altamente probable que pertenezca a la misma persona.", "Media"),
+    ReglaCorrelacion(
+        'alias_en_correo', ('email', 'user'), _alias_en_correo, "IDENTIDAD", "Patrón de Usuario",
+        "🧩 Coincidencia de Alias: La parte inicial del correo ({alias}) coincide exactamente con el usuario buscado ({vb}). Es común que las personas usen su nick habitual en sus correos personales.", "Media",
+        efecto=_derivar_hibp),
+    ReglaCorrelacion(
+        'dominio_con_alias', ('domain', 'user'), _dominio_con_alias, "IDENTIDAD_CORPORATIVA", "Posible Sitio Personal/Oficial",
+        "🏢 Huella Corporativa: El dominio {va} contiene el nombre del usuario {vb}, sugiriendo que podría ser su página web personal, portfolio o sitio de su empresa.", "Alta"),
+    ReglaCorrelacion(
+        'mismo_pais', None, _mismo_pais, "GEO_COINCIDENCIA", "Coincidencia Geográfica ({pais})",
+        "🌍 Región Común: Tanto {va} ({ta}) como {vb} ({tb}) parecen operar desde {pais}. Esto refuerza la posibilidad de que estén relacionados localmente.", "Baja"),
+]
+
 
 class Correlador:
+    """
+    Motor de correlación sobre reglas declarativas (ReglaCorrelacion), compiladas una vez en tablas
+    de despacho por tipo de item y por par de tipos: cada item o par solo evalúa las reglas que le aplican.
+    """
+    def __init__(self, individuales: Optional[List[ReglaCorrelacion]] = None, cruzadas: Optional[List[ReglaCorrelacion]] = None):
+        self.individuales = list(REGLAS_INDIVIDUALES if individuales is None else individuales)
+        self.cruzadas = list(REGLAS_CRUZADAS if cruzadas is None else cruzadas)
+        self._por_tipo: Dict[str, Tuple[ReglaCorrelacion, ...]] = {}
+        self._por_par: Dict[Tuple[str, str], Tuple[ReglaCorrelacion, ...]] = {}
+
+    def _reglas_tipo(self, tipo: str) -> Tuple[ReglaCorrelacion, ...]:
+        reglas = self._por_tipo.get(tipo)
+        if reglas is None:
+            reglas = tuple(r for r in self.individuales if r.tipos is None or tipo in r.tipos)
+            self._por_tipo[tipo] = reglas
+        return reglas
+
+    def _reglas_par(self, ta: str, tb: str) -> Tuple[ReglaCorrelacion, ...]:
+        par = (ta, tb)
+        reglas = self._por_par.get(par)
+        if reglas is None:
+            # Se respeta el orden de registro entre reglas específicas y comodín
+            reglas = tuple(r for r in self.cruzadas if r.tipos is None or tuple(sorted(r.tipos)) == par)
+            self._por_par[par] = reglas
+        return reglas
+
+    def vista(self, item: Dict[str, Any]) -> VistaItem:
+        return VistaItem(item)
+
+    def nueva_sesion(self) -> "SesionCorrelacion":
+        """Sesión incremental para correlacionar items a medida que llegan (búsqueda en streaming)."""
+        return SesionCorrelacion(self)
+
     def correlacionar(self, datos_osint: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Genera correlaciones basadas en los datos recolectados.
-        Soporta correlación cruzada de múltiples identificadores (todos contra todos).
+        Soporta correlación cruzada de múltiples identificadores (solo pares candidatos, ver SesionCorrelacion).
         """
-        correlaciones = []
         elementos = datos_osint.get('desglose', [])
-        
+
         if not elementos:
             # Fallback legacy
             return []
 
-        # 1. Análisis Individual (Insights por elemento)
+        # Mismo motor que la búsqueda en streaming: items de uno en uno con joins indexados
+        sesion = self.nueva_sesion()
         for item in elementos:
-            self._analizar_individual(item, correlaciones)
-
-        # 2. Correlación Todos vs Todos (O(N^2))
-        procesados = set()
-        
-        for i, item_a in enumerate(elementos):
-            for item_b in elementos[i+1:]:
-                if item_a is item_b: continue
-                
-                key_pair = frozenset([str(item_a.get('input')), str(item_b.get('input'))])
-                if key_pair in procesados: continue
-                procesados.add(key_pair)
-                
-                self._cruzar_elementos(item_a, item_b, correlaciones)
-
-        return correlaciones
-
-    def _analizar_individual(self, item: Dict[str, Any], lista_corr: List[Dict[str, Any]]):
-        """Genera insights basados en un solo item."""
-        t = item.get('tipo')
-        d = item.get('datos', {})
-        cti = item.get('analisis_adicional', {}).get('cti_ransomware', {})
-        
-        # CTI Check Global
-        if cti and cti.get('en_lista_victimas'):
-             lista_corr.append({
-                "tipo": "AMENAZA_CRITICA",
-                "relacion": f"Identificador Comprometido ({t.upper()})",
-                "descripcion": f"El objetivo '{item.get('input')}' figura en listas de víctimas de Ransomware.",
-                "nivel": "Crítica"
-            })
+            sesion.agregar(item)
+        return sesion.correlaciones
 
-        # CTI Check VirusTotal
-        vt = item.get('analisis_adicional', {}).get('virustotal', {})
-        malicious_count = vt.get('malicioso', 0)
-        
-        if malicious_count > 0:
-             engines = [d['motor'] for d in vt.get('detectores_positivos', [])[:3]]
-             engine_str = ", ".join(engines)
-             lista_corr.append({
-                "tipo": "MALWARE_DETECTADO",
-                "relacion": f"VirusTotal ({malicious_count} hits)",
-                "descripcion": f"⚠️ ALERTA: El identificador '{t}' fue marcado como malicioso por {malicious_count} motores antivirus ({engine_str}).",
-                "nivel": "Crítica" if malicious_count > 2 else "Alta"
-            })
+    def perfil(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Evaluaciones, disparos y tiempo acumulado por regla desde el arranque."""
+        return {
+            "individuales": [r.perfil() for r in self.individuales],
+            "cruzadas": [r.perfil() for r in self.cruzadas]
+        }
 
-        # IP Specific
-        if t == 'ip':
-            pais = d.get('pais')
-            isp = str(d.get('isp') or '') # Safety cast
-            
-            if pais and pais.lower() in ['russia', 'china', 'north korea', 'iran']:
-                 lista_corr.append({
-                    "tipo": "RIESGO_GEO",
-                    "relacion": "Jurisdicción Hostil",
-                    "descripcion": f"La IP {d.get('ip')} está ubicada en {pais}, zona de alto riesgo para ciberseguridad.",
-                    "nivel": "Media"
-                })
-            if 'tor' in isp.lower() or 'vpn' in isp.lower():
-                 lista_corr.append({
-                    "tipo": "ANONIMIZACION",
-                    "relacion": "Uso de Proxy/VPN",
-                    "descripcion": f"El ISP ({isp}) sugiere el uso de redes de anonimización.",
-                    "nivel": "Alta"
-                })
-
-        # Email Specific
-        if t == 'email':
-             if d.get('es_desechable'):
-                 lista_corr.append({"tipo": "FRAUDE", "relacion": "Email Temporal", "descripcion": "Correo desechable detectado.", "nivel": "Alta"})
-
-        # User Specific Insights
-        if t == 'user' or t == 'usuario':
-            perfiles = d.get('perfiles_encontrados', [])
-            encontrados = [p for p in perfiles if p.get('estado') in ['Encontrado', 'Verificar Manualmente']]
-            
-            if len(encontrados) > 5:
-                lista_corr.append({
-                    "tipo": "HUELLA_DIGITAL",
-                    "relacion": "Presencia Extensa",
-                    "descripcion": f"👤 Alta Exposición: Se han localizado {len(encontrados)} perfiles activos. Esto facilita un perfilado exhaustivo del objetivo.",
-                    "nivel": "Informativa"
-                })
-
-            # Check for real names in metadata
-            nombres = set()
-            for p in encontrados:
-                n = p.get('metadatos', {}).get('nombre_real')
-                if n: nombres.add(n)
-            
-            if len(nombres) > 1:
-                lista_corr.append({
-                    "tipo": "IDENTIDAD_MULTIPLE",
-                    "relacion": "Nombres Inconsistentes",
-                    "descripcion": f"⚠️ Discrepancia: El usuario utiliza diferentes nombres reales en sus redes: {', '.join(list(nombres)[:3])}. Posible uso de identidades falsas o alias.",
-                    "nivel": "Media"
-                })
-
-    def _cruzar_elementos(self, a: Dict[str, Any], b: Dict[str, Any], lista_corr: List[Dict[str, Any]]):
+    def _analizar_individual(self, v: VistaItem, lista_corr: List[Dict[str, Any]]):
+        """Genera insights basados en un solo item."""
+        t = v.tipo or ''
+        base = {"t": t, "t_mayus": t.upper(), "input": v.input}
+        for regla in self._reglas_tipo(t):
+            regla.evaluar((v,), base, lista_corr)
+
+    def _cruzar_elementos(self, a: VistaItem, b: VistaItem, lista_corr: List[Dict[str, Any]]):
         """Compara dos elementos y busca relaciones."""
-        ta, va = a.get('tipo'), a.get('input')
-        tb, vb = b.get('tipo'), b.get('input')
-        
-        da = a.get('datos', {})
-        db = b.get('datos', {})
-
-        # Normalizar tipos para reducir combinaciones
-        # Aseguramos orden consistente: email vs domain (no domain vs email)
-        if ta > tb: 
-            ta, tb = tb, ta
-            va, vb = vb, va
+        # Orden canónico por tipo (email vs domain -> domain vs email) para reducir combinaciones
+        if a.tipo > b.tipo:
             a, b = b, a
-            da, db = db, da
-        
-        # CASO 1: Email vs Email (Coincidencia de Dominio)
-        if ta == 'email' and tb == 'email':
-            dom_a = da.get('dominio')
-            dom_b = db.get('dominio')
-            if dom_a and dom_b and dom_a == dom_b:
-                lista_corr.append({
-                    "tipo": "VINCULO_ORGANIZATIVO",
-                    "relacion": "Mismo Dominio de Correo",
-                    "descripcion": f"💡 Análisis de Organización: Ambos correos ({va} y {vb}) operan bajo la misma empresa o entidad '{dom_a}'. Esto indica una relación laboral o institucional directa.",
-                    "nivel": "Baja"
-                })
-
-        # CASO 2: Domain vs Email (Pertenencia)
-        if ta == 'domain' and tb == 'email':
-            email_dom = db.get('dominio', '')
-            if email_dom and (email_dom == va or email_dom.endswith(f".{va}")):
-                # Check si es dominio de infraestructura conocida
-                INFRA_DOMAINS = ['cloudflare.com', 'akamaitechnologies.com', 'google.com', 'amazon.com', 'azure.com', 'godaddy.com']
-                es_infra = any(d in str(va).lower() for d in INFRA_DOMAINS)
-                
-                if es_infra:
-                    lista_corr.append({
-                        "tipo": "DEPENDENCIA_TECNICA",
-                        "relacion": "Servicio de Terceros",
-                        "descripcion": f"🛠️ Infraestructura Externa: El correo {vb} ({va}) indica el uso de servicios gestionados por proveedores externos, no necesariamente personal del objetivo.",
-                        "nivel": "Informativa"
-                    })
-                else:
-                    lista_corr.append({
-                        "tipo": "JERARQUIA",
-                        "relacion": "Email Corporativo",
-                        "descripcion": f"🔍 Estructura Corporativa: El correo {vb} utiliza el dominio {va}, lo que confirma que es una dirección oficial gestionada por dicha organización.",
-                        "nivel": "Fuerte"
-                    })
-
-        # CASO 3: IP vs Domain (Resolución)
-        if ta == 'domain' and tb == 'ip':
-             ip_asociada = da.get('ip_asociada')
-             es_waf = da.get('es_waf', False)
-             bypass = da.get('bypass_exito', False)
-             waf_name = da.get('waf_proveedor', 'WAF')
-
-             if ip_asociada and ip_asociada == vb:
-                 if es_waf and bypass:
-                     lista_corr.append({
-                        "tipo": "INFRAESTRUCTURA_CRITICA",
-                        "relacion": "Bypass de WAF Exitoso",
-                        "descripcion": f"🔓 WAF Evadido: Se ha descubierto la IP real ({vb}) oculta detrás de {waf_name}. Esto permite atacar directamente al servidor origen.",
-                        "nivel": "Crítica"
-                    })
-                 elif es_waf:
-                     lista_corr.append({
-                        "tipo": "INFRAESTRUCTURA_PROTEGIDA",
-                        "relacion": f"Protección Detectada ({waf_name})",
-                        "descripcion": f"🛡️ Infraestructura Proxy: El sitio utiliza {waf_name}. La IP {vb} es solo una 'máscara' de seguridad y no el servidor real.",
-                        "nivel": "Informativa"
-                    })
-                 else:
-                     lista_corr.append({
-                        "tipo": "INFRAESTRUCTURA",
-                        "relacion": "Alojamiento Detectado",
-                        "descripcion": f"🖥️ Infraestructura Digital: El sitio web {va} está alojado físicamente en el servidor con IP {vb}. Es su 'dirección digital' real.",
-                        "nivel": "Fuerte"
-                    })
-
-        # CASO 4: User vs User (Mismo Handle)
-        if ta == 'user' and tb == 'user':
-            if str(va or "").lower() == str(vb or "").lower():
-                 lista_corr.append({
-                    "tipo": "IDENTIDAD",
-                    "relacion": "Alias Reutilizado",
-                    "descripcion": f"👤 Perfilado de Usuario: El alias '{va}' aparece en múltiples plataformas. Dado que es un nombre de usuario idéntico, es altamente probable que pertenezca a la misma persona.",
-                    "nivel": "Media"
-                })
-        
-        # CASO 5: User vs Email
-        if ta == 'email' and tb == 'user':
-             user_part = da.get('usuario')
-             if user_part and str(user_part).lower() == str(vb or "").lower():
-                lista_corr.append({
-                    "tipo": "IDENTIDAD",
-                    "relacion": "Patrón de Usuario",
-                    "descripcion": f"🧩 Coincidencia de Alias: La parte inicial del correo ({user_part}) coincide exactamente con el usuario buscado ({vb}). Es común que las personas usen su nick habitual en sus correos personales.",
-                    "nivel": "Media"
-                })
-
-                # ENRICHMENT: Warn about Email Compromise in User item
-                email_hibp = da.get('hibp_data')
-                
-                if email_hibp and (email_hibp.get('found') or (email_hibp.get('email_breaches') and email_hibp['email_breaches'].get('found'))):
-                     if not db.get('hibp_data'):
-                         db['hibp_data'] = {'found': False, 'breaches': [], 'breaches_count': 0}
-                     
-                     db['hibp_data']['found'] = True
-                     db['hibp_data']['derived_risk'] = True
-                     db['hibp_data']['derived_via'] = va # The email address string
-        
-        # CASO EXTRA: Domain vs User (Para casos corporativos)
-        if ta == 'domain' and tb == 'user':
-            vb_clean = str(vb or "").lower().replace(" ", "")
-            va_str = str(va or "").lower()
-            if vb_clean and (vb_clean in va_str or va_str in vb_clean):
-                 lista_corr.append({
-                    "tipo": "IDENTIDAD_CORPORATIVA",
-                    "relacion": "Posible Sitio Personal/Oficial",
-                    "descripcion": f"🏢 Huella Corporativa: El dominio {va} contiene el nombre del usuario {vb}, sugiriendo que podría ser su página web personal, portfolio o sitio de su empresa.",
-                    "nivel": "Alta"
-                })
-
-        # CASO 6: Coincidencia Geográfica (General)
-        pais_a = self._extraer_pais(a)
-        pais_b = self._extraer_pais(b)
-        
-        if pais_a and pais_b and pais_a == pais_b:
-             lista_corr.append({
-                    "tipo": "GEO_COINCIDENCIA",
-                    "relacion": f"Coincidencia Geográfica ({pais_a})",
-                    "descripcion": f"🌍 Región Común: Tanto {va} ({ta}) como {vb} ({tb}) parecen operar desde {pais_a}. Esto refuerza la posibilidad de que estén relacionados localmente.",
-                    "nivel": "Baja"
-             })
-
-        # CASO 7: User vs Domain (Similarity check if not exact)
-        if ta == 'user' and tb == 'domain':
-            if va.lower() in vb.lower():
-                lista_corr.append({
-                    "tipo": "INFRAESTRUCTURA_PERSONAL",
-                    "relacion": "Dominio Relacionado",
-                    "descripcion": f"🌐 El usuario {va} aparece contenido en el dominio {vb}. Es probable que sea su sitio web oficial o de su propiedad.",
-                    "nivel": "Media"
-                })
-
-    def _extraer_pais(self, item):
-        d = item.get('datos', {})
-        t = item.get('tipo')
-        if t == 'ip': return d.get('pais')
-        if t == 'phone': return d.get('pais')
-        if t == 'user' or t == 'usuario':
-            perfiles = d.get('perfiles_encontrados', [])
-            for p in perfiles:
-                loc_raw = p.get('metadatos', {}).get('ubicacion')
-                loc = str(loc_raw).lower() if loc_raw else ""
-                
-                if not loc: continue
-                if 'spain' in loc or 'españa' in loc: return 'Spain'
-                if 'usa' in loc or 'united states' in loc or 'eeuu' in loc: return 'United States'
-                if 'uk' in loc or 'united kingdom' in loc: return 'United Kingdom'
-                if 'france' in loc or 'francia' in loc: return 'France'
-                if 'germany' in loc or 'alemania' in loc: return 'Germany'
-                if 'russia' in loc or 'rusia' in loc: return 'Russia'
-                if 'china' in loc: return 'China'
-                if 'brazil' in loc or 'brasil' in loc: return 'Brazil'
-        return None
+        base = {"va": a.input, "vb": b.input, "ta": a.tipo, "tb": b.tipo}
+        for regla in self._reglas_par(a.tipo, b.tipo):
+            regla.evaluar((a, b), base, lista_corr)
+
+
+class SesionCorrelacion:
+    """
+    Correlación incremental con joins indexados: cada item nuevo genera sus insights individuales
+    y solo se cruza con los items previos que comparten alguna clave de índice (dominio de correo,
+    alias en minúsculas, IP resuelta, país...), no con todos. Las claves cubren todas las reglas
+    cruzadas, así que los pares descartados no habrían producido ninguna correlación.
+    """
+    def __init__(self, correlador: Correlador):
+        self.correlador = correlador
+        self.items: List[VistaItem] = []
+        self.correlaciones: List[Dict[str, Any]] = []
+        self._procesados = set()
+        # espacio -> clave -> posiciones en self.items
+        self._indice: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+        self._por_tipo: Dict[str, List[int]] = defaultdict(list)
+        self.pares_evaluados = 0
+
+    def agregar(self, item: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Añade un item y devuelve solo las correlaciones nuevas que provoca."""
+        nuevas = []
+        vista = self.correlador.vista(item)
+        self.correlador._analizar_individual(vista, nuevas)
+        publica, busca, escanea = self._claves(vista)
+
+        candidatos = set()
+        for espacio, clave in busca:
+            candidatos.update(self._indice[espacio].get(clave, ()))
+        # Reglas por subcadena (dominio contiene alias): no indexables, se recorre solo el tipo complementario
+        for tipo in escanea:
+            candidatos.update(self._por_tipo.get(tipo, ()))
+
+        for pos in sorted(candidatos):
+            previo = self.items[pos]
+            key_pair = frozenset([str(previo.input), str(vista.input)])
+            if key_pair in self._procesados: continue
+            self._procesados.add(key_pair)
+            self.pares_evaluados += 1
+            self.correlador._cruzar_elementos(previo, vista, nuevas)
+
+        pos = len(self.items)
+        self.items.append(vista)
+        self._por_tipo[vista.tipo].append(pos)
+        for espacio, clave in publica:
+            self._indice[espacio][clave].append(pos)
+        self.correlaciones.extend(nuevas)
+        return nuevas
+
+    def _claves(self, v: VistaItem) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]], List[str]]:
+        """Claves que el item publica en el índice, claves que consulta y tipos que recorre completos."""
+        t = v.tipo
+        publica, busca, escanea = [], [], []
+
+        if t == 'email':
+            if v.dominio_correo:
+                # Email vs Email (mismo dominio)
+                publica.append(('email_dominio', v.dominio_correo))
+                busca.append(('email_dominio', v.dominio_correo))
+                # Domain vs Email: el dominio del correo o cualquiera de sus padres
+                for sufijo in self._sufijos(v.dominio_correo):
+                    publica.append(('email_sufijo', sufijo))
+                    busca.append(('dominio', sufijo))
+            if v.usuario_correo:
+                publica.append(('alias_email', v.usuario_correo))
+                busca.append(('alias_usuario', v.usuario_correo))
+        elif t == 'domain':
+            publica.append(('dominio', v.valor))
+            busca.append(('email_sufijo', v.valor))
+            ip = str(v.datos.get('ip_asociada') or '')
+            if ip:
+                publica.append(('ip_dominio', ip))
+                busca.append(('ip', ip))
+            escanea.append('user')
+        elif t == 'ip':
+            publica.append(('ip', v.valor))
+            busca.append(('ip_dominio', v.valor))
+        elif t in TIPOS_USUARIO:
+            publica.append(('alias_usuario', v.valor))
+            busca.append(('alias_usuario', v.valor))
+            busca.append(('alias_email', v.valor))
+            escanea.append('domain')
+
+        if v.pais:
+            publica.append(('pais', v.pais))
+            busca.append(('pais', v.pais))
+        return publica, busca, escanea
+
+    @staticmethod
+    def _sufijos(dominio: str) -> List[str]:
+        partes = dominio.split('.')
+        return ['.'.join(partes[i:]) for i in range(len(partes) - 1)]
@@ -0,0 +1,158 @@
+# Resolución DNS asíncrona compartida por todo el proceso (dnspython, dns.asyncresolver).
+# Resuelve A y AAAA a la vez (la respuesta incluye la cadena CNAME), con una concurrencia global
+# acotada y una caché en memoria que respeta el TTL de cada respuesta (y DNS_NEGATIVE_TTL para
+# NXDOMAIN / sin respuesta), de modo que miles de subdominios se resuelven en segundos.
+import asyncio
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+
+from backend_api.core.config import settings
+
+TIPOS = ('A', 'AAAA')
+
+
+class ResolutorDNS:
+    """
+    Resolutor en bloque: resolver() devuelve {'ips', 'cname', 'vivo'} de un nombre y resolver_muchos()
+    los de una lista completa, con como mucho DNS_CONCURRENCY consultas en vuelo en todo el proceso.
+    """
+    def __init__(self, concurrencia: Optional[int] = None, timeout: Optional[float] = None, max_entradas: Optional[int] = None):
+        self.concurrencia = concurrencia or settings.DNS_CONCURRENCY
+        self.timeout = timeout or settings.DNS_TIMEOUT
+        self.max_entradas = max_entradas or settings.DNS_CACHE_MAX_ENTRIES
+        # (nombre, tipo) -> (expira, ips, nombre canónico)
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, List[str], Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._resolver: Optional[dns.asyncresolver.Resolver] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._sem_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _get_resolver(self) -> dns.asyncresolver.Resolver:
+        if self._resolver is None:
+            servidores = [s.strip() for s in settings.DNS_NAMESERVERS.split(',') if s.strip()]
+            try:
+                resolver = dns.asyncresolver.Resolver(configure=not servidores)
+            except dns.resolver.NoResolverConfiguration:
+                resolver = dns.asyncresolver.Resolver(configure=False)
+                servidores = servidores or ['1.1.1.1', '8.8.8.8']
+            if servidores:
+                resolver.nameservers = servidores
+            resolver.lifetime = self.timeout
+            self._resolver = resolver
+        return self._resolver
+
+    def _limite(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._sem_loop is not loop:
+            self._sem_loop = loop
+            self._sem = asyncio.Semaphore(self.concurrencia)
+        return self._sem
+
+    def _de_cache(self, clave: Tuple[str, str]) -> Optional[Tuple[List[str], Optional[str]]]:
+        with self._lock:
+            entrada = self._cache.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] < time.monotonic():
+                del self._cache[clave]
+                return None
+            self._cache.move_to_end(clave)
+            return entrada[1], entrada[2]
+
+    def _a_cache(self, clave: Tuple[str, str], ttl: float, ips: List[str], canonico: Optional[str]):
+        with self._lock:
+            self._cache[clave] = (time.monotonic() + min(ttl, settings.DNS_MAX_TTL), ips, canonico)
+            self._cache.move_to_end(clave)
+            while len(self._cache) > self.max_entradas:
+                self._cache.popitem(last=False)
+
+    async def _consultar(self, nombre: str, tipo: str) -> Tuple[Optional[List[str]], Optional[str]]:
+        """(ips, nombre canónico) de un tipo de registro; ips es None si el resolutor no respondió a tiempo."""
+        clave = (nombre, tipo)
+        cacheado = self._de_cache(clave)
+        if cacheado is not None:
+            self.hits += 1
+            return cacheado
+        self.misses += 1
+        async with self._limite():
+            try:
+                respuesta = await self._get_resolver().resolve(nombre, tipo, search=False)
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.NoNameservers):
+                self._a_cache(clave, settings.DNS_NEGATIVE_TTL, [], None)
+                return [], None
+            except dns.exception.Timeout:
+                # Sin respuesta no se cachea: puede ser un fallo transitorio
+                return None, None
+        canonico = str(respuesta.canonical_name).rstrip('.').lower()
+        ips = [r.address for r in respuesta]
+        self._a_cache(clave, respuesta.rrset.ttl, ips, canonico)
+        return ips, canonico
+
+    async def resolver(self, nombre: str) -> Dict[str, Any]:
+        nombre = str(nombre).strip().lower().rstrip('.')
+        (ipv4, canon4), (ipv6, canon6) = await asyncio.gather(*[self._consultar(nombre, t) for t in TIPOS])
+        canonico = canon4 or canon6
+        ips = (ipv4 or []) + (ipv6 or [])
+        # Un timeout sin ninguna IP deja el nombre sin determinar (None), no como muerto
+        sin_respuesta = ipv4 is None or ipv6 is None
+        return {
+            "ips": ips,
+            "cname": canonico if canonico and canonico != nombre else None,
+            "vivo": True if ips else (None if sin_respuesta else False)
+        }
+
+    async def resolver_muchos(self, nombres: Iterable[str], comodin_de: Optional[str] = None,
+                              plazo: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Resuelve todos los nombres a la vez. Con comodin_de (dominio padre) se detecta el DNS comodín:
+        los nombres que solo resuelven a las IPs de una etiqueta aleatoria se marcan 'comodin' y no 'vivo'.
+        Lo que no termine dentro del plazo (s) queda con 'vivo' None (sin determinar).
+        """
+        nombres = list(dict.fromkeys(str(n).strip().lower().rstrip('.') for n in nombres if n))
+        if not nombres:
+            return {}
+        tareas = [asyncio.ensure_future(self.resolver(n)) for n in nombres]
+        if comodin_de:
+            tareas.append(asyncio.ensure_future(self.resolver(f"{secrets.token_hex(8)}.{comodin_de}")))
+        _, pendientes = await asyncio.wait(tareas, timeout=plazo)
+        for t in pendientes:
+            t.cancel()
+        comodin = set()
+        if comodin_de:
+            sonda = tareas.pop()
+            if sonda not in pendientes and sonda.exception() is None:
+                comodin = set(sonda.result()["ips"])
+        salida = {}
+        for nombre, t in zip(nombres, tareas):
+            if t in pendientes or t.exception() is not None:
+                salida[nombre] = {"ips": [], "cname": None, "vivo": None}
+                continue
+            r = t.result()
+            if comodin and r["ips"] and set(r["ips"]) <= comodin:
+                r["vivo"] = False
+                r["comodin"] = True
+            salida[nombre] = r
+        return salida
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {"entradas": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+_resolutor: Optional[ResolutorDNS] = None
+
+
+def obtener_resolutor() -> ResolutorDNS:
+    """Resolutor compartido por el proceso (una sola caché DNS)."""
+    global _resolutor
+    if _resolutor is None:
+        _resolutor = ResolutorDNS()
+    return _resolutor
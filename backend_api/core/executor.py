@@ -0,0 +1,51 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from backend_api.core.config import settings
+
+# Pool acotado compartido por todo el proceso para librerías síncronas (requests, whois, dns, vysion...).
+# Se crea bajo demanda para no levantar hilos al importar el módulo.
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(
+            max_workers=settings.PROVIDER_THREAD_POOL_SIZE,
+            thread_name_prefix="osint-provider"
+        )
+    return _pool
+
+
+async def ejecutar_sync(func: Callable, *args, **kwargs) -> Any:
+    """
+    Ejecuta una llamada bloqueante en el pool de proveedores sin bloquear el event loop.
+    Copia el contexto (contextvars) igual que asyncio.to_thread.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    llamada = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(_get_pool(), llamada)
+
+
+async def ejecutar(func: Callable, *args, **kwargs) -> Any:
+    """
+    Punto único de ejecución de proveedores: las corrutinas se esperan directamente
+    en el loop y las funciones síncronas se derivan al pool acotado.
+    """
+    if inspect.iscoroutinefunction(func):
+        return await func(*args, **kwargs)
+    return await ejecutar_sync(func, *args, **kwargs)
+
+
+def cerrar_pool():
+    """Libera los hilos del pool (apagado de la aplicación)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,82 @@
+import heapq
+import math
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from backend_api.core.config import settings
+from backend_api.core.heuristic import HeuristicIntelligence
+
+
+class FronteraPivots:
+    """
+    Frontera de pivots por prioridad para el BFS del motor.
+    Cada candidato se puntúa por valor esperado (tipo, fuente, veces visto, inferencias de HeuristicIntelligence);
+    cada padre aporta como mucho max_por_padre candidatos y cada nivel como mucho max_por_nivel,
+    ordenados de mayor a menor valor para que se expandan primero los más útiles.
+    """
+    # Valor base por tipo de pivot
+    PESO_TIPO = {
+        'email': 3.0, 'wallet': 3.0, 'user': 2.5, 'domain': 2.0,
+        'phone': 2.0, 'ip': 1.5, 'url': 1.0, 'discord': 1.5
+    }
+    # Multiplicador por fuente del pivot (campo de los datos del que sale)
+    PESO_FUENTE = {
+        'vysion_im_profiles': 1.5, 'vysion_leaks': 1.4, 'homepage': 1.2,
+        'dns': 1.1, 'correos_relacionados': 1.0, 'urlscan': 0.8, 'subdominios': 0.7
+    }
+    # Buzones genéricos: rara vez llevan a una persona
+    BUZONES_GENERICOS = {
+        'admin', 'administrator', 'info', 'contact', 'support', 'soporte', 'noreply', 'no-reply',
+        'postmaster', 'hostmaster', 'webmaster', 'abuse', 'security', 'root', 'sales', 'ventas'
+    }
+
+    def __init__(self, heuristica: Optional[HeuristicIntelligence] = None, max_por_padre: Optional[int] = None, max_por_nivel: Optional[int] = None):
+        self.heuristica = heuristica or HeuristicIntelligence()
+        self.max_por_padre = max_por_padre or settings.PIVOT_MAX_PER_PARENT
+        self.max_por_nivel = max_por_nivel or settings.PIVOT_MAX_PER_LEVEL
+        self._vistas: Counter = Counter() # clave -> nº de padres distintos que lo han aportado
+        self._nivel: Dict[str, Dict[str, Any]] = {}
+        self.candidatos = 0
+        self.descartados = 0
+
+    def puntuar(self, candidato: Dict[str, Any]) -> float:
+        tipo = candidato['tipo']
+        valor = str(candidato['valor'])
+        puntos = self.PESO_TIPO.get(tipo, 1.0) * self.PESO_FUENTE.get(candidato.get('fuente'), 1.0)
+        # Un identificador que aparece desde varios padres vale más
+        puntos += 1.5 * math.log2(self._vistas[self._clave(candidato)] or 1)
+        if tipo in ('email', 'user', 'domain'):
+            confianza = self.heuristica.inferir_desde_identificador(valor, tipo).get('confianza')
+            puntos += {'Alta': 1.5, 'Media': 0.75}.get(confianza, 0.0)
+        if tipo == 'email' and valor.split('@')[0].lower() in self.BUZONES_GENERICOS:
+            puntos -= 1.5
+        return round(puntos, 3)
+
+    def agregar(self, padre: str, candidatos: List[Dict[str, Any]]):
+        """Añade los pivots de un padre (ya filtrados contra los procesados), como mucho max_por_padre."""
+        unicos = {}
+        for c in candidatos:
+            unicos.setdefault(self._clave(c), c)
+        for clave in unicos:
+            self._vistas[clave] += 1
+        self.candidatos += len(unicos)
+        mejores = heapq.nlargest(self.max_por_padre, unicos.values(), key=self.puntuar)
+        self.descartados += len(unicos) - len(mejores)
+        for c in mejores:
+            self._nivel.setdefault(self._clave(c), c)
+
+    def siguiente_nivel(self) -> List[Dict[str, Any]]:
+        """Devuelve los pivots del siguiente nivel por prioridad descendente y vacía la frontera."""
+        puntuados = []
+        for c in self._nivel.values():
+            puntuados.append({**c, 'prioridad': self.puntuar(c)})
+        self._nivel = {}
+        elegidos = heapq.nlargest(self.max_por_nivel, puntuados, key=lambda c: c['prioridad'])
+        self.descartados += len(puntuados) - len(elegidos)
+        return elegidos
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {"candidatos": self.candidatos, "descartados": self.descartados}
+
+    def _clave(self, c: Dict[str, Any]) -> str:
+        return f"{c['tipo']}:{c['valor']}"
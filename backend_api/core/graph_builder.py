@@ -1,97 +1,269 @@
-from typing import Dict, Any, List
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from backend_api.core.config import settings
+
+# (id, etiqueta, color, etiqueta de la arista) de una hoja del grafo
+Hoja = Tuple[str, str, str, str]
+
+
+def id_estable(*partes: Any) -> str:
+    """Id derivado del contenido: igual en todos los procesos (hash() de Python se aleatoriza por proceso)."""
+    return hashlib.sha1("\x1f".join(str(p) for p in partes).encode("utf-8")).hexdigest()[:16]
+
 
 class GraphBuilder:
-    def build(self, resultados: Dict[str, Any], objetivo: str, tipo: str) -> Dict[str, List[Dict[str, Any]]]:
-        nodes = []
-        edges = []
-        def add_node(id_, label, color):
-            nodes.append({"id": id_, "label": label, "color": color})
-        def add_edge(a, b, label=""):
-            e = {"from": a, "to": b}
-            if label:
-                e["label"] = label
-            edges.append(e)
-        root_id = f"root:{objetivo}"
-        add_node(root_id, objetivo, "#00f7ff")
-        user = resultados.get("user", {})
-        if user.get("datos"):
-            u = user["datos"]
-            usr = u.get("username", {}) or {}
-            usuario = usr.get("usuario") or user.get("input")
-            if usuario:
-                uid = f"user:{usuario}"
-                add_node(uid, usuario, "#3b82f6")
-                add_edge(root_id, uid, "usuario")
-                for p in usr.get("perfiles_encontrados", []) or []:
-                    sitio = p.get("sitio")
-                    url = p.get("url")
-                    if sitio:
-                        pid = f"account:{sitio}:{usuario}"
-                        add_node(pid, sitio, "#1e40af")
-                        add_edge(uid, pid, url or "cuenta")
-                vip = usr.get("vysion_im_profiles", {})
-                for h in vip.get("hits", []) or []:
-                    plat = h.get("platform") or "IM"
-                    uname = ",".join(h.get("usernames", []) or [])
-                    pid = f"im:{plat}:{h.get('userId')}"
-                    add_node(pid, f"{plat} {uname}".strip(), "#0ea5e9")
-                    add_edge(uid, pid, "perfil IM")
-        domain = resultados.get("domain", {})
-        if domain.get("datos"):
-            d = domain["datos"].get("dominio") or {}
-            dom_name = d.get("dominio") or resultados.get("domain", {}).get("input")
-            if dom_name:
-                did = f"domain:{dom_name}"
-                add_node(did, dom_name, "#10b981")
-                add_edge(root_id, did, "dominio")
-                for s in d.get("subdominios", []) or []:
-                    sid = f"sub:{s}"
-                    add_node(sid, s, "#34d399")
-                    add_edge(did, sid, "subdominio")
-                for e in d.get("correos_relacionados", []) or []:
-                    eid = f"email:{e}"
-                    add_node(eid, e, "#6366f1")
-                    add_edge(did, eid, "email")
-                if d.get("ip_asociada"):
-                    ipid = f"ip:{d['ip_asociada']}"
-                    add_node(ipid, d["ip_asociada"], "#ef4444")
-                    add_edge(did, ipid, "ip")
-        ip = resultados.get("ip", {})
-        if ip.get("datos"):
-            i = ip["datos"].get("ip_api", {})
-            ipaddr = i.get("ip")
+    """
+    Almacén incremental del grafo de una investigación.
+    Los nodos y aristas se deduplican por id (mapa id -> índice) y por (from, to, label); los items se
+    añaden según terminan (add_item / add_enriquecimiento) y delta() devuelve solo lo nuevo desde la
+    última llamada, para emitirlo en streaming sin reconstruir el grafo.
+    El tamaño se acota al añadir: los subdominios se agrupan por etiqueta padre en nodos cluster y cada
+    padre muestra como mucho max_hijos hojas por relación; el resto queda en un nodo agregado
+    ('agregado': True, 'total') cuyos miembros se paginan con miembros().
+    """
+    def __init__(self, objetivo: Optional[str] = None, max_hijos: Optional[int] = None):
+        self.nodes: List[Dict[str, Any]] = []
+        self.edges: List[Dict[str, Any]] = []
+        self.max_hijos = max_hijos or settings.GRAPH_MAX_FANOUT
+        self._nodos: Dict[str, int] = {}
+        self._aristas: Dict[Tuple[str, str, str], int] = {}
+        self._emitidos_nodos = 0
+        self._emitidas_aristas = 0
+        # Hojas visibles por (padre, relación) y miembros de cada cluster/agregado (id -> nodo)
+        self._visibles: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._grupos: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._actualizados = set() # Agregados cuyo total ha cambiado desde el último delta
+        self.root_id = None
+        if objetivo is not None:
+            self.root_id = f"root:{objetivo}"
+            self.add_node(self.root_id, objetivo, "#00f7ff")
+
+    def add_node(self, id_: str, label: str, color: str) -> bool:
+        """Añade el nodo si no existe; devuelve True si es nuevo."""
+        if id_ in self._nodos:
+            return False
+        self._nodos[id_] = len(self.nodes)
+        self.nodes.append({"id": id_, "label": label, "color": color})
+        return True
+
+    def add_edge(self, a: str, b: str, label: str = "") -> bool:
+        clave = (a, b, label)
+        if clave in self._aristas:
+            return False
+        e = {"from": a, "to": b}
+        if label:
+            e["label"] = label
+        self._aristas[clave] = len(self.edges)
+        self.edges.append(e)
+        return True
+
+    def add_hojas(self, padre: str, relacion: str, hojas: List[Hoja]):
+        """Añade hojas bajo padre; pasadas max_hijos por relación, las demás van al nodo agregado del padre."""
+        agg_id = f"agg:{id_estable(padre, relacion)}"
+        antes = len(self._grupos.get(agg_id, ()))
+        for id_, label, color, etiqueta in hojas:
+            if id_ in self._nodos:
+                self.add_edge(padre, id_, etiqueta)
+            elif self._visibles[(padre, relacion)] < self.max_hijos:
+                self._visibles[(padre, relacion)] += 1
+                self.add_node(id_, label, color)
+                self.add_edge(padre, id_, etiqueta)
+            else:
+                self._grupos.setdefault(agg_id, {}).setdefault(id_, {"id": id_, "label": label, "color": color})
+        total = len(self._grupos.get(agg_id, ()))
+        if total == antes:
+            return
+        if self.add_node(agg_id, "", "#64748b"):
+            self.add_edge(padre, agg_id, relacion)
+        else:
+            self._actualizados.add(agg_id)
+        nodo = self.nodes[self._nodos[agg_id]]
+        nodo.update({"label": f"+{total} {relacion}", "agregado": True, "total": total})
+
+    def miembros(self, nodo_id: str, offset: int = 0, limit: int = 50) -> Optional[Dict[str, Any]]:
+        """Página de los miembros de un cluster o nodo agregado (None si el nodo no agrupa nada)."""
+        grupo = self._grupos.get(nodo_id)
+        if grupo is None:
+            return None
+        nodos = list(grupo.values())
+        return {"nodo": nodo_id, "total": len(nodos), "offset": offset, "limit": limit, "nodes": nodos[offset:offset + limit]}
+
+    def add_item(self, item: Dict[str, Any], principal: bool = True):
+        """
+        Incorpora un item del desglose. Los principales (objetivo y adjuntos, profundidad 0) se expanden
+        con sus entidades; de los pivots solo se incorporan los correos.
+        """
+        tipo = item.get("tipo")
+        datos = item.get("datos")
+        if not datos:
+            return
+        if not principal:
+            if tipo == "email":
+                self._add_email(datos)
+            return
+        if tipo == "user":
+            self._add_user(item, datos)
+        elif tipo == "domain":
+            self._add_domain(item, datos)
+        elif tipo == "ip":
+            ipaddr = (datos.get("ip_api") or {}).get("ip")
             if ipaddr:
                 iid = f"ip:{ipaddr}"
-                add_node(iid, ipaddr, "#ef4444")
-                add_edge(root_id, iid, "ip")
-        email_primary = resultados.get("email", {})
-        if email_primary.get("datos"):
-            e = email_primary["datos"].get("email")
-            if e:
-                eid = f"email:{e}"
-                add_node(eid, e, "#6366f1")
-                add_edge(root_id, eid, "email")
-        emails = resultados.get("emails", []) or []
-        for item in emails:
-            datos = item.get("datos", {})
-            e = datos.get("email")
-            if e:
-                eid = f"email:{e}"
-                add_node(eid, e, "#6366f1")
-                add_edge(root_id, eid, "email")
-        vysion = resultados.get("vysion", {})
-        if vysion.get("datos"):
-            v = vysion["datos"]
-            for h in v.get("hits", []) or []:
-                url = h.get("page", {}).get("url", {}).get("url") or ""
-                title = h.get("page", {}).get("pageTitle") or "Resultado"
-                vid = f"vysion:web:{abs(hash(url+title))}"
-                add_node(vid, title, "#8b5cf6")
-                add_edge(root_id, vid, url or "vysion")
-            leaks = v.get("leaks", {})
-            for l in leaks.get("hits", []) or []:
-                lid = f"leak:{l.get('id')}"
-                label = l.get("filePath") or "Leak"
-                add_node(lid, label, "#7f1d1d")
-                add_edge(root_id, lid, "leak")
-        return {"nodes": nodes, "edges": edges}
+                self.add_node(iid, ipaddr, "#ef4444")
+                self.add_edge(self.root_id, iid, "ip")
+        elif tipo == "email":
+            self._add_email(datos)
+
+    def add_enriquecimiento(self, nombre: str, resultado: Dict[str, Any]):
+        """Incorpora el enriquecimiento global (solo Vysion aporta nodos)."""
+        if nombre != "vysion" or not (resultado or {}).get("datos"):
+            return
+        v = resultado["datos"]
+        web = []
+        for h in v.get("hits", []) or []:
+            url = h.get("page", {}).get("url", {}).get("url") or ""
+            title = h.get("page", {}).get("pageTitle") or "Resultado"
+            web.append((f"vysion:web:{id_estable(url, title)}", title, "#8b5cf6", url or "vysion"))
+        self.add_hojas(self.root_id, "vysion", web)
+        leaks = v.get("leaks", {})
+        self.add_hojas(self.root_id, "leak", [
+            (f"leak:{l.get('id')}", l.get("filePath") or "Leak", "#7f1d1d", "leak")
+            for l in leaks.get("hits", []) or []
+        ])
+
+    def delta(self) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Nodos y aristas añadidos o actualizados desde la última llamada (None si no hay cambios)."""
+        nodos = self.nodes[self._emitidos_nodos:]
+        aristas = self.edges[self._emitidas_aristas:]
+        # Los agregados ya emitidos se reenvían con el total nuevo (el cliente actualiza por id)
+        for id_ in self._actualizados:
+            if self._nodos[id_] < self._emitidos_nodos:
+                nodos.append(self.nodes[self._nodos[id_]])
+        self._actualizados = set()
+        self._emitidos_nodos = len(self.nodes)
+        self._emitidas_aristas = len(self.edges)
+        if not nodos and not aristas:
+            return None
+        return {"nodes": nodos, "edges": aristas}
+
+    def grafo(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {"nodes": list(self.nodes), "edges": list(self.edges)}
+
+    def build(self, resultados: Dict[str, Any], objetivo: str, tipo: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Grafo (resumido) a partir de resultados ya agregados, p.ej. una investigación guardada."""
+        g = GraphBuilder(objetivo)
+        for t in ("user", "domain", "ip", "email"):
+            if isinstance(resultados.get(t), dict):
+                g.add_item({**resultados[t], "tipo": t})
+        for item in resultados.get("emails", []) or []:
+            g.add_item({**item, "tipo": "email"}, principal=False)
+        if isinstance(resultados.get("vysion"), dict):
+            g.add_enriquecimiento("vysion", resultados["vysion"])
+        return g.grafo()
+
+    def _add_user(self, item: Dict[str, Any], u: Dict[str, Any]):
+        usr = u.get("username", {}) or {}
+        usuario = usr.get("usuario") or item.get("input")
+        if not usuario:
+            return
+        uid = f"user:{usuario}"
+        self.add_node(uid, usuario, "#3b82f6")
+        self.add_edge(self.root_id, uid, "usuario")
+        cuentas = []
+        for p in usr.get("perfiles_encontrados", []) or []:
+            sitio = p.get("sitio")
+            url = p.get("url")
+            if sitio:
+                cuentas.append((f"account:{sitio}:{usuario}", sitio, "#1e40af", url or "cuenta"))
+        self.add_hojas(uid, "cuenta", cuentas)
+        vip = usr.get("vysion_im_profiles", {})
+        perfiles_im = []
+        for h in vip.get("hits", []) or []:
+            plat = h.get("platform") or "IM"
+            uname = ",".join(h.get("usernames", []) or [])
+            perfiles_im.append((f"im:{plat}:{h.get('userId')}", f"{plat} {uname}".strip(), "#0ea5e9", "perfil IM"))
+        self.add_hojas(uid, "perfil IM", perfiles_im)
+
+    def _add_domain(self, item: Dict[str, Any], datos: Dict[str, Any]):
+        d = datos.get("dominio") or {}
+        dom_name = d.get("dominio") or item.get("input")
+        if not dom_name:
+            return
+        did = f"domain:{dom_name}"
+        self.add_node(did, dom_name, "#10b981")
+        self.add_edge(self.root_id, did, "dominio")
+        self._add_subdominios(did, str(dom_name).lower(), d.get("subdominios", []) or [])
+        self.add_hojas(did, "email", [(f"email:{e}", e, "#6366f1", "email") for e in d.get("correos_relacionados", []) or []])
+        if d.get("ip_asociada"):
+            ipid = f"ip:{d['ip_asociada']}"
+            self.add_node(ipid, d["ip_asociada"], "#ef4444")
+            self.add_edge(did, ipid, "ip")
+
+    def _add_subdominios(self, did: str, dominio: str, subdominios: List[str]):
+        """
+        Agrupa los subdominios por su etiqueta padre (api.x.com para a.api.x.com). Los padres con varios
+        subdominios forman un cluster (los max_hijos más grandes); el resto cuelga directamente del dominio.
+        """
+        por_padre: Dict[str, List[str]] = defaultdict(list)
+        for s in subdominios:
+            padre = str(s).split(".", 1)[1].lower() if "." in str(s) else ""
+            por_padre[padre].append(s)
+        directos = por_padre.pop(dominio, [])
+        clusters = []
+        for padre, subs in por_padre.items():
+            if len(subs) > 1 and padre.endswith(f".{dominio}"):
+                clusters.append((padre, subs))
+            else:
+                directos.extend(subs)
+        clusters.sort(key=lambda c: len(c[1]), reverse=True)
+        for padre, subs in clusters[self.max_hijos:]:
+            directos.extend(subs)
+        for padre, subs in clusters[:self.max_hijos]:
+            cid = f"cluster:{padre}"
+            hojas = [(f"sub:{s}", s, "#34d399", "subdominio") for s in subs]
+            self.add_node(cid, f"*.{padre} ({len(subs)})", "#059669")
+            self.add_edge(did, cid, "subdominios")
+            grupo = self._grupos.setdefault(cid, {})
+            for id_, label, color, _ in hojas:
+                grupo.setdefault(id_, {"id": id_, "label": label, "color": color})
+            self.add_hojas(cid, "subdominio", hojas)
+        self.add_hojas(did, "subdominio", [(f"sub:{s}", s, "#34d399", "subdominio") for s in directos])
+
+    def _add_email(self, datos: Dict[str, Any]):
+        e = datos.get("email")
+        if e:
+            self.add_hojas(self.root_id, "email", [(f"email:{e}", e, "#6366f1", "email")])
+
+
+class AlmacenGrafos:
+    """
+    Grafos completos de las últimas investigaciones (LRU con caducidad), para paginar
+    los clusters y nodos agregados que la respuesta resume.
+    """
+    def __init__(self, max_entradas: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entradas = max_entradas or settings.GRAPH_STORE_MAX
+        self.ttl = ttl or settings.GRAPH_STORE_TTL
+        self._grafos: "OrderedDict[str, Tuple[float, GraphBuilder]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def guardar(self, search_id: str, grafo: GraphBuilder):
+        with self._lock:
+            self._grafos[search_id] = (time.monotonic() + self.ttl, grafo)
+            self._grafos.move_to_end(search_id)
+            while len(self._grafos) > self.max_entradas:
+                self._grafos.popitem(last=False)
+
+    def obtener(self, search_id: str) -> Optional[GraphBuilder]:
+        with self._lock:
+            entrada = self._grafos.get(search_id)
+            if entrada is None:
+                return None
+            if entrada[0] < time.monotonic():
+                del self._grafos[search_id]
+                return None
+            self._grafos.move_to_end(search_id)
+            return entrada[1]
@@ -0,0 +1,243 @@
+# Subsistema HTTP compartido por todo el proceso.
+# Un único httpx.Client (hilos del pool de proveedores) y un único httpx.AsyncClient (event loop)
+# mantienen pools keep-alive por host, negocian HTTP/2 vía ALPN cuando el proveedor lo soporta
+# y aplican un límite de conexiones simultáneas por host y timeouts unificados.
+# Las peticiones a proveedores con cuota esperan antes su turno en core.rate_limit
+# (y lo devuelven si no llegan a enviarse).
+# Dentro de una investigación, cada petición descuenta del presupuesto (core.budget)
+# y su timeout se recorta al plazo que le queda.
+# Los servicios usan get/post/stream (síncronos) o aget/apost/astream (asíncronos)
+# en lugar de requests/httpx directamente.
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from backend_api.core.config import settings
+from backend_api.core.rate_limit import LimitadorTasa, limitador_para_host
+from backend_api.core.budget import PresupuestoAgotado, presupuesto_actual
+
+# HTTP/2 requiere el paquete 'h2' (httpx[http2]); sin él se usa HTTP/1.1 con keep-alive.
+try:
+    import h2  # noqa: F401
+    HTTP2_DISPONIBLE = True
+except ImportError:
+    HTTP2_DISPONIBLE = False
+
+_lock = threading.Lock()
+_cliente: Optional[httpx.Client] = None
+_semaforos_sync: Dict[str, threading.BoundedSemaphore] = {}
+
+# El cliente asíncrono y sus semáforos pertenecen al loop en el que se crearon
+_loop_async: Optional[asyncio.AbstractEventLoop] = None
+_cliente_async: Optional[httpx.AsyncClient] = None
+_semaforos_async: Dict[str, asyncio.Semaphore] = {}
+
+
+def _limites() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+    )
+
+
+def _timeout_por_defecto() -> httpx.Timeout:
+    return httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+
+
+def _host(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+
+def _preparar(kwargs: dict) -> dict:
+    # Mismo comportamiento que requests.get: seguir redirecciones salvo que se indique lo contrario
+    kwargs.setdefault("follow_redirects", True)
+    if kwargs.get("timeout") is None:
+        kwargs["timeout"] = _timeout_por_defecto()
+    return kwargs
+
+
+def _consumir_presupuesto():
+    p = presupuesto_actual()
+    if p is not None:
+        p.consumir()
+
+
+def _recortar_al_plazo(kwargs: dict) -> dict:
+    # Se aplica justo antes de enviar (tras esperar limitador y semáforo), con el plazo que queda de verdad
+    p = presupuesto_actual()
+    if p is None:
+        return kwargs
+    restante = p.restante()
+    if restante <= 0:
+        p.comprobar()
+        raise PresupuestoAgotado("Presupuesto de investigación agotado (plazo)")
+    t = kwargs["timeout"]
+    if isinstance(t, httpx.Timeout):
+        def _min(v): return restante if v is None else min(v, restante)
+        kwargs["timeout"] = httpx.Timeout(connect=_min(t.connect), read=_min(t.read), write=_min(t.write), pool=_min(t.pool))
+    else:
+        kwargs["timeout"] = min(float(t), restante)
+    return kwargs
+
+
+def get_client() -> httpx.Client:
+    global _cliente
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                _cliente = httpx.Client(
+                    http2=settings.HTTP2_ENABLED and HTTP2_DISPONIBLE,
+                    limits=_limites(),
+                    timeout=_timeout_por_defecto()
+                )
+    return _cliente
+
+
+def get_async_client() -> httpx.AsyncClient:
+    global _loop_async, _cliente_async, _semaforos_async
+    loop = asyncio.get_running_loop()
+    if _cliente_async is None or _loop_async is not loop:
+        _loop_async = loop
+        _semaforos_async = {}
+        _cliente_async = httpx.AsyncClient(
+            http2=settings.HTTP2_ENABLED and HTTP2_DISPONIBLE,
+            limits=_limites(),
+            timeout=_timeout_por_defecto()
+        )
+    return _cliente_async
+
+
+def _semaforo_sync(host: str) -> threading.BoundedSemaphore:
+    sem = _semaforos_sync.get(host)
+    if sem is None:
+        with _lock:
+            sem = _semaforos_sync.setdefault(host, threading.BoundedSemaphore(settings.HTTP_MAX_CONNECTIONS_PER_HOST))
+    return sem
+
+
+def _semaforo_async(host: str) -> asyncio.Semaphore:
+    sem = _semaforos_async.get(host)
+    if sem is None:
+        sem = _semaforos_async.setdefault(host, asyncio.Semaphore(settings.HTTP_MAX_CONNECTIONS_PER_HOST))
+    return sem
+
+
+# --- API síncrona (servicios que corren en el pool de proveedores) ---
+
+# Errores en los que la petición no llegó al proveedor: el turno del limitador se devuelve
+_SIN_ENVIAR = (PresupuestoAgotado, httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _limitar_sync(host: str) -> Optional[LimitadorTasa]:
+    lim = limitador_para_host(host)
+    if lim:
+        lim.adquirir_sync()
+    return lim
+
+
+async def _limitar(host: str) -> Optional[LimitadorTasa]:
+    lim = limitador_para_host(host)
+    if lim:
+        await lim.adquirir()
+    return lim
+
+
+def _devolver(lim: Optional[LimitadorTasa], exc: BaseException, enviada: bool):
+    if lim and not enviada and (isinstance(exc, _SIN_ENVIAR) or not isinstance(exc, Exception)):
+        lim.devolver()
+
+
+def request(method: str, url: str, **kwargs) -> httpx.Response:
+    cliente = get_client()
+    host = _host(url)
+    _consumir_presupuesto()
+    lim = _limitar_sync(host)
+    try:
+        with _semaforo_sync(host):
+            return cliente.request(method, url, **_recortar_al_plazo(_preparar(kwargs)))
+    except BaseException as e:
+        _devolver(lim, e, False)
+        raise
+
+
+def get(url: str, **kwargs) -> httpx.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> httpx.Response:
+    return request("POST", url, **kwargs)
+
+
+@contextmanager
+def stream(method: str, url: str, **kwargs):
+    """Respuesta sin descargar el cuerpo: útil para leer solo el estado o trocear el contenido."""
+    cliente = get_client()
+    host = _host(url)
+    _consumir_presupuesto()
+    lim = _limitar_sync(host)
+    enviada = False
+    try:
+        with _semaforo_sync(host):
+            with cliente.stream(method, url, **_recortar_al_plazo(_preparar(kwargs))) as resp:
+                enviada = True
+                yield resp
+    except BaseException as e:
+        _devolver(lim, e, enviada)
+        raise
+
+
+# --- API asíncrona (corrutinas en el event loop) ---
+
+async def arequest(method: str, url: str, **kwargs) -> httpx.Response:
+    cliente = get_async_client()
+    host = _host(url)
+    _consumir_presupuesto()
+    lim = await _limitar(host)
+    try:
+        async with _semaforo_async(host):
+            return await cliente.request(method, url, **_recortar_al_plazo(_preparar(kwargs)))
+    except BaseException as e:
+        _devolver(lim, e, False)
+        raise
+
+
+async def aget(url: str, **kwargs) -> httpx.Response:
+    return await arequest("GET", url, **kwargs)
+
+
+async def apost(url: str, **kwargs) -> httpx.Response:
+    return await arequest("POST", url, **kwargs)
+
+
+@asynccontextmanager
+async def astream(method: str, url: str, **kwargs):
+    cliente = get_async_client()
+    host = _host(url)
+    _consumir_presupuesto()
+    lim = await _limitar(host)
+    enviada = False
+    try:
+        async with _semaforo_async(host):
+            async with cliente.stream(method, url, **_recortar_al_plazo(_preparar(kwargs))) as resp:
+                enviada = True
+                yield resp
+    except BaseException as e:
+        _devolver(lim, e, enviada)
+        raise
+
+
+async def cerrar():
+    """Cierra los pools de conexiones (apagado de la aplicación)."""
+    global _cliente, _cliente_async, _loop_async
+    if _cliente is not None:
+        _cliente.close()
+        _cliente = None
+    if _cliente_async is not None:
+        await _cliente_async.aclose()
+        _cliente_async = None
+        _loop_async = None
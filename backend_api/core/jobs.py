@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from backend_api.core.config import settings
+from backend_api.core.risk import calcular_riesgo
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_ACTIVOS = ('en_cola', 'en_curso')
+
+
+class ColaLlena(Exception):
+    """No caben más investigaciones en la cola."""
+
+
+class LimiteUsuario(Exception):
+    """El usuario ya tiene el máximo de investigaciones activas."""
+
+
+class AlmacenTrabajosMemoria:
+    """
+    Almacén local de investigaciones (estado, resultados parciales y finales).
+    Cualquier backend compartido (Redis, SQL...) puede sustituirlo implementando los mismos métodos.
+    Los trabajos terminados se purgan tras JOBS_RESULT_TTL segundos.
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._trabajos: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def guardar(self, trabajo: Dict[str, Any]):
+        with self._lock:
+            self._trabajos[trabajo['search_id']] = trabajo
+
+    def obtener(self, search_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._trabajos.get(search_id)
+
+    def activos_de(self, usuario: str) -> int:
+        with self._lock:
+            return sum(1 for t in self._trabajos.values() if t['usuario'] == usuario and t['estado'] in ESTADOS_ACTIVOS)
+
+    def purgar(self):
+        limite = time.time() - self.ttl
+        with self._lock:
+            caducados = [k for k, t in self._trabajos.items() if t.get('terminado') and t['terminado'] < limite]
+            for k in caducados:
+                del self._trabajos[k]
+
+
+class ColaInvestigaciones:
+    """
+    Investigaciones en segundo plano: enviar() devuelve el search_id al instante y un conjunto de workers
+    ejecuta el análisis con el motor compartido, publicando los resultados parciales según se producen.
+    Acotada por longitud de cola (JOBS_MAX_QUEUE) y por investigaciones activas por usuario (JOBS_MAX_PER_USER).
+    """
+    def __init__(self, engine, almacen=None, workers: Optional[int] = None, max_cola: Optional[int] = None, max_por_usuario: Optional[int] = None):
+        self.engine = engine
+        self.almacen = almacen if almacen is not None else AlmacenTrabajosMemoria(settings.JOBS_RESULT_TTL)
+        self.workers = workers or settings.JOBS_WORKERS
+        self.max_cola = max_cola or settings.JOBS_MAX_QUEUE
+        self.max_por_usuario = max_por_usuario or settings.JOBS_MAX_PER_USER
+        self._cola: Optional[asyncio.Queue] = None
+        self._tareas: List[asyncio.Task] = []
+
+    async def iniciar(self):
+        self._cola = asyncio.Queue(maxsize=self.max_cola)
+        self._tareas = [asyncio.create_task(self._worker(), name=f"investigacion-{i}") for i in range(self.workers)]
+
+    async def detener(self):
+        for t in self._tareas:
+            t.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+
+    def enviar(self, usuario: str, objetivo: str, tipo: str, max_depth: int = 2, query: Optional[str] = None, archivo: Optional[str] = None) -> Dict[str, Any]:
+        """Encola una investigación. Lanza LimiteUsuario o ColaLlena si no se admite."""
+        self.almacen.purgar()
+        if self.almacen.activos_de(usuario) >= self.max_por_usuario:
+            raise LimiteUsuario(f"Máximo {self.max_por_usuario} investigaciones activas por usuario")
+        trabajo = {
+            "search_id": str(uuid.uuid4()),
+            "usuario": usuario,
+            "query": query or objetivo,
+            "objetivo": objetivo,
+            "tipo": tipo,
+            "max_depth": max_depth,
+            "archivo": archivo, # Ruta temporal a borrar al terminar (subidas)
+            "estado": "en_cola",
+            "creado": time.time(),
+            "iniciado": None,
+            "terminado": None,
+            "parcial": {"desglose": [], "correlaciones": [], "enriquecimiento": {}},
+            "resultado": None,
+            "error": None
+        }
+        try:
+            self._cola.put_nowait(trabajo['search_id'])
+        except asyncio.QueueFull:
+            raise ColaLlena(f"Cola de investigaciones llena ({self.max_cola})")
+        self.almacen.guardar(trabajo)
+        return trabajo
+
+    def obtener(self, search_id: str) -> Optional[Dict[str, Any]]:
+        return self.almacen.obtener(search_id)
+
+    def longitud(self) -> int:
+        return self._cola.qsize() if self._cola is not None else 0
+
+    async def _worker(self):
+        while True:
+            search_id = await self._cola.get()
+            try:
+                trabajo = self.almacen.obtener(search_id)
+                if trabajo is not None:
+                    await self._ejecutar(trabajo)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Error en investigación %s: %s", search_id, e)
+            finally:
+                self._cola.task_done()
+
+    async def _ejecutar(self, trabajo: Dict[str, Any]):
+        trabajo['estado'] = 'en_curso'
+        trabajo['iniciado'] = time.time()
+        self.almacen.guardar(trabajo)
+        parcial = trabajo['parcial']
+        try:
+            async for evento, datos in self.engine.run_analysis_stream(trabajo['objetivo'], trabajo['tipo'], max_depth=trabajo['max_depth'], search_id=trabajo['search_id']):
+                if evento == 'item':
+                    parcial['desglose'].append(datos)
+                elif evento == 'correlacion':
+                    parcial['correlaciones'].append(datos)
+                elif evento == 'enriquecimiento':
+                    parcial['enriquecimiento'][datos['fuente']] = datos['resultado']
+                elif evento == 'completado':
+                    resultados = datos['resultados']
+                    resultados["graph_data"] = datos['graph_data']
+                    # Mismos campos que SearchResponse
+                    trabajo['resultado'] = {
+                        "exito": True,
+                        "search_id": trabajo['search_id'],
+                        "query": trabajo['query'],
+                        "detected_type": datos['tipo'],
+                        "risk_score": "BAJO" if trabajo['archivo'] else calcular_riesgo(resultados, datos['correlaciones']),
+                        "timestamp": datetime.utcnow(),
+                        "data": resultados,
+                        "correlaciones": datos['correlaciones'],
+                        "geopuntos": [],
+                        "parcial": datos['parcial'],
+                        "motivo_parcial": datos['motivo_parcial']
+                    }
+                self.almacen.guardar(trabajo)
+            trabajo['estado'] = 'completado'
+        except asyncio.CancelledError:
+            trabajo['estado'] = 'error'
+            trabajo['error'] = 'Investigación cancelada'
+            raise
+        except Exception as e:
+            trabajo['estado'] = 'error'
+            trabajo['error'] = str(e)
+        finally:
+            trabajo['terminado'] = time.time()
+            self.almacen.guardar(trabajo)
+            if trabajo['archivo']:
+                try:
+                    os.unlink(trabajo['archivo'])
+                except Exception:
+                    pass
@@ -1,29 +1,29 @@
 import asyncio
+import copy
 import logging
-from typing import Dict, Any, List
-from collections import deque
+import contextvars
+import inspect
+from typing import Dict, Any, List, Optional, Awaitable, Callable, AsyncIterator, Tuple
 
 # Importaciones de Módulos (Production Path)
+from backend_api.core.config import settings
+from backend_api.core.executor import ejecutar
+from backend_api.core.cache import CacheTTL, crear_cache, clave_cache, normalizar_indicador, ttl_para, es_negativo
+from backend_api.core.singleflight import SingleFlight
+from backend_api.core.budget import Presupuesto, PresupuestoAgotado, bajo_presupuesto, presupuesto_actual
+from backend_api.core.budget import comprobar as comprobar_presupuesto
+from backend_api.core.rate_limit import LIMITADOR_POR_PROVEEDOR, turno_anticipado
 from backend_api.core.extractor import ExtractorIdentificadores
 from backend_api.core.heuristic import HeuristicIntelligence
 from backend_api.core.correlation import Correlador
-from backend_api.core.ai_client import AIIdentityAnalyst, RateLimiter
-
-# Servicios
-from backend_api.services.osint_ip import ServicioIP
-from backend_api.services.osint_domain import ServicioDominio
-from backend_api.services.osint_email import ServicioEmail
-from backend_api.services.osint_username import ServicioUsuario
-from backend_api.services.osint_phone import ServicioTelefono
-from backend_api.services.osint_image import ServicioImagen
-from backend_api.services.osint_metadata import ServicioMetadatos
-from backend_api.services.osint_discord import ServicioDiscord
-from backend_api.services.osint_wallet import ServicioWallet
-from backend_api.services.cti_feeds import ServicioCTI
-from backend_api.services.osint_vysion import ServicioVysion
-from backend_api.services.osint_urlscan import ServicioUrlscan
-from backend_api.services.osint_virustotal import ServicioVirusTotal
-from backend_api.core.graph_builder import GraphBuilder
+from backend_api.core.registry import construir_servicios
+from backend_api.core.graph_builder import AlmacenGrafos, GraphBuilder
+from backend_api.core.frontier import FronteraPivots
+from backend_api.core.pivots import crear_registro_por_defecto
+from backend_api.core.risk import menciona_ransomware
+
+# Metadatos de caché del item en curso (cada item se analiza en su propia tarea)
+_meta_cache: contextvars.ContextVar = contextvars.ContextVar("meta_cache", default=None)
 
 class AnalysisEngine:
     """
@@ -32,40 +32,55 @@ class AnalysisEngine:
     """
     # max_depth controla los pivots automáticos; servicios contiene todos los módulos OSINT involucrados.
     
-    def __init__(self, max_depth: int = 1, max_workers: int = 50):
+    def __init__(self, max_depth: int = 1, max_workers: Optional[int] = None, servicios: Optional[Dict[str, Any]] = None, cache: Optional[CacheTTL] = None):
         self.max_depth = max_depth
-        self.max_workers = max_workers
+        # max_workers limita cuántos items de un mismo nivel se analizan en paralelo
+        self.max_workers = max_workers or settings.ANALYSIS_MAX_CONCURRENT_ITEMS
         self.extractor = ExtractorIdentificadores()
         self.heuristica = HeuristicIntelligence()
         self.correlador = Correlador()
-        self.servicios = {
-            'ip': ServicioIP(),
-            'domain': ServicioDominio(),
-            'email': ServicioEmail(),
-            'user': ServicioUsuario(),
-            'phone': ServicioTelefono(),
-            'image': ServicioImagen(),
-            'document': ServicioMetadatos(),
-            'discord': ServicioDiscord(),
-            'wallet': ServicioWallet(),
-            'cti': ServicioCTI(),
-            'vysion': ServicioVysion(),
-            'urlscan': ServicioUrlscan(),
-            'virustotal': ServicioVirusTotal()
-        }
+        # La aplicación inyecta el registro compartido; sin él se construye uno propio
+        self.servicios = servicios if servicios is not None else construir_servicios()
+        # Caché de resultados por proveedor, compartida entre investigaciones
+        self.cache = cache if cache is not None else crear_cache()
+        # Reglas de pivot por tipo de item
+        self.pivots = crear_registro_por_defecto()
+        # Consultas en vuelo compartidas entre investigaciones concurrentes
+        self.vuelos = SingleFlight()
+        # Grafos completos de las últimas investigaciones (paginación de clusters y agregados)
+        self.grafos = AlmacenGrafos()
     
-    async def run_analysis(self, objetivo_inicial: str, tipo_inicial: str, archivos_adjuntos: List[Dict] = []) -> Dict[str, Any]:
+    async def run_analysis(self, objetivo_inicial: str, tipo_inicial: str, archivos_adjuntos: List[Dict] = [], max_depth: Optional[int] = None, presupuesto: Optional[Presupuesto] = None, search_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Ejecuta el ciclo completo de análisis.
+        max_depth permite ajustar la profundidad de pivots por petición sin crear otro motor.
+        Si se agota el presupuesto, resultados['presupuesto']['parcial'] indica que el resultado es parcial.
+        Con search_id, el grafo completo queda disponible para paginar sus agregados (self.grafos).
+        """
+        final = {}
+        async for evento, datos in self.run_analysis_stream(objetivo_inicial, tipo_inicial, archivos_adjuntos, max_depth, presupuesto, search_id):
+            if evento == 'completado':
+                final = datos
+        return final['resultados'], final['correlaciones'], final['graph_data'], tipo_inicial
+
+    async def run_analysis_stream(self, objetivo_inicial: str, tipo_inicial: str, archivos_adjuntos: List[Dict] = [], max_depth: Optional[int] = None, presupuesto: Optional[Presupuesto] = None, search_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Ciclo de análisis como generador de eventos (evento, datos), emitidos en cuanto se producen:
+        'item' (cada elemento del desglose), 'correlacion', 'grafo' (nodos/aristas nuevos),
+        'enriquecimiento' (CTI/Vysion globales) y, al final, 'completado' con el resultado agregado.
+        Toda la investigación corre bajo un Presupuesto (plazo + cupo de llamadas): al vencer el plazo se
+        cancelan las consultas pendientes y se entrega lo obtenido hasta entonces, marcado como parcial.
         """
-        # resultados_raw agrupa salidas por tipo; cola_analisis gestiona el BFS de objetivos.
+        max_depth = self.max_depth if max_depth is None else max_depth
+        presupuesto = presupuesto or Presupuesto()
+        # resultados_raw agrupa salidas por tipo; nivel_actual contiene los objetivos del nivel BFS en curso.
         resultados_raw = {}
-        cola_analisis = deque()
+        nivel_actual = []
         procesados = set() # Evitar bucles
         resultados_raw['emails'] = []
         
         # 1. Encolar Objetivo Inicial
-        cola_analisis.append({
+        nivel_actual.append({
             'tipo': tipo_inicial,
             'valor': objetivo_inicial,
             'profundidad': 0,
@@ -74,7 +89,7 @@ class AnalysisEngine:
         
         # 2. Encolar Archivos Adjuntos (si los hay)
         for adj in archivos_adjuntos:
-            cola_analisis.append({
+            nivel_actual.append({
                 'tipo': adj['tipo'],
                 'valor': adj['valor'], # Ruta local
                 'profundidad': 0,
@@ -83,164 +98,302 @@ class AnalysisEngine:
             })
 
         desglose_final = []
-        
-        # 3. Bucle Principal (BFS Limitado)
-        while cola_analisis:
-            item = cola_analisis.popleft()
-            valor = item['valor']
-            tipo = item['tipo']
-            depth = item['profundidad']
-            
-            # Key única para deduplicación
-            key = f"{tipo}:{valor}"
-            if key in procesados: continue
-            procesados.add(key)
-            
-            # --- EJECUCIÓN DEL ANÁLISIS ---
-            # Ejecutar el servicio específico para cada item
-            resultado_item = await self._analizar_item(tipo, valor, item.get('es_archivo', False))
-            
-            # Guardar en resultados
-            if depth == 0:
-                if tipo not in resultados_raw: resultados_raw[tipo] = resultado_item
-            else:
-                if tipo == 'email':
-                    resultados_raw['emails'].append(resultado_item)
-            
-            desglose_final.append(resultado_item)
-
-            # --- EXTRACCIÓN Y PIVOTING (Si profundidad lo permite) ---
-            if depth < self.max_depth and resultado_item.get('exito'):
-                nuevos_identificadores = self._extraer_nuevos_objetivos(resultado_item)
-                for nuevo in nuevos_identificadores:
-                    if f"{nuevo['tipo']}:{nuevo['valor']}" not in procesados:
-                        cola_analisis.append({
-                            'tipo': nuevo['tipo'],
-                            'valor': nuevo['valor'],
-                            'profundidad': depth + 1,
-                            'origen': f"derivado_de_{tipo}"
-                        })
-
-        # 4. Enriquecimiento Global (CTI, Vysion) sobre el objetivo principal
+        semaforo = asyncio.Semaphore(self.max_workers)
+        sesion = self.correlador.nueva_sesion()
+        frontera = FronteraPivots(self.heuristica)
+        grafo = GraphBuilder(objetivo_inicial) # Incremental: cada item añade sus nodos y se emite el delta
+
+        async def _analizar_limitado(item: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaforo:
+                return await self._analizar_item(item['tipo'], item['valor'], item.get('es_archivo', False))
+
+        # El enriquecimiento global (CTI, Vysion) solo depende del objetivo principal: arranca ya, en paralelo al BFS
+        globales = self._lanzar_enriquecimiento(objetivo_inicial, tipo_inicial, presupuesto)
+        tareas_nivel: Dict[asyncio.Future, int] = {}
+        lote: List[Dict[str, Any]] = []
+        cortado = False # Plazo vencido con consultas aún en curso
+
+        try:
+            # 3. Bucle Principal (BFS Limitado, un nivel completo en paralelo por iteración)
+            while nivel_actual:
+                # Deduplicación en orden de llegada (equivale al popleft de la cola FIFO)
+                lote = []
+                for item in nivel_actual:
+                    key = f"{item['tipo']}:{item['valor']}"
+                    if key in procesados: continue
+                    procesados.add(key)
+                    lote.append(item)
+
+                # --- EJECUCIÓN DEL ANÁLISIS ---
+                tareas_nivel = {
+                    asyncio.ensure_future(bajo_presupuesto(presupuesto, _analizar_limitado(item))): idx
+                    for idx, item in enumerate(lote)
+                }
+                resultados_nivel = [None] * len(lote)
+                # Resultado principal de cada tipo: el primero del nivel 0 en orden de descubrimiento
+                principales = set()
+                tipos_principales = set(resultados_raw)
+                for idx, item in enumerate(lote):
+                    if item['profundidad'] == 0 and item['tipo'] not in tipos_principales:
+                        tipos_principales.add(item['tipo'])
+                        principales.add(idx)
+                pendientes = set(tareas_nivel) | set(globales)
+                restantes = len(lote)
+                while restantes:
+                    hechos, pendientes = await asyncio.wait(
+                        pendientes, timeout=max(presupuesto.restante(), 0), return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not hechos:
+                        cortado = True
+                        break
+                    for tarea in hechos:
+                        if tarea in globales:
+                            yield self._registrar_global(globales.pop(tarea), tarea, resultados_raw, grafo)
+                        else:
+                            restantes -= 1
+                            idx = tareas_nivel[tarea]
+                            resultado_item = tarea.result()
+                            resultados_nivel[idx] = resultado_item
+                            # resultados_raw se rellena al cerrar el nivel, en orden de descubrimiento
+                            grafo.add_item(resultado_item, idx in principales)
+                            yield 'item', resultado_item
+                            for correlacion in sesion.agregar(resultado_item):
+                                yield 'correlacion', correlacion
+                        delta = grafo.delta()
+                        if delta:
+                            yield 'grafo', delta
+
+                if cortado:
+                    break
+                self._guardar_nivel(lote, resultados_nivel, resultados_raw)
+
+                # El desglose conserva el orden del lote (prioridad), no el de finalización
+                for item, resultado_item in zip(lote, resultados_nivel):
+                    tipo = item['tipo']
+                    depth = item['profundidad']
+                    desglose_final.append(resultado_item)
+                    # Sin presupuesto no se abren más pivots
+                    if presupuesto.agotado: continue
+
+                    # --- EXTRACCIÓN Y PIVOTING (Si profundidad lo permite) ---
+                    if depth < max_depth and resultado_item.get('exito'):
+                        nuevos_identificadores = self._extraer_nuevos_objetivos(resultado_item)
+                        frontera.agregar(f"{tipo}:{item['valor']}", [
+                            {
+                                **nuevo,
+                                'profundidad': depth + 1,
+                                'origen': f"derivado_de_{tipo}"
+                            }
+                            for nuevo in nuevos_identificadores
+                            if f"{nuevo['tipo']}:{nuevo['valor']}" not in procesados
+                        ])
+                # Los pivots más valiosos primero: el semáforo atiende las tareas en orden de creación
+                nivel_actual = frontera.siguiente_nivel()
+                tareas_nivel = {}
+
+            # 4. Enriquecimiento Global pendiente
+            while globales and not cortado:
+                hechos, _ = await asyncio.wait(
+                    set(globales), timeout=max(presupuesto.restante(), 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not hechos:
+                    cortado = True
+                    break
+                for tarea in hechos:
+                    yield self._registrar_global(globales.pop(tarea), tarea, resultados_raw, grafo)
+                delta = grafo.delta()
+                if delta:
+                    yield 'grafo', delta
+        finally:
+            # Plazo vencido, cliente desconectado o error: no dejar consultas huérfanas
+            for tarea in list(tareas_nivel) + list(globales):
+                if not tarea.done():
+                    tarea.cancel()
+
+        if cortado:
+            presupuesto.marcar_motivo()
+            # Los items del nivel en curso que no terminaron se entregan marcados como cancelados
+            for tarea, idx in tareas_nivel.items():
+                if resultados_nivel[idx] is None:
+                    item = lote[idx]
+                    resultados_nivel[idx] = self._item_cancelado(item['tipo'], item['valor'])
+                    yield 'item', resultados_nivel[idx]
+                desglose_final.append(resultados_nivel[idx])
+            if tareas_nivel:
+                # Los correos descubiertos cuyo análisis se canceló también quedan registrados
+                self._guardar_nivel(lote, resultados_nivel, resultados_raw)
+            for nombre in globales.values():
+                resultados_raw[nombre] = {"exito": False, "error": "Cancelado: plazo de investigación agotado", "cancelado": True}
+                yield 'enriquecimiento', {"fuente": nombre, "resultado": resultados_raw[nombre]}
+
+        # 5. Resultado agregado (correlaciones ya calculadas de forma incremental)
+        resultados_raw['presupuesto'] = {"parcial": presupuesto.motivo is not None, **presupuesto.resumen()}
+        resultados_raw['pivots'] = frontera.estadisticas()
+        graph_data = grafo.grafo()
+        if search_id:
+            self.grafos.guardar(search_id, grafo)
+        yield 'completado', {
+            "resultados": resultados_raw,
+            "desglose": desglose_final,
+            "correlaciones": sesion.correlaciones,
+            "graph_data": graph_data,
+            "tipo": tipo_inicial,
+            "parcial": presupuesto.motivo is not None,
+            "motivo_parcial": presupuesto.motivo
+        }
+
+    async def run_bulk_stream(self, indicadores: List[Dict[str, str]], concurrencia_por_tipo: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Triage masivo: analiza cada indicador sin pivots ni enriquecimiento global y entrega
+        cada resultado en cuanto termina (con su 'indice' en la lista de entrada).
+        El trabajo se agrupa por tipo: cada grupo usa el mismo conjunto de proveedores y avanza con
+        concurrencia_por_tipo llamadas a la vez, así cada proveedor recibe un flujo constante
+        acotado por su cuota y reutiliza sus conexiones keep-alive.
+        """
+        concurrencia = concurrencia_por_tipo or settings.BULK_CONCURRENCY_PER_TYPE
+        grupos: Dict[str, List[Tuple[int, str]]] = {}
+        for idx, ind in enumerate(indicadores):
+            grupos.setdefault(ind['tipo'], []).append((idx, ind['valor']))
+        salida: asyncio.Queue = asyncio.Queue()
+
+        async def _procesar_grupo(tipo: str, items: List[Tuple[int, str]]):
+            pendientes = iter(items) # Iterador compartido por los trabajadores del grupo
+            entregados = set()
+
+            async def _trabajador():
+                for idx, valor in pendientes:
+                    try:
+                        resultado = await self._analizar_item(tipo, valor)
+                    except Exception as e:
+                        resultado = {"tipo": tipo, "input": valor, "exito": False, "error": str(e) or type(e).__name__, "datos": {}}
+                    entregados.add(idx)
+                    await salida.put({"indice": idx, **resultado})
+
+            try:
+                await asyncio.gather(*[_trabajador() for _ in range(min(concurrencia, len(items)))])
+            except Exception as e:
+                # Fallo del grupo: sus indicadores sin resultado se entregan como error en vez de quedar esperando
+                for idx, valor in items:
+                    if idx not in entregados:
+                        await salida.put({"indice": idx, "tipo": tipo, "input": valor, "exito": False, "error": str(e) or type(e).__name__, "datos": {}})
+            finally:
+                # Centinela: el consumidor termina cuando todos los grupos han acabado, pase lo que pase
+                salida.put_nowait(None)
+
+        tareas = [asyncio.ensure_future(_procesar_grupo(tipo, items)) for tipo, items in grupos.items()]
+        try:
+            activos = len(tareas)
+            while activos:
+                fila = await salida.get()
+                if fila is None:
+                    activos -= 1
+                else:
+                    yield fila
+        finally:
+            for tarea in tareas:
+                if not tarea.done():
+                    tarea.cancel()
+
+    def _lanzar_enriquecimiento(self, objetivo: str, tipo: str, presupuesto: Presupuesto) -> Dict[asyncio.Future, str]:
+        """Lanza las consultas globales sobre el objetivo principal; devuelve tarea -> clave en resultados_raw."""
         # allowed_vysion define tipos donde se consulta Vysion a nivel global (incluye wallet).
         allowed_vysion = ['user', 'domain', 'ip', 'email', 'company', 'wallet']
-        if tipo_inicial not in ['image', 'document']:
-            cti_global = self.servicios['cti'].verificar_agente_malicioso(objetivo_inicial)
-            resultados_raw['cti'] = cti_global
-            if tipo_inicial in allowed_vysion:
-                try:
-                    vysion_global = self.servicios['vysion'].analizar(objetivo_inicial)
-                    resultados_raw['vysion'] = vysion_global
-                except Exception as _:
-                    resultados_raw['vysion'] = {"exito": False, "error": "Vysion error"}
-        
-        # 5. Correlación Final
-        resultados_check = {'desglose': desglose_final}
-        correlaciones = self.correlador.correlacionar(resultados_check)
+        tareas = {}
+        if tipo not in ['image', 'document']:
+            cti = self._llamar('cti', tipo, self.servicios['cti'].verificar_agente_malicioso, objetivo)
+            tareas[asyncio.ensure_future(bajo_presupuesto(presupuesto, cti))] = 'cti'
+            if tipo in allowed_vysion:
+                vysion = self._llamar('vysion', tipo, self.servicios['vysion'].analizar, objetivo)
+                tareas[asyncio.ensure_future(bajo_presupuesto(presupuesto, vysion))] = 'vysion'
+        return tareas
+
+    def _guardar_nivel(self, lote: List[Dict[str, Any]], resultados_nivel: List[Dict[str, Any]], resultados_raw: Dict[str, Any]):
+        """Vuelca un nivel en resultados_raw en orden de descubrimiento (no de finalización): resultados estables entre ejecuciones."""
+        for item, resultado_item in zip(lote, resultados_nivel):
+            if item['profundidad'] == 0:
+                if item['tipo'] not in resultados_raw:
+                    resultados_raw[item['tipo']] = resultado_item
+            elif item['tipo'] == 'email':
+                resultados_raw['emails'].append(resultado_item)
+
+    def _item_cancelado(self, tipo: str, valor: str) -> Dict[str, Any]:
+        return {
+            "tipo": tipo, "input": valor, "exito": False, "datos": {},
+            "error": "Cancelado: plazo de investigación agotado", "cancelado": True
+        }
 
-        graph_data = GraphBuilder().build(resultados_raw, objetivo_inicial, tipo_inicial)
-        return resultados_raw, correlaciones, graph_data, tipo_inicial
+    def _registrar_global(self, nombre: str, tarea: asyncio.Future, resultados_raw: Dict[str, Any], grafo: GraphBuilder) -> Tuple[str, Any]:
+        try:
+            resultado = tarea.result()
+        except Exception as e:
+            resultado = {"exito": False, "error": "Vysion error" if nombre == 'vysion' else str(e)}
+        resultados_raw[nombre] = resultado
+        grafo.add_enriquecimiento(nombre, resultado)
+        return 'enriquecimiento', {"fuente": nombre, "resultado": resultado}
 
     async def _analizar_item(self, tipo: str, valor: str, es_archivo: bool = False) -> Dict[str, Any]:
         """Despacha al servicio correspondiente."""
         datos = {}
         exito = False
         error = None
+        # Recoge, por proveedor, si el resultado vino de caché y su antigüedad
+        meta_cache = {}
+        _meta_cache.set(meta_cache)
         
         try:
-            # Ejecutar servicio sincrónico en threadpool si es necesario
-            # Por simplicidad en este paso, asumimos llamadas directas rápidas o bloqueantes
+            # Cada llamada a proveedor pasa por la capa de ejecución: las corrutinas se esperan
+            # en el loop y las librerías síncronas se derivan al pool acotado (core.executor).
+            # Los proveedores de un mismo tipo son independientes y se lanzan a la vez (_fan_out):
+            # la latencia del item es la del proveedor más lento, no la suma.
             svc_res = None
             
             if tipo == 'ip':
-                ip_res = self.servicios['ip'].analizar(valor)
-                vt_res = self.servicios['virustotal'].analizar(valor, 'ip')
-                svc_res = {
-                    "exito": ip_res.get('exito', False) or vt_res.get('exito', False),
-                    "datos": {
-                        "ip_api": ip_res.get('datos', {}),
-                        "virustotal": vt_res.get('datos', {})
-                    },
-                    "error": ip_res.get('error') or vt_res.get('error')
-                }
+                svc_res = self._combinar(await self._fan_out({
+                    "ip_api": self._llamar('ip', tipo, self.servicios['ip'].analizar, valor),
+                    "virustotal": self._llamar('virustotal', tipo, self.servicios['virustotal'].analizar, valor, 'ip')
+                }))
             elif tipo == 'domain':
-                dom_res = self.servicios['domain'].analizar(valor)
-                vt_res = self.servicios['virustotal'].analizar(valor, 'domain')
-                svc_res = {
-                    "exito": dom_res.get('exito', False) or vt_res.get('exito', False),
-                    "datos": {
-                        "dominio": dom_res.get('datos', {}),
-                        "virustotal": vt_res.get('datos', {})
-                    },
-                    "error": dom_res.get('error') or vt_res.get('error')
-                }
+                svc_res = self._combinar(await self._fan_out({
+                    "dominio": self._llamar('domain', tipo, self.servicios['domain'].analizar, valor),
+                    "virustotal": self._llamar('virustotal', tipo, self.servicios['virustotal'].analizar, valor, 'domain')
+                }))
             elif tipo == 'url':
-                us_res = self.servicios['urlscan'].analizar(valor)
-                vt_res = self.servicios['virustotal'].analizar(valor, 'url')
-                svc_res = {
-                    "exito": us_res.get('exito', False) or vt_res.get('exito', False),
-                    "datos": {
-                        "urlscan": us_res.get('datos', {}),
-                        "virustotal": vt_res.get('datos', {})
-                    },
-                    "error": us_res.get('error') or vt_res.get('error')
-                }
+                svc_res = self._combinar(await self._fan_out({
+                    "urlscan": self._llamar('urlscan', tipo, self.servicios['urlscan'].analizar, valor),
+                    "virustotal": self._llamar('virustotal', tipo, self.servicios['virustotal'].analizar, valor, 'url')
+                }))
             elif tipo == 'email':
-                em_res = self.servicios['email'].analizar(valor)
+                em_res = await self._llamar('email', tipo, self.servicios['email'].analizar, valor)
                 svc_res = em_res
             elif tipo == 'user':
-                us_res = self.servicios['user'].analizar(valor)
-                dc_res = self.servicios['discord'].analizar_usuario(valor)
-                svc_res = {
-                    "exito": us_res.get('exito', False) or dc_res.get('exito', False),
-                    "datos": {
-                        "username": us_res.get('datos', {}),
-                        "discord": dc_res.get('datos', {})
-                    },
-                    "error": us_res.get('error') or dc_res.get('error')
-                }
+                svc_res = self._combinar(await self._fan_out({
+                    "username": self._llamar('user', tipo, self.servicios['user'].analizar, valor),
+                    "discord": self._llamar('discord', tipo, self.servicios['discord'].analizar_usuario, valor)
+                }))
             elif tipo == 'phone':
-                ph_res = self.servicios['phone'].analizar(valor)
+                ph_res = await self._llamar('phone', tipo, self.servicios['phone'].analizar, valor)
                 svc_res = ph_res
             elif tipo == 'discord':
                 # Solo usuario (ID o nombre). La invitación ya no se analiza.
                 if valor.isdigit():
-                    dc = self.servicios['discord'].analizar_usuario_id(valor)
+                    dc = await self._llamar('discord', tipo, self.servicios['discord'].analizar_usuario_id, valor)
                 else:
-                    dc = self.servicios['discord'].analizar_usuario(valor)
+                    dc = await self._llamar('discord', tipo, self.servicios['discord'].analizar_usuario, valor)
                 svc_res = dc
             elif tipo == 'wallet':
                 # Validación sintáctica de wallet y resumen de exposición OSINT (Vysion).
-                wl_res = self.servicios['wallet'].analizar(valor)
-                try:
-                    vy_res = self.servicios['vysion'].analizar(valor)
-                except Exception as _:
-                    vy_res = {"exito": False, "error": "Vysion error"}
+                res = await self._fan_out({
+                    "wallet": self._llamar('wallet', tipo, self.servicios['wallet'].analizar, valor),
+                    "vysion": self._llamar('vysion', tipo, self.servicios['vysion'].analizar, valor)
+                })
+                wl_res, vy_res = res["wallet"], res["vysion"]
                 datos_wl = wl_res.get('datos', {})
                 vy_datos = vy_res.get('datos', {}) if vy_res.get('exito') else {}
                 hits = vy_datos.get('hits', []) or []
                 leaks_total = (vy_datos.get('leaks', {}) or {}).get('total', 0)
                 menciones = len(hits)
                 # Riesgo de wallet: se eleva a ALTO si hay menciones vinculadas a ransomware conocidos.
-                riesgo = "BAJO"
-                try:
-                    RANS_KEYS = [
-                        "wannacry","lockbit","conti","revil","maze","darkside","blackcat","alphv",
-                        "clop","cl0p","babuk","netwalker","ryuk","avaddon","doppelpaymer","sodinokibi",
-                        "hive","black basta","egregor","ragnarok","royal","play","noescape"
-                    ]
-                    def _txt(v): 
-                        return str(v or "").lower()
-                    for h in hits:
-                        grp = _txt(h.get('ransomwareGroup'))
-                        title = _txt((h.get('page') or {}).get('pageTitle'))
-                        url = _txt(((h.get('page') or {}).get('url') or {}).get('url'))
-                        host = _txt(((h.get('page') or {}).get('url') or {}).get('domainName'))
-                        if any(k in grp for k in RANS_KEYS) or any(k in title for k in RANS_KEYS) or any(k in url for k in RANS_KEYS) or any(k in host for k in RANS_KEYS):
-                            riesgo = "ALTO"
-                            break
-                except:
-                    riesgo = "BAJO"
+                riesgo = "ALTO" if menciona_ransomware(hits) else "BAJO"
                 svc_res = {
                     "exito": wl_res.get('exito', False),
                     "datos": {
@@ -254,8 +407,8 @@ class AnalysisEngine:
                     "error": wl_res.get('error')
                 }
             elif tipo == 'company':
-                ia = AIIdentityAnalyst()
-                ia_res = ia.analizar_empresa(valor)
+                ia = self.servicios['ia']
+                ia_res = await self._llamar('ia', tipo, ia.analizar_empresa, valor)
                 svc_res = {
                     "exito": ("error" not in ia_res),
                     "datos": {
@@ -264,9 +417,12 @@ class AnalysisEngine:
                     "error": ia_res.get('error')
                 }
             elif tipo == 'image':
-                meta_res = self.servicios['image'].analizar(valor)
-                ia = AIIdentityAnalyst()
-                ia_res = ia.analizar_imagen(valor)
+                ia = self.servicios['ia']
+                res = await self._fan_out({
+                    "metadata": ejecutar(self.servicios['image'].analizar, valor),
+                    "ia": ejecutar(ia.analizar_imagen, valor)
+                })
+                meta_res, ia_res = res["metadata"], res["ia"]
                 svc_res = {
                     "exito": meta_res.get('exito', False) or ("error" not in ia_res),
                     "datos": {
@@ -276,23 +432,24 @@ class AnalysisEngine:
                     "error": meta_res.get('error')
                 }
             elif tipo == 'document':
-                md = ServicioMetadatos()
-                docx_res = {}
-                try:
-                    low = valor.lower()
-                    if low.endswith(".docx"):
-                        docx_res = md.analizar_docx(valor)
-                except: 
-                    docx_res = {}
-                gen_res = md.analizar_archivo(valor)
-                ia = AIIdentityAnalyst()
-                ia_res = ia.analizar_documento(valor)
+                md = self.servicios['document']
+                ia = self.servicios['ia']
+                tareas = {
+                    "archivo": ejecutar(md.analizar_archivo, valor),
+                    "ia": ejecutar(ia.analizar_documento, valor)
+                }
+                if valor.lower().endswith(".docx"):
+                    tareas["docx"] = ejecutar(md.analizar_docx, valor)
+                res = await self._fan_out(tareas)
+                gen_res, ia_res = res["archivo"], res["ia"]
+                docx_res = res.get("docx", {})
+                # VirusTotal depende del sha256 calculado por analizar_archivo, por eso va después
                 vt_file = {}
                 try:
                     if gen_res.get('exito') and gen_res.get('datos', {}).get('tipo_archivo') == 'exe':
                         sha256 = gen_res['datos'].get('sha256')
                         if sha256:
-                            vt_file = self.servicios['virustotal'].analizar(sha256, 'file')
+                            vt_file = await self._llamar('virustotal', tipo, self.servicios['virustotal'].analizar, sha256, 'file')
                 except: vt_file = {}
                 svc_res = {
                     "exito": (docx_res.get('exito', False) if docx_res else False) or gen_res.get('exito', False) or ("error" not in ia_res),
@@ -312,7 +469,8 @@ class AnalysisEngine:
                     "exito": svc_res.get('exito', False),
                     "datos": svc_res.get('datos', {}),
                     "error": svc_res.get('error'),
-                    "es_archivo": es_archivo
+                    "es_archivo": es_archivo,
+                    "cache": meta_cache
                 }
 
         except Exception as e:
@@ -320,22 +478,93 @@ class AnalysisEngine:
         
         return {"tipo": tipo, "input": valor, "exito": False, "error": error, "datos": {}}
 
+    async def _llamar(self, proveedor: str, tipo: str, func: Callable, valor: Any, *params: Any) -> Any:
+        """
+        Llamada a un proveedor a través de la caché TTL: clave (proveedor, indicador normalizado, parámetros).
+        Los errores se guardan como negativos con un TTL corto. El resultado indica si vino de caché y su edad.
+        Las llamadas concurrentes con la misma clave comparten una única consulta en vuelo (single-flight).
+        La consulta compartida corre bajo el presupuesto de todos los que la esperan (core.singleflight): el
+        plazo de quien la lanzó no recorta a los demás y sus llamadas externas se descuentan a los solicitantes.
+        """
+        ttl = ttl_para(proveedor)
+        clave = clave_cache(proveedor, normalizar_indicador(tipo, valor), func.__name__, *params)
+        if not ttl:
+            comprobar_presupuesto()
+            res, compartida = await self.vuelos.hacer(
+                clave, lambda: self._ejecutar_proveedor(proveedor, func, valor, *params), presupuesto_actual())
+            # Cada solicitante recibe su copia: los consumidores mutan los resultados
+            return copy.deepcopy(res) if compartida else res
+        en_cache = await self.cache.obtener_async(clave)
+        if en_cache is not None:
+            res, edad = en_cache
+            info = {"hit": True, "edad_segundos": round(edad, 1)}
+        else:
+            # Sin presupuesto no se lanza la consulta (los aciertos de caché siguen sirviéndose)
+            comprobar_presupuesto()
+            res, compartida = await self.vuelos.hacer(
+                clave, lambda: self._consultar(proveedor, clave, func, valor, *params), presupuesto_actual())
+            info = {"hit": False, "edad_segundos": 0.0}
+            if compartida:
+                res = copy.deepcopy(res)
+                info["compartida"] = True
+        meta = _meta_cache.get()
+        if meta is not None:
+            meta[proveedor] = info
+        if isinstance(res, dict):
+            res = {**res, "cache": info}
+        return res
+
+    async def _consultar(self, proveedor: str, clave: str, func: Callable, valor: Any, *params: Any) -> Any:
+        """
+        Consulta real al proveedor tras un fallo de caché; guarda el resultado antes de liberar a los que esperan.
+        No se cachea nada que dependa del plazo o del cupo y no del indicador: PresupuestoAgotado (y
+        LimiteTasaExcedido) se propagan, y los resultados marcados 'parcial' o obtenidos con algún rechazo
+        del presupuesto de la consulta (errores que el servicio capturó) se devuelven sin guardar.
+        """
+        presupuesto = presupuesto_actual()
+        try:
+            res = await self._ejecutar_proveedor(proveedor, func, valor, *params)
+        except PresupuestoAgotado:
+            raise
+        except Exception as e:
+            res = {"exito": False, "error": str(e)}
+        recortado = presupuesto is not None and (presupuesto.agotado or presupuesto.rechazos > 0)
+        if recortado or (isinstance(res, dict) and res.get('parcial')):
+            return res
+        negativo = es_negativo(res)
+        # Los negativos solo viven en memoria; los aciertos también se persisten en disco
+        await self.cache.guardar_async(clave, res, ttl_para(proveedor, negativo=negativo), persistir=not negativo)
+        return res
+
+    async def _ejecutar_proveedor(self, proveedor: str, func: Callable, valor: Any, *params: Any) -> Any:
+        """
+        Las funciones síncronas de proveedores con cuota esperan su turno aquí, en el event loop, antes de
+        ocupar un hilo del pool (core.rate_limit.turno_anticipado); las corrutinas esperan el suyo en http_client.
+        """
+        nombre = None if inspect.iscoroutinefunction(func) else LIMITADOR_POR_PROVEEDOR.get(proveedor)
+        async with turno_anticipado(nombre):
+            return await ejecutar(func, valor, *params)
+
+    async def _fan_out(self, tareas: Dict[str, Awaitable]) -> Dict[str, Dict[str, Any]]:
+        """Ejecuta en paralelo las llamadas independientes de un item y devuelve sus resultados por nombre."""
+        nombres = list(tareas)
+        resultados = await asyncio.gather(*tareas.values(), return_exceptions=True)
+        salida = {}
+        for nombre, res in zip(nombres, resultados):
+            # Un proveedor que falla no invalida al resto del item
+            if isinstance(res, BaseException):
+                res = {"exito": False, "error": str(res) or type(res).__name__}
+            salida[nombre] = res
+        return salida
+
+    def _combinar(self, resultados: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Fusiona resultados {exito, datos, error} en la forma habitual: datos anidados por proveedor."""
+        return {
+            "exito": any(r.get('exito', False) for r in resultados.values()),
+            "datos": {nombre: r.get('datos', {}) for nombre, r in resultados.items()},
+            "error": next((r.get('error') for r in resultados.values() if r.get('error')), None)
+        }
+
     def _extraer_nuevos_objetivos(self, resultado_item: Dict) -> List[Dict]:
-        """Extrae nuevos pivots del resultado de un análisis."""
-        nuevos = []
-        datos = resultado_item.get('datos', {})
-        tipo = resultado_item.get('tipo')
-        
-        # Logic to extract from 'datos' based on known structure
-        # E.g. extracted emails from domain analysis
-        if tipo == 'domain':
-            for email in datos.get('correos_relacionados', []):
-                nuevos.append({'tipo': 'email', 'valor': email})
-        if tipo == 'user':
-            usr = datos.get('username', {})
-            vip = usr.get('vysion_im_profiles', {})
-            for h in vip.get('hits', []):
-                for e in h.get('email', []):
-                    nuevos.append({'tipo': 'email', 'valor': e})
-        
-        return nuevos
+        """Extrae nuevos pivots del resultado de un análisis (reglas declaradas en core.pivots)."""
+        return self.pivots.extraer(resultado_item)
@@ -0,0 +1,150 @@
+import ipaddress
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from backend_api.core.cache import normalizar_indicador
+
+
+class ExtractorPivot:
+    """
+    Regla de pivot declarativa: de los items de tipo_entrada, lee los valores en ruta y los propone como tipo_salida.
+    La ruta usa puntos para entrar en diccionarios y '[]' para recorrer listas,
+    p.ej. 'username.vysion_im_profiles.hits[].email[]'. Se compila una sola vez al registrarla.
+    """
+    def __init__(self, nombre: str, tipo_entrada: str, ruta: str, tipo_salida: str, fuente: Optional[str] = None):
+        self.nombre = nombre
+        self.tipo_entrada = tipo_entrada
+        self.ruta = ruta
+        self.tipo_salida = tipo_salida
+        self.fuente = fuente or nombre
+        self._pasos = self._compilar(ruta)
+
+    @staticmethod
+    def _compilar(ruta: str) -> Tuple[Tuple[str, bool], ...]:
+        pasos = []
+        for segmento in ruta.split('.'):
+            es_lista = segmento.endswith('[]')
+            pasos.append((segmento[:-2] if es_lista else segmento, es_lista))
+        return tuple(pasos)
+
+    def valores(self, datos: Any) -> Iterator[Any]:
+        actuales = [datos]
+        for clave, es_lista in self._pasos:
+            siguientes = []
+            for actual in actuales:
+                if not isinstance(actual, dict):
+                    continue
+                valor = actual.get(clave)
+                if valor is None:
+                    continue
+                if es_lista:
+                    if isinstance(valor, (list, tuple, set)):
+                        siguientes.extend(valor)
+                else:
+                    siguientes.append(valor)
+            actuales = siguientes
+        return iter(actuales)
+
+
+# --- Normalización y validación por tipo de pivot (una sola vez, en el registro) ---
+
+_EMAIL = re.compile(r'^[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}$')
+_DOMINIO = re.compile(r'^(?=.{4,253}$)([a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}$')
+_WALLET = re.compile(r'^(?:(?:bc1|[13])[a-zA-HJ-NP-Z0-9]{25,59}|0x[a-fA-F0-9]{40})$')
+
+
+def _email(v: str) -> Optional[str]:
+    v = normalizar_indicador('email', v)
+    return v if _EMAIL.match(v) else None
+
+
+def _dominio(v: str) -> Optional[str]:
+    v = normalizar_indicador('domain', v)
+    if v.startswith('*.'):
+        v = v[2:]
+    return v if _DOMINIO.match(v) else None
+
+
+def _ip(v: str) -> Optional[str]:
+    try:
+        ip = ipaddress.ip_address(str(v).strip())
+    except ValueError:
+        return None
+    # Las IPs privadas o reservadas no aportan nada fuera de la red del objetivo
+    return str(ip) if ip.is_global else None
+
+
+def _telefono(v: str) -> Optional[str]:
+    limpio = re.sub(r'[^0-9+]', '', str(v))
+    digitos = limpio.lstrip('+')
+    return limpio if 7 <= len(digitos) <= 15 and digitos.isdigit() else None
+
+
+def _wallet(v: str) -> Optional[str]:
+    v = str(v).strip()
+    return v if _WALLET.match(v) else None
+
+
+NORMALIZADORES: Dict[str, Callable[[str], Optional[str]]] = {
+    'email': _email,
+    'domain': _dominio,
+    'ip': _ip,
+    'phone': _telefono,
+    'wallet': _wallet
+}
+
+
+class RegistroPivots:
+    """
+    Registro de extractores de pivots compilado en una tabla de despacho por tipo de item:
+    extraer() solo evalúa las reglas del tipo del item, normaliza cada valor y deduplica el resultado.
+    """
+    def __init__(self, extractores: Optional[List[ExtractorPivot]] = None):
+        self._por_tipo: Dict[str, List[ExtractorPivot]] = {}
+        for e in extractores or []:
+            self.registrar(e)
+
+    def registrar(self, extractor: ExtractorPivot):
+        self._por_tipo.setdefault(extractor.tipo_entrada, []).append(extractor)
+
+    def extractores(self) -> Dict[str, List[str]]:
+        return {tipo: [e.nombre for e in lista] for tipo, lista in self._por_tipo.items()}
+
+    def extraer(self, resultado_item: Dict[str, Any]) -> List[Dict[str, str]]:
+        extractores = self._por_tipo.get(resultado_item.get('tipo'))
+        if not extractores:
+            return []
+        datos = resultado_item.get('datos') or {}
+        origen = (resultado_item.get('tipo'), normalizar_indicador(resultado_item.get('tipo'), resultado_item.get('input')))
+        nuevos, vistos = [], {origen}
+        for e in extractores:
+            normalizar = NORMALIZADORES.get(e.tipo_salida, lambda v: str(v).strip() or None)
+            for valor in e.valores(datos):
+                if not isinstance(valor, (str, int)):
+                    continue
+                valor = normalizar(str(valor))
+                if not valor or (e.tipo_salida, valor) in vistos:
+                    continue
+                vistos.add((e.tipo_salida, valor))
+                nuevos.append({'tipo': e.tipo_salida, 'valor': valor, 'fuente': e.fuente})
+        return nuevos
+
+
+def crear_registro_por_defecto() -> RegistroPivots:
+    """Reglas de pivot sobre las estructuras que devuelven los servicios (datos anidados por proveedor)."""
+    return RegistroPivots([
+        # Dominio
+        ExtractorPivot('correos_dominio', 'domain', 'dominio.correos_relacionados[]', 'email', 'correos_relacionados'),
+        ExtractorPivot('subdominios', 'domain', 'dominio.subdominios[]', 'domain', 'subdominios'),
+        ExtractorPivot('telefonos_homepage', 'domain', 'dominio.telefonos_relacionados[]', 'phone', 'homepage'),
+        ExtractorPivot('ip_dominio', 'domain', 'dominio.ip_asociada', 'ip', 'dns'),
+        # URL (urlscan)
+        ExtractorPivot('ip_urlscan', 'url', 'urlscan.resultado.ip', 'ip', 'urlscan'),
+        ExtractorPivot('dominio_urlscan', 'url', 'urlscan.resultado.dominio', 'domain', 'urlscan'),
+        # Usuario (perfiles de mensajería y filtraciones de Vysion)
+        ExtractorPivot('emails_im', 'user', 'username.vysion_im_profiles.hits[].email[]', 'email', 'vysion_im_profiles'),
+        ExtractorPivot('btc_im', 'user', 'username.vysion_im_profiles.hits[].bitcoin_address[]', 'wallet', 'vysion_im_profiles'),
+        ExtractorPivot('eth_im', 'user', 'username.vysion_im_profiles.hits[].ethereum_address[]', 'wallet', 'vysion_im_profiles'),
+        ExtractorPivot('whatsapp_im', 'user', 'username.vysion_im_profiles.hits[].whatsapp[]', 'phone', 'vysion_im_profiles'),
+        ExtractorPivot('emails_leaks', 'user', 'username.vysion_alias_leaks.hits[].detectedInfo.emails[]', 'email', 'vysion_leaks'),
+    ])
@@ -0,0 +1,168 @@
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+from backend_api.core.config import settings
+from backend_api.core.budget import PresupuestoAgotado, presupuesto_actual
+
+
+class LimiteTasaExcedido(PresupuestoAgotado):
+    """El turno del limitador llega después del plazo disponible: la llamada se rechaza sin esperar."""
+
+
+class LimitadorTasa:
+    """
+    Token bucket por proveedor (variante por reservas / GCRA).
+    Cada llamada reserva su turno de forma atómica (orden FIFO de llegada) y espera fuera del candado.
+    Antes de reservar se comprueba que la espera cabe en el plazo que queda (presupuesto en curso o
+    RATE_LIMIT_MAX_WAIT); si no cabe se rechaza al momento. Un turno reservado que no llega a usarse
+    (cancelación o error antes de enviar) se devuelve.
+    Las esperas largas se hacen en el event loop (adquirir / turno_anticipado); desde los hilos del pool
+    solo se espera como mucho RATE_LIMIT_MAX_SYNC_WAIT.
+    """
+    def __init__(self, nombre: str, por_minuto: float, rafaga: int = 1, reloj: Callable[[], float] = time.monotonic):
+        self.nombre = nombre
+        self.reloj = reloj
+        self.intervalo = 60.0 / max(por_minuto, 0.001)
+        self.rafaga = max(1, int(rafaga))
+        self._tat = 0.0 # Instante teórico de la próxima llegada
+        self._lock = threading.Lock()
+
+    def _reservar(self, max_espera: float) -> float:
+        """Reserva un token y devuelve cuántos segundos hay que esperar para usarlo (sin reservar si no cabe)."""
+        with self._lock:
+            ahora = self.reloj()
+            tat = max(self._tat, ahora)
+            espera = max(0.0, tat - (self.rafaga - 1) * self.intervalo - ahora)
+            if espera > max_espera:
+                raise LimiteTasaExcedido(
+                    f"Límite de tasa de {self.nombre}: turno en {espera:.0f}s, plazo disponible {max(max_espera, 0):.0f}s"
+                )
+            self._tat = tat + self.intervalo
+            return espera
+
+    def devolver(self):
+        """Libera un turno reservado que no se ha usado."""
+        with self._lock:
+            self._tat -= self.intervalo
+
+    def _turno(self, tope: float) -> float:
+        p = presupuesto_actual()
+        if p is not None:
+            p.comprobar()
+            tope = min(tope, p.restante())
+        try:
+            return self._reservar(tope)
+        except LimiteTasaExcedido:
+            if p is not None:
+                p.registrar_rechazo()
+            raise
+
+    async def adquirir(self):
+        espera = self._turno(settings.RATE_LIMIT_MAX_WAIT)
+        if espera > 0:
+            try:
+                await asyncio.sleep(espera)
+            except BaseException:
+                self.devolver()
+                raise
+
+    def adquirir_sync(self):
+        # Solo desde hilos del pool: nunca desde el event loop
+        if _usar_credito(self.nombre):
+            return
+        espera = self._turno(settings.RATE_LIMIT_MAX_SYNC_WAIT)
+        if espera > 0:
+            time.sleep(espera)
+
+
+# Turnos ya esperados en el loop para la llamada síncrona que sigue (nombre del limitador -> turnos)
+_creditos: contextvars.ContextVar = contextvars.ContextVar("creditos_limitador", default=None)
+_lock_creditos = threading.Lock()
+
+
+def _usar_credito(nombre: str) -> bool:
+    creditos = _creditos.get()
+    if not creditos:
+        return False
+    with _lock_creditos:
+        if creditos.get(nombre, 0) > 0:
+            creditos[nombre] -= 1
+            return True
+    return False
+
+
+@asynccontextmanager
+async def turno_anticipado(nombre: Optional[str]):
+    """
+    Espera en el event loop el turno del limitador 'nombre' y lo deja como crédito para la función
+    síncrona que se ejecuta dentro del bloque (el contexto se copia al hilo del pool): su primera
+    petición al proveedor no espera en el hilo. Si el bloque termina sin usarlo, el turno se devuelve.
+    """
+    if nombre is None:
+        yield
+        return
+    lim = obtener_limitador(nombre)
+    await lim.adquirir()
+    creditos = _creditos.get()
+    if creditos is None:
+        creditos = {}
+        _creditos.set(creditos)
+    with _lock_creditos:
+        creditos[nombre] = creditos.get(nombre, 0) + 1
+    try:
+        yield
+    finally:
+        if _usar_credito(nombre):
+            lim.devolver()
+
+
+# Host -> proveedor, para aplicar el limitador automáticamente en core.http_client
+PROVEEDOR_POR_HOST = {
+    "generativelanguage.googleapis.com": "gemini",
+    "www.virustotal.com": "virustotal",
+    "haveibeenpwned.com": "hibp",
+    "api.abuseipdb.com": "abuseipdb",
+    "urlscan.io": "urlscan",
+    "crt.sh": "crtsh",
+    "api.vysion.ai": "vysion"
+}
+
+# Proveedor del motor (AnalysisEngine._llamar) -> limitador de su primera petición con cuota
+LIMITADOR_POR_PROVEEDOR = {
+    "virustotal": "virustotal",
+    "urlscan": "urlscan",
+    "ip": "abuseipdb",
+    "domain": "crtsh",
+    "vysion": "vysion",
+    "ia": "gemini"
+}
+
+_limitadores: Dict[str, LimitadorTasa] = {}
+_lock_registro = threading.Lock()
+
+
+def _config_proveedor(nombre: str):
+    clave = nombre.upper()
+    por_minuto = getattr(settings, f"RATE_LIMIT_{clave}_PER_MIN")
+    rafaga = getattr(settings, f"RATE_LIMIT_{clave}_BURST")
+    return por_minuto, rafaga
+
+
+def obtener_limitador(nombre: str) -> LimitadorTasa:
+    lim = _limitadores.get(nombre)
+    if lim is None:
+        with _lock_registro:
+            lim = _limitadores.get(nombre)
+            if lim is None:
+                por_minuto, rafaga = _config_proveedor(nombre)
+                lim = _limitadores[nombre] = LimitadorTasa(nombre, por_minuto, rafaga)
+    return lim
+
+
+def limitador_para_host(host: str) -> Optional[LimitadorTasa]:
+    nombre = PROVEEDOR_POR_HOST.get(host)
+    return obtener_limitador(nombre) if nombre else None
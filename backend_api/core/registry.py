@@ -0,0 +1,56 @@
+from typing import Dict, Any
+from fastapi import Request
+
+from backend_api.core.ai_client import AIIdentityAnalyst
+
+# Servicios
+from backend_api.services.osint_ip import ServicioIP
+from backend_api.services.osint_domain import ServicioDominio
+from backend_api.services.osint_email import ServicioEmail
+from backend_api.services.osint_username import ServicioUsuario
+from backend_api.services.osint_phone import ServicioTelefono
+from backend_api.services.osint_image import ServicioImagen
+from backend_api.services.osint_metadata import ServicioMetadatos
+from backend_api.services.osint_discord import ServicioDiscord
+from backend_api.services.osint_wallet import ServicioWallet
+from backend_api.services.cti_feeds import ServicioCTI
+from backend_api.services.osint_vysion import ServicioVysion
+from backend_api.services.osint_urlscan import ServicioUrlscan
+from backend_api.services.osint_virustotal import ServicioVirusTotal
+
+
+def construir_servicios() -> Dict[str, Any]:
+    """
+    Registro de servicios OSINT de la aplicación.
+    Se construye una sola vez en el arranque (clientes Vysion, cabeceras, claves...) y se comparte entre peticiones.
+    """
+    return {
+        'ip': ServicioIP(),
+        'domain': ServicioDominio(),
+        'email': ServicioEmail(),
+        'user': ServicioUsuario(),
+        'phone': ServicioTelefono(),
+        'image': ServicioImagen(),
+        'document': ServicioMetadatos(),
+        'discord': ServicioDiscord(),
+        'wallet': ServicioWallet(),
+        'cti': ServicioCTI(),
+        'vysion': ServicioVysion(),
+        'urlscan': ServicioUrlscan(),
+        'virustotal': ServicioVirusTotal(),
+        'ia': AIIdentityAnalyst()
+    }
+
+
+# --- Dependencias FastAPI (instancias creadas en el lifespan de main.py) ---
+
+def get_engine(request: Request):
+    return request.app.state.engine
+
+
+def get_servicios(request: Request) -> Dict[str, Any]:
+    return request.app.state.servicios
+
+
+def get_trabajos(request: Request):
+    return request.app.state.trabajos
@@ -0,0 +1,36 @@
+from typing import Dict, Any, List
+
+# Grupos de ransomware conocidos: una mención en Vysion eleva el riesgo
+RANS_KEYS = [
+    "wannacry","lockbit","conti","revil","maze","darkside","blackcat","alphv",
+    "clop","cl0p","babuk","netwalker","ryuk","avaddon","doppelpaymer","sodinokibi",
+    "hive","black basta","egregor","ragnarok","royal","play","noescape"
+]
+
+
+def menciona_ransomware(hits: List[Dict[str, Any]]) -> bool:
+    """True si algún hit de Vysion (grupo, título, URL o host) menciona un grupo de ransomware conocido."""
+    def _txt(x): return str(x or "").lower()
+    try:
+        for h in hits or []:
+            grp = _txt(h.get('ransomwareGroup'))
+            title = _txt((h.get('page') or {}).get('pageTitle'))
+            url = _txt(((h.get('page') or {}).get('url') or {}).get('url'))
+            host = _txt(((h.get('page') or {}).get('url') or {}).get('domainName'))
+            if any(k in grp for k in RANS_KEYS) or any(k in title for k in RANS_KEYS) or any(k in url for k in RANS_KEYS) or any(k in host for k in RANS_KEYS):
+                return True
+    except:
+        return False
+    return False
+
+
+def calcular_riesgo(resultados: Dict[str, Any], correlaciones: List[Dict[str, Any]]) -> str:
+    """Riesgo global: correlaciones críticas + menciones de ransomware (Vysion)."""
+    critical_count = sum(1 for c in correlaciones if c.get('nivel') in ['Alta', 'Crítica'])
+    v = (resultados.get('vysion') or {}).get('datos', {}) or {}
+    ransom_flag = menciona_ransomware(v.get('hits', []) or [])
+    if critical_count > 0 or ransom_flag:
+        return "ALTO"
+    if len(correlaciones) > 5:
+        return "MEDIO"
+    return "BAJO"
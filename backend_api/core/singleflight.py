@@ -0,0 +1,73 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from backend_api.core.budget import Presupuesto, PresupuestoCompartido, bajo_presupuesto
+
+
+class _Vuelo:
+    def __init__(self, tarea: asyncio.Task, presupuesto: PresupuestoCompartido):
+        self.tarea = tarea
+        self.presupuesto = presupuesto
+        self.esperando = 0
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes idénticas: mientras una consulta (proveedor, indicador) está en vuelo,
+    las peticiones con la misma clave esperan ese mismo resultado en lugar de repetir la llamada externa.
+    La tarea compartida va protegida con asyncio.shield: si un solicitante se cancela, el resto sigue
+    esperando; cuando se va el último, se cancela la consulta.
+    Corre bajo un PresupuestoCompartido con el plazo y el cupo de quienes la esperan.
+    Pensado para usarse desde un único event loop (el de la aplicación).
+    """
+    def __init__(self):
+        self._en_vuelo: Dict[str, _Vuelo] = {}
+        self._lanzadas = 0
+        self._compartidas = 0
+
+    async def hacer(self, clave: str, fabrica: Callable[[], Awaitable[Any]],
+                    presupuesto: Optional[Presupuesto] = None) -> Tuple[Any, bool]:
+        """
+        Devuelve (resultado, compartida): compartida=True si se reutilizó una llamada ya en curso.
+        presupuesto es el del solicitante (None si no corre dentro de una investigación).
+        """
+        vuelo = self._en_vuelo.get(clave)
+        compartida = vuelo is not None
+        if compartida:
+            self._compartidas += 1
+        else:
+            self._lanzadas += 1
+            compartido = PresupuestoCompartido()
+            vuelo = _Vuelo(asyncio.ensure_future(self._lanzar(compartido, fabrica)), compartido)
+            self._en_vuelo[clave] = vuelo
+            vuelo.tarea.add_done_callback(lambda t: self._liberar(clave, t))
+        vuelo.esperando += 1
+        vuelo.presupuesto.unir(presupuesto)
+        try:
+            return await asyncio.shield(vuelo.tarea), compartida
+        finally:
+            vuelo.esperando -= 1
+            vuelo.presupuesto.separar(presupuesto)
+            if not vuelo.esperando and not vuelo.tarea.done():
+                # Nadie espera ya el resultado (plazos vencidos, clientes desconectados)
+                vuelo.tarea.cancel()
+
+    @staticmethod
+    async def _lanzar(compartido: PresupuestoCompartido, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        # La tarea se crea con una copia del contexto del primer solicitante: se sustituye su presupuesto
+        return await bajo_presupuesto(compartido, fabrica())
+
+    def _liberar(self, clave: str, tarea: asyncio.Task):
+        vuelo = self._en_vuelo.get(clave)
+        if vuelo is not None and vuelo.tarea is tarea:
+            del self._en_vuelo[clave]
+        # Evita el aviso "exception was never retrieved" si todos los solicitantes se cancelaron
+        if not tarea.cancelled():
+            tarea.exception()
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {
+            "en_vuelo": len(self._en_vuelo),
+            "lanzadas": self._lanzadas,
+            "compartidas": self._compartidas
+        }
@@ -1,13 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend_api.core.config import settings
+from backend_api.core import http_client
+from backend_api.core.executor import cerrar_pool
+from backend_api.core.orchestrator import AnalysisEngine
+from backend_api.core.registry import construir_servicios
+from backend_api.core.cache import crear_cache
+from backend_api.core.jobs import ColaInvestigaciones
 from backend_api.routers import health, search, ai
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Arranque: motor y registro de servicios de ámbito aplicación, compartidos por todas las peticiones
+    app.state.servicios = construir_servicios()
+    app.state.cache = crear_cache()
+    app.state.engine = AnalysisEngine(servicios=app.state.servicios, cache=app.state.cache)
+    app.state.trabajos = ColaInvestigaciones(app.state.engine)
+    await app.state.trabajos.iniciar()
+    yield
+    await app.state.trabajos.detener()
+    # Apagado: liberar pools de conexiones HTTP y de hilos de proveedores
+    await http_client.cerrar()
+    cerrar_pool()
+    if app.state.cache.persistente is not None:
+        app.state.cache.persistente.cerrar()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS Configuration
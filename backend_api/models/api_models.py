@@ -16,6 +16,35 @@ class SearchResponse(BaseModel):
     data: Dict[str, Any]
     correlaciones: List[Dict[str, Any]]
     geopuntos: List[Dict[str, Any]] = []
+    # True si se agotó el presupuesto de la investigación (plazo o llamadas) y el resultado está incompleto
+    parcial: bool = False
+    motivo_parcial: Optional[str] = None
+
+class BulkSearchRequest(BaseModel):
+    indicadores: List[str] = Field([], description="Lista de indicadores (IOCs)")
+    texto: Optional[str] = Field(None, description="Texto libre (ticket, informe...) del que extraer indicadores")
+
+class JobSubmitRequest(BaseModel):
+    objetivo: str = Field(..., description="El objetivo a analizar (IP, Dominio, Usuario, etc)")
+    tipo: Optional[str] = Field(None, description="Tipo de objetivo: ip, domain, email, user, phone, etc")
+    max_depth: int = Field(2, ge=0, le=3, description="Profundidad de pivots")
+
+class JobSubmitResponse(BaseModel):
+    search_id: str
+    estado: str
+    en_cola: int
+
+class JobStatusResponse(BaseModel):
+    search_id: str
+    estado: str
+    query: str
+    detected_type: str
+    creado: datetime
+    iniciado: Optional[datetime] = None
+    terminado: Optional[datetime] = None
+    items_completados: int = 0
+    correlaciones: int = 0
+    error: Optional[str] = None
 
 class AIAnalysisRequest(BaseModel):
     prompt: str
@@ -1,19 +1,23 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from backend_api.models.api_models import AIAnalysisRequest, AIAnalysisResponse, AIChatRequest, AIChatResponse
-from backend_api.core.ai_client import AIIdentityAnalyst
+from backend_api.core.registry import get_servicios
+from backend_api.core.executor import ejecutar_sync
+from backend_api.core.rate_limit import LIMITADOR_POR_PROVEEDOR, LimiteTasaExcedido, turno_anticipado
 import json
 
 router = APIRouter(prefix="/api/v1/ai", tags=["AI"])
 
 @router.post("/analyze", response_model=AIAnalysisResponse)
-async def analyze_with_ai(request: AIAnalysisRequest):
+async def analyze_with_ai(request: AIAnalysisRequest, servicios: dict = Depends(get_servicios)):
     try:
         # Genera un informe global a partir del contexto OSINT agregado
-        analyst = AIIdentityAnalyst()
+        analyst = servicios['ia']
         if "osint_data" in request.context:
             osint = request.context["osint_data"] or {}
             resumen = build_osint_summary(osint)
-            result = analyst.analizar_global(resumen)
+            # El turno de Gemini se espera aquí, en el event loop, antes de ocupar un hilo del pool
+            async with turno_anticipado(LIMITADOR_POR_PROVEEDOR['ia']):
+                result = await ejecutar_sync(analyst.analizar_global, resumen)
             return AIAnalysisResponse(
                 exito=("error" not in result),
                 analisis=json.dumps(result, ensure_ascii=False),
@@ -21,6 +25,8 @@ async def analyze_with_ai(request: AIAnalysisRequest):
             )
         return AIAnalysisResponse(exito=False, analisis="Contexto insuficiente", riesgo="N/A")
 
+    except LimiteTasaExcedido as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -55,16 +61,19 @@ def build_osint_summary(data: dict) -> str:
     return "\n".join(parts)
 
 @router.post("/chat", response_model=AIChatResponse)
-async def chat_with_ai(request: AIChatRequest):
+async def chat_with_ai(request: AIChatRequest, servicios: dict = Depends(get_servicios)):
     try:
         # Chat contextual: la IA responde usando los resultados de la búsqueda actual
-        analyst = AIIdentityAnalyst()
+        analyst = servicios['ia']
         contexto = request.context or {}
         pregunta = request.question
-        res = analyst.chatear(contexto, pregunta)
+        async with turno_anticipado(LIMITADOR_POR_PROVEEDOR['ia']):
+            res = await ejecutar_sync(analyst.chatear, contexto, pregunta)
         if isinstance(res, dict) and "respuesta" in res:
             return AIChatResponse(exito=True, respuesta=str(res["respuesta"]))
         # Fallback: convertir a texto cualquier respuesta tipo JSON
         return AIChatResponse(exito=True, respuesta=json.dumps(res, ensure_ascii=False))
+    except LimiteTasaExcedido as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
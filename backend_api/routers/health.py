@@ -1,7 +1,21 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from backend_api.core.dns_resolver import obtener_resolutor
 
 router = APIRouter()
 
 @router.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@router.get("/health/cache")
+def cache_stats(request: Request):
+    # Contadores de aciertos/fallos de la caché de proveedores y de consultas compartidas (single-flight)
+    stats = request.app.state.cache.estadisticas()
+    stats["single_flight"] = request.app.state.engine.vuelos.estadisticas()
+    stats["dns"] = obtener_resolutor().estadisticas()
+    return stats
+
+@router.get("/health/correlation")
+def correlation_profile(request: Request):
+    # Perfil de evaluación de las reglas de correlación (evaluaciones, disparos y tiempo por regla)
+    return request.app.state.engine.correlador.perfil()
@@ -1,83 +1,72 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, UploadFile, File, Form
-from backend_api.models.api_models import SearchRequest, SearchResponse, CheckURLRequest, CheckURLResponse
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, UploadFile, File, Form, Request, Query
+from fastapi.responses import StreamingResponse
+from backend_api.models.api_models import (
+    SearchRequest, SearchResponse, CheckURLRequest, CheckURLResponse, BulkSearchRequest,
+    JobSubmitRequest, JobSubmitResponse, JobStatusResponse
+)
 from backend_api.core.orchestrator import AnalysisEngine
-from backend_api.services.osint_urlscan import ServicioUrlscan
+from backend_api.core.executor import ejecutar_sync
+from backend_api.core import http_client
+from backend_api.core.registry import get_engine, get_servicios, get_trabajos
+from backend_api.core.jobs import ColaInvestigaciones, ColaLlena, LimiteUsuario
+from backend_api.core.risk import calcular_riesgo
+from backend_api.core.extractor import ExtractorIdentificadores
+from backend_api.core.cache import normalizar_indicador
+from backend_api.core.config import settings
+from typing import Any, Dict, List, Optional
+import json
+import re
 import uuid
 from datetime import datetime
-import requests
 import tempfile
 import os
 
 router = APIRouter(prefix="/api/v1/search", tags=["Search"])
 
+def _resolver_tipo(objetivo: str, tipo: Optional[str]) -> str:
+    """Detección/normalización de tipo si no llega (heurística simple)."""
+    if tipo == "crypto":
+        tipo = "wallet"  # Normalización de 'crypto' -> 'wallet'
+    elif tipo in ["username", "alias", "usuario", "user/alias", "user_alias"]:
+        tipo = "user"  # Normalización de variantes -> 'user'
+    if not tipo:
+        objetivo = (objetivo or "").strip()
+        objetivo_lower = objetivo.lower().strip()
+        objetivo_lower = objetivo_lower.rstrip("/")
+        if objetivo_lower.startswith("www."):
+            objetivo_lower = objetivo_lower[4:]
+        tipo = "user"
+        if "@" in objetivo:
+            tipo = "email"
+        elif objetivo_lower.startswith("http://") or objetivo_lower.startswith("https://"):
+            tipo = "url"
+        else:
+            ipv4_regex = r"^(?:\d{1,3}\.){3}\d{1,3}$"
+            domain_regex = r"^[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}$"
+            phone_regex = r"^\+?\d{7,15}$"
+            if re.match(ipv4_regex, objetivo_lower):
+                tipo = "ip"
+            elif re.match(domain_regex, objetivo_lower):
+                tipo = "domain"
+            elif re.match(phone_regex, objetivo_lower.replace(" ", "").replace("-", "")):
+                tipo = "phone"
+    return tipo
+
 @router.post("/", response_model=SearchResponse)
-async def perform_search(request: SearchRequest):
+async def perform_search(request: SearchRequest, engine: AnalysisEngine = Depends(get_engine)):
     try:
-        engine = AnalysisEngine(max_depth=2) # Profundidad de pivots configurable
         search_id = str(uuid.uuid4())
-        
-        # Detección/normalización de tipo si no llega (heurística simple)
-        tipo = request.tipo
-        if tipo == "crypto":
-            tipo = "wallet"  # Normalización de 'crypto' -> 'wallet'
-        elif tipo in ["username", "alias", "usuario", "user/alias", "user_alias"]:
-            tipo = "user"  # Normalización de variantes -> 'user'
-        if not tipo:
-            objetivo = (request.objetivo or "").strip()
-            objetivo_lower = objetivo.lower().strip()
-            objetivo_lower = objetivo_lower.rstrip("/")
-            if objetivo_lower.startswith("www."):
-                objetivo_lower = objetivo_lower[4:]
-            tipo = "user"
-            if "@" in objetivo:
-                tipo = "email"
-            elif objetivo_lower.startswith("http://") or objetivo_lower.startswith("https://"):
-                tipo = "url"
-            else:
-                import re
-                ipv4_regex = r"^(?:\d{1,3}\.){3}\d{1,3}$"
-                domain_regex = r"^[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}$"
-                phone_regex = r"^\+?\d{7,15}$"
-                if re.match(ipv4_regex, objetivo_lower):
-                    tipo = "ip"
-                elif re.match(domain_regex, objetivo_lower):
-                    tipo = "domain"
-                elif re.match(phone_regex, objetivo_lower.replace(" ", "").replace("-", "")):
-                    tipo = "phone"
+        tipo = _resolver_tipo(request.objetivo, request.tipo)
             
         resultados, correlaciones, graph_data, tipo_detectado = await engine.run_analysis(
             objetivo_inicial=request.objetivo,
-            tipo_inicial=tipo
+            tipo_inicial=tipo,
+            max_depth=2, # Profundidad de pivots configurable
+            search_id=search_id
         )
         
         # Cálculo de riesgo global: correlaciones críticas + menciones de ransomware (Vysion)
-        risk_score = "BAJO"
-        critical_count = sum(1 for c in correlaciones if c.get('nivel') in ['Alta', 'Crítica'])
-        # Detección de ransomware a partir de Vysion
-        ransom_flag = False
-        try:
-            v = resultados.get('vysion', {}).get('datos', {}) or {}
-            hits = v.get('hits', []) or []
-            RANS_KEYS = [
-                "wannacry","lockbit","conti","revil","maze","darkside","blackcat","alphv",
-                "clop","cl0p","babuk","netwalker","ryuk","avaddon","doppelpaymer","sodinokibi",
-                "hive","black basta","egregor","ragnarok","royal","play","noescape"
-            ]
-            def _txt(x): return str(x or "").lower()
-            for h in hits:
-                grp = _txt(h.get('ransomwareGroup'))
-                title = _txt((h.get('page') or {}).get('pageTitle'))
-                url = _txt(((h.get('page') or {}).get('url') or {}).get('url'))
-                host = _txt(((h.get('page') or {}).get('url') or {}).get('domainName'))
-                if any(k in grp for k in RANS_KEYS) or any(k in title for k in RANS_KEYS) or any(k in url for k in RANS_KEYS) or any(k in host for k in RANS_KEYS):
-                    ransom_flag = True
-                    break
-        except:
-            ransom_flag = False
-        if critical_count > 0 or ransom_flag:
-            risk_score = "ALTO"
-        elif len(correlaciones) > 5:
-            risk_score = "MEDIO"
+        risk_score = calcular_riesgo(resultados, correlaciones)
 
         resultados["graph_data"] = graph_data
         return SearchResponse(
@@ -89,12 +78,103 @@ async def perform_search(request: SearchRequest):
             timestamp=datetime.utcnow(),
             data=resultados,
             correlaciones=correlaciones,
-            geopuntos=[]
+            geopuntos=[],
+            **_estado_parcial(resultados)
         )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _estado_parcial(resultados: Dict[str, Any]) -> Dict[str, Any]:
+    p = resultados.get("presupuesto") or {}
+    return {"parcial": bool(p.get("parcial")), "motivo_parcial": p.get("agotado")}
+
+def _sse(evento: str, datos: Any) -> str:
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+@router.get("/stream")
+async def stream_search(objetivo: str, tipo: Optional[str] = None, engine: AnalysisEngine = Depends(get_engine)):
+    """
+    Búsqueda en streaming (Server-Sent Events): cada item del desglose, correlación, delta del grafo
+    y enriquecimiento global se envía en cuanto está listo. El evento final 'resumen' trae risk_score.
+    """
+    search_id = str(uuid.uuid4())
+    tipo = _resolver_tipo(objetivo, tipo)
+
+    async def eventos():
+        yield _sse("inicio", {"search_id": search_id, "query": objetivo, "detected_type": tipo})
+        try:
+            async for evento, datos in engine.run_analysis_stream(objetivo, tipo, max_depth=2, search_id=search_id):
+                if evento != "completado":
+                    yield _sse(evento, datos)
+                    continue
+                yield _sse("resumen", {
+                    "exito": True,
+                    "search_id": search_id,
+                    "query": objetivo,
+                    "detected_type": datos["tipo"],
+                    "risk_score": calcular_riesgo(datos["resultados"], datos["correlaciones"]),
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "total_desglose": len(datos["desglose"]),
+                    "total_correlaciones": len(datos["correlaciones"]),
+                    "total_nodos": len(datos["graph_data"]["nodes"]),
+                    "parcial": datos["parcial"],
+                    "motivo_parcial": datos["motivo_parcial"]
+                })
+        except Exception as e:
+            yield _sse("error", {"search_id": search_id, "detail": str(e)})
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Tipos que el motor sabe analizar de forma aislada (las invitaciones de Discord ya no se analizan)
+TIPOS_BULK = {'ip', 'domain', 'url', 'email', 'user', 'phone', 'wallet'}
+
+def _extraer_indicadores(req: BulkSearchRequest) -> List[Dict[str, str]]:
+    """Extrae, normaliza y deduplica los indicadores de la lista y/o del texto libre."""
+    extractor = ExtractorIdentificadores()
+    candidatos = []
+    # Cada entrada de la lista se trata por separado (el fallback de alias solo aplica a textos cortos)
+    for entrada in req.indicadores:
+        candidatos.extend(extractor.extraer_todos(entrada.strip()))
+    if req.texto:
+        candidatos.extend(extractor.extraer_todos(req.texto))
+    indicadores, vistos = [], set()
+    for c in candidatos:
+        if c['tipo'] not in TIPOS_BULK: continue
+        # La forma normalizada solo sirve para deduplicar: se analiza el valor tal cual (rutas de URL sensibles a mayúsculas)
+        valor = str(c['valor'] or '').strip()
+        clave = normalizar_indicador(c['tipo'], valor)
+        if not clave or (c['tipo'], clave) in vistos: continue
+        vistos.add((c['tipo'], clave))
+        indicadores.append({'tipo': c['tipo'], 'valor': valor})
+    return indicadores
+
+@router.post("/bulk")
+async def bulk_search(req: BulkSearchRequest, engine: AnalysisEngine = Depends(get_engine)):
+    """
+    Triage masivo de IOCs. Devuelve NDJSON: una línea por indicador (en orden de finalización, con su
+    'indice' en la lista deduplicada) mientras el resto sigue procesándose.
+    """
+    if not req.indicadores and not req.texto:
+        raise HTTPException(status_code=400, detail="Indique 'indicadores' o 'texto'")
+    indicadores = _extraer_indicadores(req)
+    if len(indicadores) > settings.BULK_MAX_INDICATORS:
+        raise HTTPException(status_code=413, detail=f"Máximo {settings.BULK_MAX_INDICATORS} indicadores por petición")
+
+    async def lineas():
+        async for resultado in engine.run_bulk_stream(indicadores):
+            yield json.dumps(resultado, ensure_ascii=False, default=str) + "\n"
+
+    return StreamingResponse(
+        lineas(),
+        media_type="application/x-ndjson",
+        headers={"X-Bulk-Total": str(len(indicadores)), "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/check_url", response_model=CheckURLResponse)
 async def check_url(req: CheckURLRequest):
     url = (req.url or "").strip()
@@ -105,45 +185,49 @@ async def check_url(req: CheckURLRequest):
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
     }
     try:
-        resp = requests.get(url, headers=headers, timeout=6, allow_redirects=True, stream=True)
-        status = resp.status_code
-        final = resp.url
-        resp.close()
+        # Solo interesa el estado: se abre en streaming y se cierra sin descargar el cuerpo
+        async with http_client.astream("GET", url, headers=headers, timeout=6, follow_redirects=True) as resp:
+            status = resp.status_code
+            final = str(resp.url)
         active = 200 <= status < 400
         return CheckURLResponse(active=active, status_code=status, final_url=final)
     except Exception as e:
         return CheckURLResponse(active=False, status_code=None, final_url=None, error=str(e))
 
 @router.post("/urlscan_result")
-async def urlscan_result(uuid: str = Form(...) ):
+async def urlscan_result(uuid: str = Form(...), servicios: dict = Depends(get_servicios)):
     try:
-        svc = ServicioUrlscan()
-        res = svc.get_result(uuid)
+        svc = servicios['urlscan']
+        res = await ejecutar_sync(svc.get_result, uuid)
         return res
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _guardar_temporal(file: UploadFile) -> str:
+    suffix = os.path.splitext(file.filename or "")[1] or ""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        content = await file.read()
+        tmp.write(content)
+        return tmp.name
+
 @router.post("/upload_analyze", response_model=SearchResponse)
 async def upload_analyze(
     file: UploadFile = File(...),
     tipo: str = Form(...),
+    engine: AnalysisEngine = Depends(get_engine),
 ):
     try:
         if tipo not in ["image", "document"]:
             raise HTTPException(status_code=400, detail="Tipo inválido. Use 'image' o 'document'.")
         # Guardar archivo temporalmente
-        suffix = os.path.splitext(file.filename or "")[1] or ""
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            content = await file.read()
-            tmp.write(content)
-            tmp_path = tmp.name
+        tmp_path = await _guardar_temporal(file)
         # Ejecutar análisis con archivo adjunto
-        engine = AnalysisEngine(max_depth=0)  # sin pivots para archivos
         search_id = str(uuid.uuid4())
         resultados, correlaciones, graph_data, tipo_detectado = await engine.run_analysis(
             objetivo_inicial=tmp_path,
             tipo_inicial=tipo,
-            archivos_adjuntos=[]
+            archivos_adjuntos=[],
+            max_depth=0  # sin pivots para archivos
         )
         # Limpieza del archivo temporal
         try:
@@ -162,9 +246,112 @@ async def upload_analyze(
             timestamp=datetime.utcnow(),
             data=resultados,
             correlaciones=correlaciones,
-            geopuntos=[]
+            geopuntos=[],
+            **_estado_parcial(resultados)
         )
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- Investigaciones en segundo plano (core.jobs) ---
+
+def _usuario(request: Request) -> str:
+    # Sin autenticación: se identifica al usuario por su IP. Las primeras entradas de X-Forwarded-For las pone
+    # el cliente; solo es fiable la que añade el proxy de confianza, a TRUSTED_PROXY_HOPS saltos del final
+    saltos = settings.TRUSTED_PROXY_HOPS
+    reenviado = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+    if saltos > 0 and len(reenviado) >= saltos:
+        return reenviado[-saltos]
+    return request.client.host if request.client else "anonimo"
+
+def _encolar(trabajos: ColaInvestigaciones, **kwargs) -> JobSubmitResponse:
+    try:
+        trabajo = trabajos.enviar(**kwargs)
+    except LimiteUsuario as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ColaLlena as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JobSubmitResponse(search_id=trabajo['search_id'], estado=trabajo['estado'], en_cola=trabajos.longitud())
+
+def _trabajo_o_404(trabajos: ColaInvestigaciones, search_id: str) -> dict:
+    trabajo = trabajos.obtener(search_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Investigación no encontrada o caducada")
+    return trabajo
+
+@router.post("/jobs", response_model=JobSubmitResponse, status_code=202)
+async def submit_job(req: JobSubmitRequest, request: Request, trabajos: ColaInvestigaciones = Depends(get_trabajos)):
+    tipo = _resolver_tipo(req.objetivo, req.tipo)
+    return _encolar(trabajos, usuario=_usuario(request), objetivo=req.objetivo, tipo=tipo, max_depth=req.max_depth)
+
+@router.post("/jobs/upload", response_model=JobSubmitResponse, status_code=202)
+async def submit_upload_job(
+    request: Request,
+    file: UploadFile = File(...),
+    tipo: str = Form(...),
+    trabajos: ColaInvestigaciones = Depends(get_trabajos),
+):
+    if tipo not in ["image", "document"]:
+        raise HTTPException(status_code=400, detail="Tipo inválido. Use 'image' o 'document'.")
+    tmp_path = await _guardar_temporal(file)
+    try:
+        return _encolar(
+            trabajos, usuario=_usuario(request), objetivo=tmp_path, tipo=tipo,
+            max_depth=0, query=file.filename or "archivo", archivo=tmp_path
+        )
+    except HTTPException:
+        os.unlink(tmp_path)
+        raise
+
+@router.get("/jobs/{search_id}", response_model=JobStatusResponse)
+async def job_status(search_id: str, trabajos: ColaInvestigaciones = Depends(get_trabajos)):
+    t = _trabajo_o_404(trabajos, search_id)
+    def _fecha(ts): return datetime.utcfromtimestamp(ts) if ts else None
+    return JobStatusResponse(
+        search_id=t['search_id'],
+        estado=t['estado'],
+        query=t['query'],
+        detected_type=t['tipo'],
+        creado=_fecha(t['creado']),
+        iniciado=_fecha(t['iniciado']),
+        terminado=_fecha(t['terminado']),
+        items_completados=len(t['parcial']['desglose']),
+        correlaciones=len(t['parcial']['correlaciones']),
+        error=t['error']
+    )
+
+@router.get("/jobs/{search_id}/partial")
+async def job_partial(search_id: str, trabajos: ColaInvestigaciones = Depends(get_trabajos)):
+    t = _trabajo_o_404(trabajos, search_id)
+    return {"search_id": search_id, "estado": t['estado'], **t['parcial']}
+
+@router.get("/jobs/{search_id}/result", response_model=SearchResponse)
+async def job_result(search_id: str, trabajos: ColaInvestigaciones = Depends(get_trabajos)):
+    t = _trabajo_o_404(trabajos, search_id)
+    if t['estado'] == 'error':
+        raise HTTPException(status_code=500, detail=t['error'])
+    if t['estado'] != 'completado' or not t['resultado']:
+        raise HTTPException(status_code=409, detail=f"Investigación aún {t['estado']}")
+    return SearchResponse(**t['resultado'])
+
+@router.get("/graph/{search_id}/group")
+async def graph_group(
+    search_id: str,
+    nodo: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    engine: AnalysisEngine = Depends(get_engine)
+):
+    """
+    Página de los miembros de un cluster de subdominios o de un nodo agregado del grafo de una investigación.
+    Los grafos se conservan GRAPH_STORE_TTL segundos (y como mucho GRAPH_STORE_MAX investigaciones).
+    """
+    grafo = engine.grafos.obtener(search_id)
+    if grafo is None:
+        raise HTTPException(status_code=404, detail="Grafo no encontrado o caducado")
+    pagina = grafo.miembros(nodo, offset, limit)
+    if pagina is None:
+        raise HTTPException(status_code=404, detail="El nodo no es un cluster ni un agregado")
+    return {"search_id": search_id, **pagina}
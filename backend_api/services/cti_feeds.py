@@ -1,4 +1,4 @@
-import requests
+from backend_api.core import http_client
 from bs4 import BeautifulSoup
 from typing import Dict, Any, List
 
@@ -16,7 +16,7 @@ class ServicioCTI:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
-            response = requests.get(self.RANSOMWARE_URL, headers=headers, timeout=10)
+            response = http_client.get(self.RANSOMWARE_URL, headers=headers, timeout=10)
             
             encontrado = False
             detalles = []
@@ -1,4 +1,4 @@
-import requests
+from backend_api.core import http_client
 from typing import Dict, Any
 import re
 from datetime import datetime
@@ -25,7 +25,7 @@ class ServicioDiscord:
         # Try API if token exists
         if settings.DISCORD_BOT_TOKEN:
             try:
-                resp = requests.get(f"{self.API_BASE}/users/{user_id}", headers=self.headers, timeout=10)
+                resp = http_client.get(f"{self.API_BASE}/users/{user_id}", headers=self.headers, timeout=10)
                 if resp.status_code == 200:
                     data = resp.json()
                     return {
@@ -1,10 +1,154 @@
-import requests
-from typing import Dict, Any, List
+import asyncio
+import inspect
+import itertools
+import json
+import time
+from backend_api.core import http_client
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
 import re
 import socket
 import whois
 import ssl
 from urllib.parse import urlparse
+from backend_api.core.budget import PresupuestoAgotado
+from backend_api.core.config import settings
+from backend_api.core.dns_resolver import obtener_resolutor
+from backend_api.core.executor import ejecutar_sync
+
+# python-whois acepta 'timeout' desde 0.9.6; con versiones anteriores la consulta va sin él
+try:
+    WHOIS_ADMITE_TIMEOUT = 'timeout' in inspect.signature(whois.whois).parameters
+except (AttributeError, TypeError, ValueError):
+    WHOIS_ADMITE_TIMEOUT = False
+
+# Caracteres que delimitan elementos al recorrer un array JSON por trozos (iterar_array_json)
+_RE_NO_SEPARADOR = re.compile(r'[^\s,]')
+_RE_SIGNIFICATIVO = re.compile(r'["\[\]{}]')
+_RE_EN_CADENA = re.compile(r'["\\]')
+_RE_FIN_ESCALAR = re.compile(r'[\s,\]]')
+
+
+def iterar_array_json(trozos: Iterable[str]) -> Iterator[Any]:
+    """
+    Recorre un array JSON según llega el texto, elemento a elemento: la memoria depende del tamaño de un
+    elemento, no del de la respuesta, y el consumidor puede parar cuando quiera.
+    Cada trozo se examina una sola vez (profundidad y cadenas se siguen entre trozos) y un elemento solo se
+    decodifica cuando está completo; los escalares terminan en el separador siguiente, no en el borde del trozo.
+    Un array sin cerrar o un elemento inválido lanzan ValueError: la respuesta no se da por completa.
+    """
+    dentro = False
+    clase = None # None entre elementos; 'compuesto', 'cadena' o 'escalar' dentro de uno
+    partes: List[str] = [] # Texto del elemento en curso de trozos anteriores
+    profundidad = 0
+    en_cadena = False
+    salto = 0 # Carácter escapado que cae al principio del trozo siguiente
+    decoder = json.JSONDecoder()
+
+    def _completar(resto: str) -> Any:
+        texto = "".join(partes) + resto
+        partes.clear()
+        return json.loads(texto)
+
+    for trozo in trozos:
+        i, n, ini = salto, len(trozo), 0
+        salto = 0
+        while i < n:
+            if clase is None:
+                m = _RE_NO_SEPARADOR.search(trozo, i)
+                if not m:
+                    break
+                i = m.start()
+                c = trozo[i]
+                if not dentro:
+                    if c != "[":
+                        raise ValueError("Se esperaba un array JSON")
+                    dentro = True
+                    i += 1
+                    continue
+                if c == "]":
+                    return
+                if c in '{["':
+                    # Vía rápida: el elemento cabe entero en este trozo
+                    try:
+                        elemento, i = decoder.raw_decode(trozo, i)
+                    except json.JSONDecodeError:
+                        pass
+                    else:
+                        yield elemento
+                        continue
+                ini = i
+                if c in "{[":
+                    clase, profundidad = 'compuesto', 0
+                elif c == '"':
+                    clase, en_cadena = 'cadena', True
+                    i += 1
+                else:
+                    clase = 'escalar'
+            elif clase == 'escalar':
+                m = _RE_FIN_ESCALAR.search(trozo, i)
+                if not m:
+                    break
+                i = m.start()
+                yield _completar(trozo[ini:i])
+                clase = None
+            elif en_cadena:
+                m = _RE_EN_CADENA.search(trozo, i)
+                if not m:
+                    break
+                i = m.end()
+                if m.group() == "\\":
+                    if i >= n:
+                        salto = 1
+                    i += 1
+                    continue
+                en_cadena = False
+                if clase == 'cadena':
+                    yield _completar(trozo[ini:i])
+                    clase = None
+            else:
+                m = _RE_SIGNIFICATIVO.search(trozo, i)
+                if not m:
+                    break
+                i = m.end()
+                c = m.group()
+                if c == '"':
+                    en_cadena = True
+                elif c in "{[":
+                    profundidad += 1
+                else:
+                    profundidad -= 1
+                    if profundidad == 0:
+                        yield _completar(trozo[ini:i])
+                        clase = None
+        if clase is not None:
+            partes.append(trozo[ini:])
+    raise ValueError("Array JSON truncado o vacío")
+
+
+class PlazoSonda:
+    """
+    Plazo de una sonda de dominio. Las sondas recortan con él el timeout real de cada llamada bloqueante
+    (httpx, socket, whois) y dejan de leer al vencer, devolviendo lo obtenido hasta entonces (cortada=True).
+    """
+    __slots__ = ('limite', 'cortada')
+
+    def __init__(self, segundos: float):
+        self.limite = time.monotonic() + segundos
+        self.cortada = False
+
+    def vigente(self) -> bool:
+        if time.monotonic() >= self.limite:
+            self.cortada = True
+        return not self.cortada
+
+    def timeout(self, nominal: float) -> float:
+        """Timeout para la siguiente llamada: el nominal o lo que quede del plazo; TimeoutError si ya no queda."""
+        restante = self.limite - time.monotonic()
+        if restante <= 0.1:
+            self.cortada = True
+            raise TimeoutError("plazo de la sonda agotado")
+        return min(nominal, restante)
+
 
 class ServicioDominio:
     BASE_URL = "https://crt.sh/?q={}&output=json"
@@ -15,122 +159,224 @@ class ServicioDominio:
         "104.24.0.0/14", "172.64.0.0/13", "131.0.72.0/22"
     ]
 
-    def analizar(self, dominio: str) -> Dict[str, Any]:
+    # Plazo de cada sonda (s): la sonda lo aplica a sus propias llamadas; tope común DOMAIN_PROBE_DEADLINE
+    TIMEOUTS_SONDAS = {
+        "crt.sh": 12, "crt.sh*": 10, "wayback": 10, "tls": 6,
+        "web": 7, "http": 16, "whois": 10
+    }
+
+    def __init__(self):
+        self.dns = obtener_resolutor()
+
+    async def analizar(self, dominio: str) -> Dict[str, Any]:
         # Normalizar dominio para consultas (evitar 'www.' y slashes finales)
         clean = str(dominio or "").strip().lower().rstrip(".").rstrip("/")
         if clean.startswith("www."):
             clean = clean[4:]
-        fuentes = {}
         subdominios = set()
         correos = set()
         errores = []
-        
-        try:
-            resp = requests.get(self.BASE_URL.format(clean), headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
-            if resp.status_code == 200:
-                data = resp.json()
-                for item in data:
-                    name_value = item.get('name_value', '')
-                    for nombre in name_value.split('\n'):
-                        if '@' in nombre: correos.add(nombre)
-                        else: subdominios.add(nombre)
-            else: errores.append(f"crt.sh HTTP {resp.status_code}")
-        except Exception as e: errores.append(f"crt.sh Error: {str(e)}")
-        try:
-            resp2 = requests.get(self.BASE_URL.format(f"%25.{clean}"), headers={'User-Agent': 'Mozilla/5.0'}, timeout=8)
-            if resp2.status_code == 200:
-                data2 = resp2.json()
-                for item in data2[:2000]:
-                    name_value = item.get('name_value', '')
-                    for nombre in name_value.split('\n'):
-                        if '@' in nombre: correos.add(nombre)
-                        else: subdominios.add(nombre)
-            else: errores.append(f"crt.sh* HTTP {resp2.status_code}")
-        except Exception as e: errores.append(f"crt.sh* Error: {str(e)}")
-        try:
-            wb = requests.get(f"https://web.archive.org/cdx/search/cdx?url=*.{clean}&output=json&fl=original&collapse=urlkey", headers={'User-Agent': 'Mozilla/5.0'}, timeout=8)
-            if wb.status_code == 200:
-                j = wb.json()
-                rows = j[1:1501] if isinstance(j, list) and len(j) > 1 else []
-                for r in rows:
-                    u = r[0] if isinstance(r, list) and r else (r if isinstance(r, str) else "")
-                    try:
-                        h = urlparse(u).hostname or ""
-                        h = h.lower()
-                        if h and h != clean and (h.endswith(f".{clean}")):
-                            subdominios.add(h)
-                        if h == clean:
-                            p = urlparse(u).path or ""
-                            m = re.search(r'([a-z0-9-]+)\.' + re.escape(clean), u, re.IGNORECASE)
-                            if m:
-                                subdominios.add(m.group(0).lower())
-                    except: pass
-            else: errores.append(f"wayback HTTP {wb.status_code}")
-        except Exception as e: errores.append(f"wayback Error: {str(e)}")
-        try:
-            ctx = ssl.create_default_context()
-            with socket.create_connection((clean, 443), timeout=4) as sock:
-                with ctx.wrap_socket(sock, server_hostname=clean) as ssock:
-                    cert = ssock.getpeercert()
-                    san = cert.get('subjectAltName', []) if isinstance(cert, dict) else []
-                    for t, n in san:
-                        if t == 'DNS':
-                            x = n.lower().lstrip("*.")
-                            if x and x != clean and x.endswith(f".{clean}"):
-                                subdominios.add(x)
-        except Exception as e: errores.append(f"tls Error: {str(e)}")
-
-        # 2. Web Analysis
-        meta_web = self._scrape_homepage(clean)
-        http_data = self._analisis_avanzado_http(clean)
-        ip_resuelta = self._resolve_ip(clean)
-        
+
+        # 1. Todas las sondas de red se lanzan a la vez (el orden fija el de errores_api); el dominio
+        # se resuelve en paralelo con el resolutor asíncrono
+        resolucion = asyncio.ensure_future(self.dns.resolver(clean))
+        sondas, cortadas = await self._ejecutar_sondas({
+            "crt.sh": (self._crtsh, clean, clean),
+            "crt.sh*": (self._crtsh, f"%25.{clean}", clean),
+            "wayback": (self._wayback, clean),
+            "tls": (self._tls_san, clean),
+            "web": (self._scrape_homepage, clean),
+            "http": (self._analisis_avanzado_http, clean),
+            "whois": (self._get_whois_info, clean)
+        })
+
+        for nombre in ("crt.sh", "crt.sh*", "wayback", "tls"):
+            res = sondas[nombre]
+            if isinstance(res, BaseException):
+                errores.append(f"{nombre} {self._describir_error(res)}")
+                continue
+            subs, mails = res
+            subdominios.update(subs)
+            correos.update(mails)
+            if nombre in cortadas:
+                errores.append(f"{nombre} Error: timeout (resultado parcial)")
+
+        # 2. Web Analysis (estas sondas ya devuelven valores por defecto ante errores)
+        meta_web = self._valor_sonda(sondas["web"], {"emails": [], "telefonos": [], "estado": "OFFLINE/ERROR"})
+        http_data = self._valor_sonda(sondas["http"], {"http_headers": {}, "cookies": [], "security_txt": {}, "robots_txt": {}})
+        whois_info = self._valor_sonda(sondas["whois"], {"creation_date": None})
         for email in meta_web.get('emails', []): correos.add(email)
 
+        # 3. Resolución en bloque de los subdominios (A/AAAA/CNAME) para separar los vivos
+        resueltos = await self.dns.resolver_muchos(subdominios, comodin_de=clean, plazo=settings.DNS_BULK_DEADLINE)
+        subdominios_dns = sorted(
+            ({"nombre": n, **r} for n, r in resueltos.items()),
+            key=lambda s: (s["vivo"] is not True, s["nombre"])
+        )
+        try:
+            apex = await asyncio.wait_for(resolucion, settings.DNS_TIMEOUT)
+        except Exception:
+            apex = {"ips": [], "vivo": None}
+        ip_resuelta = next((ip for ip in apex["ips"] if ':' not in ip), None) or next(iter(apex["ips"]), None)
+
+        # Sondas cortadas por plazo o presupuesto, con una respuesta truncada o inválida (ValueError) o
+        # nombres que el DNS no llegó a resolver: el resultado es incompleto y no debe cachearse
+        parcial = bool(cortadas) or any(isinstance(r, (asyncio.TimeoutError, PresupuestoAgotado, ValueError)) for r in sondas.values()) \
+            or apex["vivo"] is None or any(s["vivo"] is None for s in subdominios_dns)
+
         return {
             "exito": True,
+            "parcial": parcial,
             "datos": {
                 "dominio": clean,
-                "subdominios": list(subdominios),
+                "subdominios": [s["nombre"] for s in subdominios_dns],
+                "subdominios_dns": subdominios_dns,
                 "correos_relacionados": list(correos),
                 "telefonos_relacionados": meta_web.get('telefonos', []),
-                "total_subdominios": len(subdominios),
+                "total_subdominios": len(subdominios_dns),
+                "total_subdominios_vivos": sum(1 for s in subdominios_dns if s["vivo"]),
                 "analisis_web": http_data,
                 "errores_api": errores,
                 "web_status": meta_web.get('estado', 'UNKNOWN'),
                 "titulo_pagina": meta_web.get('titulo_web', 'N/A'),
-                "fecha_creacion_dominio": self._get_whois_info(clean).get('creation_date'),
+                "fecha_creacion_dominio": whois_info.get('creation_date'),
                 "ip_asociada": ip_resuelta
             }
         }
 
-    def _analisis_avanzado_http(self, dominio: str) -> Dict[str, Any]:
+    async def _ejecutar_sondas(self, sondas: Dict[str, tuple]) -> Tuple[Dict[str, Any], Set[str]]:
+        """
+        Lanza cada sonda síncrona en el pool de proveedores con su PlazoSonda (TIMEOUTS_SONDAS): la propia
+        sonda aplica timeouts reales y devuelve lo que tenga al vencer, así ningún hilo sigue ocupado tras
+        el plazo. DOMAIN_PROBE_DEADLINE queda como tope de seguridad de la espera.
+        Devuelve el resultado o la excepción de cada una y los nombres de las que se cortaron por plazo.
+        """
+        tareas, plazos = {}, {}
+        for nombre, (func, *args) in sondas.items():
+            plazos[nombre] = PlazoSonda(min(self.TIMEOUTS_SONDAS.get(nombre, settings.DOMAIN_PROBE_DEADLINE), settings.DOMAIN_PROBE_DEADLINE))
+            tareas[nombre] = asyncio.ensure_future(ejecutar_sync(func, *args, plazos[nombre]))
+        _, pendientes = await asyncio.wait(tareas.values(), timeout=settings.DOMAIN_PROBE_DEADLINE + 1)
+        for t in pendientes:
+            t.cancel()
+        resultados = {}
+        for nombre, t in tareas.items():
+            if t in pendientes:
+                resultados[nombre] = asyncio.TimeoutError()
+            elif t.exception() is not None:
+                resultados[nombre] = t.exception()
+            else:
+                resultados[nombre] = t.result()
+        cortadas = {n for n, p in plazos.items() if p.cortada and not isinstance(resultados[n], BaseException)}
+        return resultados, cortadas
+
+    def _valor_sonda(self, res: Any, defecto: Any) -> Any:
+        return defecto if isinstance(res, BaseException) else res
+
+    def _describir_error(self, exc: BaseException) -> str:
+        if isinstance(exc, asyncio.TimeoutError):
+            return "Error: timeout"
+        msg = str(exc)
+        return msg if msg.startswith("HTTP ") else f"Error: {msg}"
+
+    def _extraer_nombres(self, filas: Iterable[Dict[str, Any]], plazo: Optional[PlazoSonda] = None) -> Tuple[Set[str], Set[str]]:
+        """
+        Nombres de las filas de crt.sh, deduplicados al vuelo; para en DOMAIN_CRTSH_MAX_ROWS filas,
+        DOMAIN_MAX_SUBDOMAINS nombres o al vencer el plazo (con lo leído hasta entonces).
+        """
+        subdominios, correos = set(), set()
+        for item in itertools.islice(filas, settings.DOMAIN_CRTSH_MAX_ROWS):
+            if plazo is not None and not plazo.vigente():
+                break
+            name_value = item.get('name_value', '') if isinstance(item, dict) else ''
+            for nombre in name_value.split('\n'):
+                nombre = nombre.strip().lower()
+                if not nombre: continue
+                if '@' in nombre: correos.add(nombre)
+                else: subdominios.add(nombre)
+            if len(subdominios) >= settings.DOMAIN_MAX_SUBDOMAINS:
+                break
+        return subdominios, correos
+
+    def _crtsh(self, consulta: str, clean: str, plazo: PlazoSonda) -> Tuple[Set[str], Set[str]]:
+        # crt.sh no pagina: se lee el JSON en streaming y la conexión se cierra al alcanzar el límite o el plazo
+        with http_client.stream("GET", self.BASE_URL.format(consulta), headers={'User-Agent': 'Mozilla/5.0'}, timeout=plazo.timeout(12)) as resp:
+            if resp.status_code != 200:
+                raise RuntimeError(f"HTTP {resp.status_code}")
+            return self._extraer_nombres(iterar_array_json(resp.iter_text()), plazo)
+
+    def _wayback(self, clean: str, plazo: PlazoSonda) -> Tuple[Set[str], Set[str]]:
+        subdominios = set()
+        max_filas = settings.DOMAIN_WAYBACK_MAX_ROWS
+        # Formato CDX de texto (una URL por línea) con el límite aplicado también en el servidor
+        url = f"https://web.archive.org/cdx/search/cdx?url=*.{clean}&fl=original&collapse=urlkey&limit={max_filas}"
+        patron = re.compile(r'([a-z0-9-]+)\.' + re.escape(clean), re.IGNORECASE)
+        with http_client.stream("GET", url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=plazo.timeout(8)) as wb:
+            if wb.status_code != 200:
+                raise RuntimeError(f"HTTP {wb.status_code}")
+            for u in itertools.islice(wb.iter_lines(), max_filas):
+                if not plazo.vigente():
+                    break
+                u = u.strip()
+                if not u: continue
+                try:
+                    h = urlparse(u).hostname or ""
+                    h = h.lower()
+                    if h and h != clean and (h.endswith(f".{clean}")):
+                        subdominios.add(h)
+                    if h == clean:
+                        m = patron.search(u)
+                        if m:
+                            subdominios.add(m.group(0).lower())
+                except: pass
+                if len(subdominios) >= settings.DOMAIN_MAX_SUBDOMAINS:
+                    break
+        return subdominios, set()
+
+    def _tls_san(self, clean: str, plazo: PlazoSonda) -> Tuple[Set[str], Set[str]]:
+        subdominios = set()
+        ctx = ssl.create_default_context()
+        with socket.create_connection((clean, 443), timeout=plazo.timeout(4)) as sock:
+            sock.settimeout(plazo.timeout(4))
+            with ctx.wrap_socket(sock, server_hostname=clean) as ssock:
+                cert = ssock.getpeercert()
+                san = cert.get('subjectAltName', []) if isinstance(cert, dict) else []
+                for t, n in san:
+                    if t == 'DNS':
+                        x = n.lower().lstrip("*.")
+                        if x and x != clean and x.endswith(f".{clean}"):
+                            subdominios.add(x)
+        return subdominios, set()
+
+    def _analisis_avanzado_http(self, dominio: str, plazo: PlazoSonda) -> Dict[str, Any]:
+        # Peticiones secuenciales con timeouts nominales (5+3+3+3 s) dentro del plazo de la sonda; al vencer
+        # se devuelven las secciones ya obtenidas
         res = {"http_headers": {}, "cookies": [], "security_txt": {}, "robots_txt": {}}
+        cabeceras = {'User-Agent': 'Mozilla/5.0'}
         try:
-            resp = requests.get(f"https://{dominio}", timeout=8, headers={'User-Agent': 'Mozilla/5.0'})
+            resp = http_client.get(f"https://{dominio}", timeout=plazo.timeout(5), headers=cabeceras)
             res["http_headers"] = {k:v for k,v in resp.headers.items() if k.lower() in ['server', 'x-powered-by']}
-            res["cookies"] = [{"nombre": c.name, "domain": c.domain} for c in resp.cookies]
+            res["cookies"] = [{"nombre": c.name, "domain": c.domain} for c in resp.cookies.jar]
         except: pass
         try:
-            rbt = requests.get(f"https://{dominio}/robots.txt", timeout=6, headers={'User-Agent': 'Mozilla/5.0'})
+            rbt = http_client.get(f"https://{dominio}/robots.txt", timeout=plazo.timeout(3), headers=cabeceras)
             if rbt.status_code == 200 and rbt.text:
                 res["robots_txt"] = {"url": f"https://{dominio}/robots.txt", "contenido": rbt.text}
         except: pass
         try:
-            sec = requests.get(f"https://{dominio}/.well-known/security.txt", timeout=6, headers={'User-Agent': 'Mozilla/5.0'})
+            sec = http_client.get(f"https://{dominio}/.well-known/security.txt", timeout=plazo.timeout(3), headers=cabeceras)
             if sec.status_code == 200 and sec.text:
                 res["security_txt"] = {"url": f"https://{dominio}/.well-known/security.txt", "contenido": sec.text}
             else:
-                sec2 = requests.get(f"https://{dominio}/security.txt", timeout=6, headers={'User-Agent': 'Mozilla/5.0'})
+                sec2 = http_client.get(f"https://{dominio}/security.txt", timeout=plazo.timeout(3), headers=cabeceras)
                 if sec2.status_code == 200 and sec2.text:
                     res["security_txt"] = {"url": f"https://{dominio}/security.txt", "contenido": sec2.text}
         except: pass
         return res
 
-    def _scrape_homepage(self, dominio: str) -> Dict[str, Any]:
+    def _scrape_homepage(self, dominio: str, plazo: PlazoSonda) -> Dict[str, Any]:
         meta = {"emails": [], "telefonos": [], "estado": "UNKNOWN"}
         try:
-            resp = requests.get(f"http://{dominio}", timeout=5, headers={'User-Agent': 'Mozilla/5.0'})
+            resp = http_client.get(f"http://{dominio}", timeout=plazo.timeout(5), headers={'User-Agent': 'Mozilla/5.0'})
             meta['estado'] = "ONLINE" if resp.status_code < 400 else f"HTTP {resp.status_code}"
             if resp.status_code == 200:
                 meta['emails'] = list(set(re.findall(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', resp.text)))
@@ -140,16 +386,12 @@ class ServicioDominio:
         except: meta['estado'] = "OFFLINE/ERROR"
         return meta
 
-    def _get_whois_info(self, dominio: str) -> Dict[str, Any]:
+    def _get_whois_info(self, dominio: str, plazo: PlazoSonda) -> Dict[str, Any]:
         try:
-            w = whois.whois(dominio)
+            # Timeout del socket WHOIS: sin él la consulta puede bloquear el hilo del pool indefinidamente
+            opciones = {"timeout": plazo.timeout(10)} if WHOIS_ADMITE_TIMEOUT else {}
+            w = whois.whois(dominio, **opciones)
             cd = w.creation_date
             if isinstance(cd, list): cd = cd[0]
             return {"creation_date": str(cd) if cd else None}
         except: return {"creation_date": None}
-
-    def _resolve_ip(self, dominio: str) -> str:
-        try:
-            return socket.gethostbyname(dominio)
-        except:
-            return None
@@ -1,4 +1,4 @@
-import httpx
+from backend_api.core import http_client
 from typing import Dict, Any
 from backend_api.core.config import settings
 
@@ -22,17 +22,16 @@ class ServicioHIBP:
         url = f"{self.BASE_URL}/breachedaccount/{account}?truncateResponse=false"
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers, timeout=10.0)
-                if response.status_code == 200:
-                    data = response.json()
-                    return {"found": True, "breaches": data, "count": len(data), "summary": f"Cuenta encontrada en {len(data)} filtraciones."}
-                elif response.status_code == 404:
-                    return {"found": False, "breaches": [], "count": 0, "summary": "No se encontraron filtraciones."}
-                elif response.status_code == 429:
-                    return {"found": False, "error": "Rate Limit Exceeded", "breaches": []}
-                else:
-                    return {"found": False, "error": f"Error API ({response.status_code})", "breaches": []}
+            response = await http_client.aget(url, headers=self.headers, timeout=10.0)
+            if response.status_code == 200:
+                data = response.json()
+                return {"found": True, "breaches": data, "count": len(data), "summary": f"Cuenta encontrada en {len(data)} filtraciones."}
+            elif response.status_code == 404:
+                return {"found": False, "breaches": [], "count": 0, "summary": "No se encontraron filtraciones."}
+            elif response.status_code == 429:
+                return {"found": False, "error": "Rate Limit Exceeded", "breaches": []}
+            else:
+                return {"found": False, "error": f"Error API ({response.status_code})", "breaches": []}
         except Exception as e:
             return {"found": False, "error": str(e), "breaches": []}
 
@@ -40,16 +39,15 @@ class ServicioHIBP:
         """Versión síncrona para compatibilidad."""
         url = f"{self.BASE_URL}/breachedaccount/{account}?truncateResponse=false"
         try:
-            with httpx.Client() as client:
-                response = client.get(url, headers=self.headers, timeout=10.0)
-                if response.status_code == 200:
-                    data = response.json()
-                    return {"found": True, "breaches": data, "count": len(data)}
-                elif response.status_code == 404:
-                    return {"found": False, "breaches": [], "count": 0}
-                elif response.status_code == 429:
-                    return {"found": False, "error": "Rate Limit", "breaches": []}
-                else:
-                    return {"found": False, "error": str(response.status_code), "breaches": []}
+            response = http_client.get(url, headers=self.headers, timeout=10.0)
+            if response.status_code == 200:
+                data = response.json()
+                return {"found": True, "breaches": data, "count": len(data)}
+            elif response.status_code == 404:
+                return {"found": False, "breaches": [], "count": 0}
+            elif response.status_code == 429:
+                return {"found": False, "error": "Rate Limit", "breaches": []}
+            else:
+                return {"found": False, "error": str(response.status_code), "breaches": []}
         except Exception as e:
             return {"found": False, "error": str(e), "breaches": []}
@@ -1,4 +1,4 @@
-import requests
+from backend_api.core import http_client
 from typing import Dict, Any
 from backend_api.core.config import settings
 
@@ -11,7 +11,7 @@ class ServicioIP:
 
     def analizar(self, ip: str) -> Dict[str, Any]:
         try:
-            response = requests.get(f"{self.BASE_URL}{ip}", timeout=10)
+            response = http_client.get(f"{self.BASE_URL}{ip}", timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 if data.get("status") == "success":
@@ -57,7 +57,7 @@ class ServicioIP:
         headers = {'Accept': 'application/json', 'Key': self.api_key}
         params = {'ipAddress': ip, 'maxAgeInDays': '90'}
         try:
-            response = requests.get(self.ABUSE_IPDB_URL, headers=headers, params=params, timeout=10)
+            response = http_client.get(self.ABUSE_IPDB_URL, headers=headers, params=params, timeout=10)
             if response.status_code == 200:
                 data = response.json().get('data', {})
                 return {
@@ -1,4 +1,4 @@
-import requests
+from backend_api.core import http_client
 import time
 from typing import Dict, Any
 from backend_api.core.config import settings
@@ -15,7 +15,7 @@ class ServicioUrlscan:
         data = {'url': objetivo, 'public': 'on'}
         
         try:
-            resp = requests.post(self.SUBMIT_URL, headers=headers, json=data, timeout=15)
+            resp = http_client.post(self.SUBMIT_URL, headers=headers, json=data, timeout=15)
             if resp.status_code in [200, 201]:
                 uuid = resp.json().get('uuid')
                 result = {
@@ -25,7 +25,7 @@ class ServicioUrlscan:
                 }
                 # Intentar obtener el resultado si ya está disponible
                 try:
-                    r = requests.get(f"{self.RESULT_URL}{uuid}/", timeout=10)
+                    r = http_client.get(f"{self.RESULT_URL}{uuid}/", timeout=10)
                     if r.status_code == 200:
                         j = r.json() or {}
                         page = j.get('page', {}) or {}
@@ -67,7 +67,7 @@ class ServicioUrlscan:
 
     def get_result(self, uuid: str) -> Dict[str, Any]:
         try:
-            r = requests.get(f"{self.RESULT_URL}{uuid}/", timeout=10)
+            r = http_client.get(f"{self.RESULT_URL}{uuid}/", timeout=10)
             if r.status_code == 200:
                 j = r.json() or {}
                 page = j.get('page', {}) or {}
@@ -111,7 +111,7 @@ class ServicioUrlscan:
 
     def obtener_resultado(self, uuid: str) -> Dict[str, Any]:
         try:
-            resp = requests.get(f"{self.RESULT_URL}{uuid}/", timeout=15)
+            resp = http_client.get(f"{self.RESULT_URL}{uuid}/", timeout=15)
             if resp.status_code == 200:
                 data = resp.json()
                 return {
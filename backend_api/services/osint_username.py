@@ -1,191 +1,40 @@
-import requests
-from typing import Dict, Any, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from backend_api.core.executor import ejecutar_sync
 from backend_api.services.osint_hibp import ServicioHIBP
+from backend_api.services.osint_vysion import CAMPOS_LEAK, CAMPOS_PERFIL_IM, convertir
+from backend_api.services.sitios_usuario import SitioUsuario, cargar_catalogo
 from vysion import client
 from backend_api.core.config import settings
+from backend_api.core.rate_limit import obtener_limitador
+from backend_api.core import budget
 
 class ServicioUsuario:
-    SITIOS = {
-        "Twitter": "https://twitter.com/{}",
-        "GitHub": "https://github.com/{}",
-        "Instagram": "https://www.instagram.com/{}",
-        "Reddit": "https://www.reddit.com/user/{}",
-        "Twitch": "https://www.twitch.tv/{}",
-        "TikTok": "https://www.tiktok.com/@{}",
-        "YouTube": "https://www.youtube.com/@{}",
-        "Steam": "https://steamcommunity.com/id/{}",
-        "Pinterest": "https://www.pinterest.com/{}/",
-        "LinkedIn": "https://www.linkedin.com/in/{}",
-        "Snapchat": "https://www.snapchat.com/add/{}",
-        "Medium": "https://medium.com/@{}",
-        "SoundCloud": "https://soundcloud.com/{}",
-        "PSN": "https://psnprofiles.com/{}",
-        "Telegram": "https://t.me/{}"
-    }
     def __init__(self):
+        # Catálogo de sitios y reglas de detección (services/sitios_usuario.json), compilado una vez
+        self.sitios = cargar_catalogo()
         self.vysion = None
+        # Límite global de sondas de perfiles (ligado al event loop en el que se crea)
+        self._sondeo: Optional[asyncio.Semaphore] = None
+        self._sondeo_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.limitador_vysion = obtener_limitador('vysion')
         if settings.VYSION_API_KEY:
             try:
                 self.vysion = client.Client(api_key=settings.VYSION_API_KEY)
             except:
                 self.vysion = None
 
-    def analizar(self, usuario: str) -> Dict[str, Any]:
-        resultados = []
-        
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = {executor.submit(self._check_site, s, u, usuario): s for s, u in self.SITIOS.items()}
-            for f in as_completed(futures):
-                if f.result(): resultados.append(f.result())
-        
-        hibp_data = ServicioHIBP().sync_check_account(usuario)
-        profiles = {"total": 0, "hits": [], "error": None}
-        alias_leaks = {"total": 0, "hits": [], "error": None}
-        try:
-            if self.vysion and hasattr(self.vysion, "search_im_profiles"):
-                from datetime import datetime, timedelta
-                now = datetime.utcnow()
-                gte = (now - timedelta(days=365)).strftime("%Y-%m-%dT%H:%M:%S")
-                lte = now.strftime("%Y-%m-%dT%H:%M:%S")
-                queries = [usuario, usuario.lower(), usuario.upper(), usuario + " official", usuario + " real"]
-                hits_out = []
-                for q in queries:
-                    res = self.vysion.search_im_profiles(q=q, gte=gte, lte=lte)
-                    for h in getattr(res, "hits", []) or []:
-                        emails = []
-                        for e in getattr(h, "email", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: emails.append(v)
-                        paste = []
-                        for e in getattr(h, "paste", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: paste.append(v)
-                        skype = []
-                        for e in getattr(h, "skype", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: skype.append(v)
-                        telegram = []
-                        for e in getattr(h, "telegram", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: telegram.append(v)
-                        whatsapp = []
-                        for e in getattr(h, "whatsapp", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: whatsapp.append(v)
-                        btc = []
-                        for e in getattr(h, "bitcoin_address", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: btc.append(v)
-                        polkadot = []
-                        for e in getattr(h, "polkadot_address", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: polkadot.append(v)
-                        eth = []
-                        for e in getattr(h, "ethereum_address", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: eth.append(v)
-                        monero = []
-                        for e in getattr(h, "monero_address", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: monero.append(v)
-                        ripple = []
-                        for e in getattr(h, "ripple_address", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: ripple.append(v)
-                        zcash = []
-                        for e in getattr(h, "zcash_address", []) or []:
-                            v = getattr(e, "value", None) if hasattr(e, "value") else e.get("value") if isinstance(e, dict) else None
-                            if v: zcash.append(v)
-                        hits_out.append({
-                            "userId": getattr(h, "userId", None),
-                            "usernames": list(getattr(h, "usernames", []) or []),
-                            "firstName": list(getattr(h, "firstName", []) or []),
-                            "lastName": list(getattr(h, "lastName", []) or []),
-                            "detectionDate": str(getattr(h, "detectionDate", "")),
-                            "profilePhoto": list(getattr(h, "profilePhoto", []) or []),
-                            "bot": bool(getattr(h, "bot", False)),
-                            "discordLink": list(getattr(h, "discordLink", []) or []),
-                            "discriminator": list(getattr(h, "discriminator", []) or []),
-                            "platform": getattr(h, "platform", None),
-                            "email": emails,
-                            "paste": paste,
-                            "skype": skype,
-                            "telegram": telegram,
-                            "whatsapp": whatsapp,
-                            "bitcoin_address": btc,
-                            "polkadot_address": polkadot,
-                            "ethereum_address": eth,
-                            "monero_address": monero,
-                            "ripple_address": ripple,
-                            "zcash_address": zcash
-                        })
-                unique = []
-                seen = set()
-                for h in hits_out:
-                    k = (h.get("userId"), h.get("platform"), tuple(h.get("usernames") or []))
-                    if k not in seen:
-                        seen.add(k)
-                        unique.append(h)
-                profiles = {"total": len(unique), "hits": unique, "error": None}
-                err = getattr(res, "error", None)
-                if err:
-                    try:
-                        code = getattr(err, "code", None)
-                        msg = getattr(err, "message", None)
-                        profiles["error"] = f"API Error {code}: {msg}" if (code or msg) else "API Error"
-                    except:
-                        profiles["error"] = "API Error"
-            # Buscar filtraciones (leaks) por alias
-            if self.vysion and hasattr(self.vysion, "search_leaks"):
-                from datetime import datetime, timedelta
-                now = datetime.utcnow()
-                gte = (now - timedelta(days=365)).strftime("%Y-%m-%dT%H:%M:%S")
-                lte = now.strftime("%Y-%m-%dT%H:%M:%S")
-                leak_queries = [usuario, usuario.lower(), usuario.upper(), usuario.replace('_', ' ')]
-                leak_hits = []
-                for q in leak_queries:
-                    try:
-                        lres = self.vysion.search_leaks(q=q, gte=gte, lte=lte)
-                        for hit in getattr(lres, "hits", []) or []:
-                            leak_hits.append({
-                                "id": getattr(hit, 'id', None),
-                                "filePath": getattr(hit, 'filePath', None),
-                                "fileHash": getattr(hit, 'fileHash', None),
-                                "detectionDate": str(getattr(hit, 'detectionDate', '')),
-                                "detectedInfo": {
-                                    "emails": list(getattr(getattr(hit, 'detectedInfo', None) or {}, 'emails', []) or getattr(getattr(hit, 'detectedInfo', None) or {}, 'emails', [])),
-                                    "usernames": list(getattr(getattr(hit, 'detectedInfo', None) or {}, 'usernames', []) or getattr(getattr(hit, 'detectedInfo', None) or {}, 'usernames', []))
-                                },
-                                "highlight": {
-                                    "detectedInfo.emails": list((getattr(getattr(hit, 'highlight', None) or {}, 'detectedInfo.emails', []) or [])),
-                                    "content": list((getattr(getattr(hit, 'highlight', None) or {}, 'content', []) or []))
-                                }
-                            })
-                    except Exception as _:
-                        pass
-                # Deduplicación por id o filePath+fileHash
-                uniq = []
-                seen = set()
-                for h in leak_hits:
-                    key = h.get("id") or (h.get("filePath"), h.get("fileHash"))
-                    if key not in seen:
-                        seen.add(key)
-                        uniq.append(h)
-                # Orden por fecha descendente
-                def _ts(x):
-                    from datetime import datetime as _dt
-                    try:
-                        return int(_dt.fromisoformat((x or '').replace('Z', '+00:00')).timestamp())
-                    except:
-                        return 0
-                uniq.sort(key=lambda x: _ts(x.get("detectionDate")), reverse=True)
-                alias_leaks = {"total": len(uniq), "hits": uniq, "error": None}
-        except Exception as e:
-            profiles = {"total": 0, "hits": [], "error": str(e)}
-            alias_leaks = {"total": 0, "hits": [], "error": str(e)}
+    async def analizar(self, usuario: str) -> Dict[str, Any]:
+        # Sondas de perfiles, HIBP y Vysion en paralelo: las sondas y HIBP con el cliente asíncrono compartido,
+        # las consultas de Vysion (SDK síncrono) en el pool de proveedores
+        resultados, hibp_data, (profiles, alias_leaks) = await asyncio.gather(
+            self._sondear_sitios(usuario),
+            ServicioHIBP().check_account(usuario),
+            self._consultar_vysion(usuario)
+        )
 
-        return {
+        resultado = {
             "exito": True,
             "datos": {
                 "usuario": usuario,
@@ -196,14 +45,119 @@ class ServicioUsuario:
                 "vysion_alias_leaks": alias_leaks
             }
         }
+        # Vysion cortado por plazo o cupo: los perfiles valen, pero el resultado no es completo (no se cachea)
+        if profiles.get("parcial") or alias_leaks.get("parcial"):
+            resultado["parcial"] = True
+        return resultado
+
+    async def _consultar_vysion(self, usuario: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Perfiles de mensajería y filtraciones por alias en Vysion (ambas búsquedas a la vez)."""
+        if not self.vysion:
+            return {"total": 0, "hits": [], "error": None}, {"total": 0, "hits": [], "error": None}
+        now = datetime.utcnow()
+        gte = (now - timedelta(days=365)).strftime("%Y-%m-%dT%H:%M:%S")
+        lte = now.strftime("%Y-%m-%dT%H:%M:%S")
+        return tuple(await asyncio.gather(self._perfiles_im(usuario, gte, lte), self._leaks_alias(usuario, gte, lte)))
+
+    @staticmethod
+    def _variantes(consultas: List[str]) -> List[str]:
+        """Vysion no distingue mayúsculas: una sola consulta por forma normalizada (espacios y mayúsculas)."""
+        vistas, unicas = set(), []
+        for q in consultas:
+            clave = " ".join(q.split()).casefold()
+            if clave and clave not in vistas:
+                vistas.add(clave)
+                unicas.append(q)
+        return unicas
+
+    async def _buscar(self, metodo, q: str, gte: str, lte: str):
+        # El SDK de Vysion usa su propio transporte: presupuesto y límite de tasa se aplican aquí
+        budget.consumir()
+        await self.limitador_vysion.adquirir()
+        return await ejecutar_sync(metodo, q=q, gte=gte, lte=lte)
+
+    async def _perfiles_im(self, usuario: str, gte: str, lte: str) -> Dict[str, Any]:
+        if not hasattr(self.vysion, "search_im_profiles"):
+            return {"total": 0, "hits": [], "error": None}
+        queries = self._variantes([usuario, usuario.lower(), usuario.upper(), usuario + " official", usuario + " real"])
+        try:
+            respuestas = await asyncio.gather(*[self._buscar(self.vysion.search_im_profiles, q, gte, lte) for q in queries])
+        except budget.PresupuestoAgotado as e:
+            return {"total": 0, "hits": [], "error": str(e), "parcial": True}
+        except Exception as e:
+            return {"total": 0, "hits": [], "error": str(e)}
+        unique = []
+        seen = set()
+        error = None
+        for res in respuestas:
+            for h in getattr(res, "hits", []) or []:
+                hit = convertir(h, CAMPOS_PERFIL_IM)
+                k = (hit.get("userId"), hit.get("platform"), tuple(hit.get("usernames") or []))
+                if k not in seen:
+                    seen.add(k)
+                    unique.append(hit)
+            err = getattr(res, "error", None)
+            if err and error is None:
+                code = getattr(err, "code", None)
+                msg = getattr(err, "message", None)
+                error = f"API Error {code}: {msg}" if (code or msg) else "API Error"
+        return {"total": len(unique), "hits": unique, "error": error}
+
+    async def _leaks_alias(self, usuario: str, gte: str, lte: str) -> Dict[str, Any]:
+        if not hasattr(self.vysion, "search_leaks"):
+            return {"total": 0, "hits": [], "error": None}
+        leak_queries = self._variantes([usuario, usuario.lower(), usuario.upper(), usuario.replace('_', ' ')])
+        # Una consulta fallida no invalida las demás
+        respuestas = await asyncio.gather(*[self._buscar(self.vysion.search_leaks, q, gte, lte) for q in leak_queries], return_exceptions=True)
+        # Deduplicación por id o filePath+fileHash
+        uniq = []
+        seen = set()
+        cortes = [r for r in respuestas if isinstance(r, budget.PresupuestoAgotado)]
+        for lres in respuestas:
+            if isinstance(lres, Exception):
+                continue
+            for h in getattr(lres, "hits", []) or []:
+                hit = convertir(h, CAMPOS_LEAK)
+                key = hit.get("id") or (hit.get("filePath"), hit.get("fileHash"))
+                if key not in seen:
+                    seen.add(key)
+                    uniq.append(hit)
+        # Orden por fecha descendente
+        def _ts(x):
+            try:
+                return int(datetime.fromisoformat((x or '').replace('Z', '+00:00')).timestamp())
+            except:
+                return 0
+        uniq.sort(key=lambda x: _ts(x.get("detectionDate")), reverse=True)
+        if cortes:
+            return {"total": len(uniq), "hits": uniq, "error": str(cortes[0]), "parcial": True}
+        return {"total": len(uniq), "hits": uniq, "error": None}
+
+    def _limite_sondeo(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._sondeo is None or self._sondeo_loop is not loop:
+            self._sondeo_loop = loop
+            self._sondeo = asyncio.Semaphore(settings.USERNAME_PROBE_CONCURRENCY)
+        return self._sondeo
+
+    async def _sondear_sitios(self, usuario: str) -> List[Dict[str, str]]:
+        """
+        Sondea a la vez los sitios del catálogo que admiten el alias (los demás no cuestan ninguna petición).
+        Lo que no responde dentro de USERNAME_PROBE_DEADLINE se descarta; el resultado sigue el orden del catálogo.
+        """
+        tareas = [asyncio.ensure_future(self._check_site(s, usuario)) for s in self.sitios if s.admite(usuario)]
+        if not tareas:
+            return []
+        try:
+            await asyncio.wait(tareas, timeout=settings.USERNAME_PROBE_DEADLINE)
+        finally:
+            for t in tareas:
+                if not t.done():
+                    t.cancel()
+        return [t.result() for t in tareas if not t.cancelled() and t.result()]
 
-    def _check_site(self, sitio, url_template, usuario):
-        url = url_template.format(usuario)
+    async def _check_site(self, sitio: SitioUsuario, usuario: str) -> Optional[Dict[str, str]]:
         try:
-            resp = requests.get(url, timeout=5, headers={'User-Agent': 'Mozilla/5.0'})
-            if resp.status_code == 200:
-                return {"sitio": sitio, "url": url, "estado": "Encontrado"}
-            elif resp.status_code == 404:
-                return {"sitio": sitio, "url": url, "estado": "No Encontrado"}
-        except: pass
-        return None
+            async with self._limite_sondeo():
+                return await sitio.sondear(usuario)
+        except Exception: return None
@@ -1,4 +1,4 @@
-import requests
+from backend_api.core import http_client
 import base64
 from typing import Dict, Any
 from backend_api.core.config import settings
@@ -27,7 +27,7 @@ class ServicioVirusTotal:
         else: return {"exito": False, "error": "Tipo no soportado"}
 
         try:
-            resp = requests.get(f"{self.BASE_URL}{endpoint}", headers=self.headers, timeout=15)
+            resp = http_client.get(f"{self.BASE_URL}{endpoint}", headers=self.headers, timeout=15)
             if resp.status_code == 200:
                 data = resp.json().get('data', {}).get('attributes', {})
                 stats = data.get('last_analysis_stats', {})
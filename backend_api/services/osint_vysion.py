@@ -1,11 +1,67 @@
 import vysion
 from vysion import client
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Tuple
 from backend_api.core.config import settings
+from backend_api.core.rate_limit import obtener_limitador
+from backend_api.core import budget
+
+# --- Conversión de los objetos del SDK a dicts, dirigida por tablas de campos ---
+# Cada tabla es una secuencia (campo, conversión); convertir() recorre el hit una sola vez.
+# Los hits pueden llegar como modelos del SDK o como dicts (según versión y endpoint).
+
+def _atributo(obj: Any, campo: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(campo)
+    return getattr(obj, campo, None)
+
+
+def convertir(obj: Any, tabla: Tuple[Tuple[str, Callable[[Any], Any]], ...]) -> Dict[str, Any]:
+    return {campo: conv(_atributo(obj, campo)) for campo, conv in tabla}
+
+
+def _escalar(v: Any) -> Any:
+    return v
+
+
+def _texto(v: Any) -> str:
+    return "" if v is None else str(v)
+
+
+def _lista(v: Any) -> List[Any]:
+    return list(v or [])
+
+
+def _valores(v: Any) -> List[Any]:
+    """Listas de entidades {value: ...} (emails, wallets, teléfonos...) -> lista de valores."""
+    return [x for x in (_atributo(e, 'value') for e in v or []) if x]
+
+
+def _sub(*tabla: Tuple[str, Callable[[Any], Any]]) -> Callable[[Any], Dict[str, Any]]:
+    return lambda v: convertir(v, tabla)
+
+
+CAMPOS_PERFIL_IM = (
+    ("userId", _escalar), ("usernames", _lista), ("firstName", _lista), ("lastName", _lista),
+    ("detectionDate", _texto), ("profilePhoto", _lista), ("bot", bool), ("discordLink", _lista),
+    ("discriminator", _lista), ("platform", _escalar),
+    ("email", _valores), ("paste", _valores), ("skype", _valores), ("telegram", _valores), ("whatsapp", _valores),
+    ("bitcoin_address", _valores), ("polkadot_address", _valores), ("ethereum_address", _valores),
+    ("monero_address", _valores), ("ripple_address", _valores), ("zcash_address", _valores),
+)
+
+CAMPOS_LEAK = (
+    ("id", _escalar), ("filePath", _escalar), ("fileHash", _escalar), ("detectionDate", _texto),
+    ("detectedInfo", _sub(("emails", _lista), ("usernames", _lista))),
+    ("highlight", _sub(("detectedInfo.emails", _lista), ("content", _lista))),
+)
 
 class ServicioVysion:
     def __init__(self):
         self.client = None
+        # El SDK de Vysion usa su propio transporte: el límite de tasa se aplica aquí explícitamente
+        self.limitador = obtener_limitador('vysion')
         if settings.VYSION_API_KEY:
             try:
                 self.client = client.Client(api_key=settings.VYSION_API_KEY)
@@ -16,6 +72,8 @@ class ServicioVysion:
         
         try:
             # Búsqueda general (web)
+            budget.consumir()
+            self.limitador.adquirir_sync()
             result = self.client.search(objetivo)
             web_hits = []
             
@@ -80,25 +138,15 @@ class ServicioVysion:
                 # If date range not provided, use last 12 months window (optional)
                 leak_result = None
                 if hasattr(self.client, 'search_leaks'):
+                    budget.consumir()
+                    self.limitador.adquirir_sync()
                     leak_result = self.client.search_leaks(q=objetivo, gte=gte, lte=lte)
                 if leak_result and hasattr(leak_result, 'hits'):
-                    leak_hits = []
-                    for hit in leak_result.hits:
-                        leak_hits.append({
-                            "id": getattr(hit, 'id', None),
-                            "filePath": getattr(hit, 'filePath', None),
-                            "fileHash": getattr(hit, 'fileHash', None),
-                            "detectionDate": str(getattr(hit, 'detectionDate', '')),
-                            "detectedInfo": {
-                                "emails": list(getattr(getattr(hit, 'detectedInfo', None) or {}, 'emails', []) or getattr(getattr(hit, 'detectedInfo', None) or {}, 'emails', [])),
-                                "usernames": list(getattr(getattr(hit, 'detectedInfo', None) or {}, 'usernames', []) or getattr(getattr(hit, 'detectedInfo', None) or {}, 'usernames', []))
-                            },
-                            "highlight": {
-                                "detectedInfo.emails": list((getattr(getattr(hit, 'highlight', None) or {}, 'detectedInfo.emails', []) or [])),
-                                "content": list((getattr(getattr(hit, 'highlight', None) or {}, 'content', []) or []))
-                            }
-                        })
+                    leak_hits = [convertir(hit, CAMPOS_LEAK) for hit in leak_result.hits]
                     leaks_data = {"total": len(leak_hits), "hits": leak_hits}
+            except budget.PresupuestoAgotado:
+                # Sin plazo o cupo para los leaks el resultado no es completo: no se entrega como éxito
+                raise
             except Exception:
                 # Keep leaks section empty if endpoint not available or error
                 leaks_data = {"total": 0, "hits": []}
@@ -0,0 +1,101 @@
+# Catálogo declarativo de sitios para la enumeración de alias (ServicioUsuario).
+# Cada sitio del JSON indica la URL del perfil y la regla con la que se decide si existe:
+#   estado       -> solo el código HTTP (no se descarga el cuerpo)
+#   redireccion  -> sin seguir redirecciones: un Location que contiene 'ausente' indica que no existe
+#   marcador     -> se leen como mucho max_bytes del cuerpo, parando en cuanto aparece 'ausente' o 'presente'
+#   api          -> igual que marcador (o estado si no hay marcadores) pero contra el endpoint 'sonda'
+# Campos opcionales: sonda (URL consultada si no es la del perfil), patron (regex de alias válidos en el
+# sitio; si no encaja no se hace la petición), estados_ausente (por defecto [404]), cabeceras, max_bytes.
+import functools
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from backend_api.core import http_client
+from backend_api.core.config import settings
+
+CATALOGO_POR_DEFECTO = Path(__file__).with_name("sitios_usuario.json")
+REGLAS = ('estado', 'redireccion', 'marcador', 'api')
+CABECERAS_POR_DEFECTO = {'User-Agent': 'Mozilla/5.0'}
+
+
+class SitioUsuario:
+    """Entrada compilada del catálogo (regex y marcadores preparados una sola vez)."""
+    __slots__ = ('nombre', 'url', 'sonda', 'regla', 'patron', 'ausente', 'presente', 'estados_ausente', 'cabeceras', 'max_bytes')
+
+    def __init__(self, entrada: Dict[str, Any]):
+        self.nombre = entrada['nombre']
+        self.url = entrada['url']
+        self.regla = entrada.get('regla', 'estado')
+        if self.regla not in REGLAS:
+            raise ValueError(f"Regla desconocida '{self.regla}' en el sitio {self.nombre}")
+        self.sonda = entrada.get('sonda') or self.url
+        if self.regla == 'api' and 'sonda' not in entrada:
+            raise ValueError(f"El sitio {self.nombre} usa la regla 'api' sin 'sonda'")
+        self.patron = re.compile(entrada['patron']) if entrada.get('patron') else None
+        # Los marcadores se comparan en bytes sobre el cuerpo sin decodificar el texto
+        self.ausente = entrada['ausente'].encode('utf-8') if entrada.get('ausente') else None
+        self.presente = entrada['presente'].encode('utf-8') if entrada.get('presente') else None
+        if self.regla == 'redireccion' and not self.ausente:
+            raise ValueError(f"El sitio {self.nombre} usa la regla 'redireccion' sin 'ausente'")
+        self.estados_ausente = frozenset(entrada.get('estados_ausente', [404]))
+        self.cabeceras = {**CABECERAS_POR_DEFECTO, **entrada.get('cabeceras', {})}
+        self.max_bytes = int(entrada.get('max_bytes') or settings.USERNAME_MARKER_MAX_BYTES)
+
+    def admite(self, usuario: str) -> bool:
+        return self.patron is None or bool(self.patron.match(usuario))
+
+    async def sondear(self, usuario: str) -> Optional[Dict[str, str]]:
+        """Aplica la regla del sitio; devuelve el perfil con su estado o None si no se puede decidir."""
+        url = self.url.format(usuario)
+        sonda = self.sonda.format(usuario)
+        redirecciones = self.regla != 'redireccion'
+        async with http_client.astream("GET", sonda, timeout=5, headers=self.cabeceras, follow_redirects=redirecciones) as resp:
+            estado = self._decidir_estado(resp)
+            if estado is None and resp.status_code == 200:
+                estado = await self._decidir_cuerpo(resp)
+        if estado is None:
+            return None
+        return {"sitio": self.nombre, "url": url, "estado": estado}
+
+    def _decidir_estado(self, resp) -> Optional[str]:
+        if resp.status_code in self.estados_ausente:
+            return "No Encontrado"
+        if self.regla == 'redireccion' and resp.is_redirect:
+            destino = resp.headers.get('location', '').encode('utf-8')
+            return "No Encontrado" if self.ausente in destino else "Encontrado"
+        if resp.status_code == 200 and (self.regla in ('estado', 'redireccion') or not (self.ausente or self.presente)):
+            return "Encontrado"
+        return None
+
+    async def _decidir_cuerpo(self, resp) -> str:
+        """Lee el cuerpo por trozos solo hasta encontrar un marcador o agotar max_bytes."""
+        marcadores = [m for m in (self.ausente, self.presente) if m]
+        solape = max(len(m) for m in marcadores) - 1
+        cola, leidos = b"", 0
+        async for trozo in resp.aiter_bytes():
+            ventana = cola + trozo
+            if self.ausente and self.ausente in ventana:
+                return "No Encontrado"
+            if self.presente and self.presente in ventana:
+                return "Encontrado"
+            leidos += len(trozo)
+            if leidos >= self.max_bytes:
+                break
+            cola = ventana[-solape:] if solape else b""
+        # Sin marcador de presencia que lo confirme, un 200 sin el de ausencia queda para revisión
+        return "Verificar Manualmente" if self.presente else "Encontrado"
+
+
+@functools.lru_cache(maxsize=4)
+def cargar_catalogo(ruta: Optional[str] = None) -> Tuple[SitioUsuario, ...]:
+    """Carga y compila el catálogo una sola vez por ruta (USERNAME_SITES_CATALOG o el incluido)."""
+    ruta = Path(ruta or settings.USERNAME_SITES_CATALOG or CATALOGO_POR_DEFECTO)
+    with open(ruta, encoding='utf-8') as f:
+        datos = json.load(f)
+    sitios = tuple(SitioUsuario(e) for e in datos.get('sitios', []))
+    nombres = [s.nombre for s in sitios]
+    if len(nombres) != len(set(nombres)):
+        raise ValueError(f"Sitios duplicados en el catálogo {ruta}")
+    return sitios
@@ -0,0 +1,133 @@
+import asyncio
+import sqlite3
+import time
+import zlib
+
+from backend_api.core.cache import CacheSQLite, CacheTTL, clave_cache, ttl_para
+from backend_api.core.config import settings
+from backend_api.core.orchestrator import AnalysisEngine
+
+
+VALOR = {"exito": True, "datos": {"dominio": "ejemplo.com", "subdominios": ["a.ejemplo.com"] * 50, "nota": "ñandú"}}
+
+
+def _disco(tmp_path):
+    return CacheSQLite(str(tmp_path / "cache" / "resultados.sqlite3"))
+
+
+def test_sqlite_guarda_comprimido_y_recupera_el_valor(tmp_path):
+    disco = _disco(tmp_path)
+    ahora = time.time()
+    disco.guardar("domain|ejemplo.com|[]", VALOR, ahora, ahora + 60)
+    assert disco.obtener("domain|ejemplo.com|[]") == (VALOR, ahora, ahora + 60)
+    blob = sqlite3.connect(disco.ruta).execute("SELECT valor FROM resultados").fetchone()[0]
+    assert zlib.decompress(blob).decode("utf-8").startswith("{")
+    assert len(blob) < len(str(VALOR))
+    disco.cerrar()
+
+
+def test_sqlite_no_devuelve_entradas_caducadas(tmp_path):
+    disco = _disco(tmp_path)
+    ahora = time.time()
+    disco.guardar("ip|1.2.3.4|[]", VALOR, ahora - 120, ahora - 60)
+    assert disco.obtener("ip|1.2.3.4|[]") is None
+    assert disco.estadisticas()["entradas_vigentes"] == 0
+    disco.cerrar()
+
+
+def test_memoria_caduca_segun_ttl():
+    cache = CacheTTL()
+    cache.guardar("ip|1.2.3.4|[]", VALOR, 10, creado=time.time() - 20)
+    assert cache.obtener("ip|1.2.3.4|[]") is None
+    cache.guardar("ip|1.2.3.4|[]", VALOR, 10)
+    valor, edad = cache.obtener("ip|1.2.3.4|[]")
+    assert valor == VALOR and edad < 1
+
+
+def test_memoria_expulsa_la_menos_usada():
+    cache = CacheTTL(max_entradas=2)
+    cache.guardar("ip|a|[]", 1, 60)
+    cache.guardar("ip|b|[]", 2, 60)
+    cache.obtener("ip|a|[]")
+    cache.guardar("ip|c|[]", 3, 60)
+    assert cache.obtener("ip|b|[]") is None
+    assert cache.obtener("ip|a|[]")[0] == 1
+    assert cache.obtener("ip|c|[]")[0] == 3
+    assert cache.estadisticas()["expulsiones"] == 1
+
+
+def test_memoria_devuelve_copias():
+    cache = CacheTTL()
+    cache.guardar("ip|a|[]", {"datos": {"lista": [1]}}, 60)
+    cache.obtener("ip|a|[]")[0]["datos"]["lista"].append(2)
+    assert cache.obtener("ip|a|[]")[0] == {"datos": {"lista": [1]}}
+
+
+def test_acierto_en_disco_se_promociona_a_memoria(tmp_path):
+    disco = _disco(tmp_path)
+    asyncio.run(CacheTTL(persistente=disco).guardar_async("domain|ejemplo.com|[]", VALOR, 60))
+
+    # Otro worker (memoria vacía) comparte el mismo fichero
+    cache = CacheTTL(persistente=disco)
+    valor, edad = asyncio.run(cache.obtener_async("domain|ejemplo.com|[]"))
+    assert valor == VALOR and edad < 1
+    assert cache.estadisticas()["hits_disco"] == 1
+    disco.cerrar()
+    # Ya no hace falta el disco: se sirve de memoria con la expiración original
+    assert cache.obtener("domain|ejemplo.com|[]")[0] == VALOR
+    assert asyncio.run(cache.obtener_async("domain|ejemplo.com|[]"))[0] == VALOR
+
+
+def test_guardar_sin_persistir_solo_en_memoria(tmp_path):
+    disco = _disco(tmp_path)
+    cache = CacheTTL(persistente=disco)
+    asyncio.run(cache.guardar_async("ip|1.2.3.4|[]", VALOR, 60, persistir=False))
+    assert cache.obtener("ip|1.2.3.4|[]") is not None
+    assert disco.obtener("ip|1.2.3.4|[]") is None
+    disco.cerrar()
+
+
+def _motor(tmp_path):
+    disco = _disco(tmp_path)
+    return AnalysisEngine(servicios={}, cache=CacheTTL(persistente=disco)), disco
+
+
+def _llamar(motor, resultado, valor="persona@ejemplo.com"):
+    async def proveedor(v):
+        return resultado
+    return asyncio.run(motor._llamar("email", "email", proveedor, valor)), clave_cache("email", valor, "proveedor")
+
+
+def test_resultado_correcto_se_guarda_en_ambos_niveles(tmp_path):
+    motor, disco = _motor(tmp_path)
+    res, clave = _llamar(motor, {"exito": True, "datos": {"email": "persona@ejemplo.com"}})
+    assert res["cache"]["hit"] is False
+    assert motor.cache.obtener(clave) is not None
+    _, creado, expira = disco.obtener(clave)
+    assert round(expira - creado) == ttl_para("email")
+    disco.cerrar()
+
+
+def test_resultado_parcial_no_se_cachea(tmp_path):
+    motor, disco = _motor(tmp_path)
+    _, clave = _llamar(motor, {"exito": True, "parcial": True, "datos": {}})
+    assert motor.cache.obtener(clave) is None
+    assert disco.obtener(clave) is None
+    disco.cerrar()
+
+
+def test_negativos_con_ttl_corto_y_sin_persistir(tmp_path):
+    motor, disco = _motor(tmp_path)
+    negativos = [
+        {"exito": False, "error": "HTTP 500"},
+        {"error": "sin clave de API"},
+        # Un proveedor anidado que falla degrada el resultado completo
+        {"exito": True, "datos": {"whois": {"exito": True}, "virustotal": {"exito": False, "error": "429"}}}
+    ]
+    for i, negativo in enumerate(negativos):
+        _, clave = _llamar(motor, negativo, valor=f"negativo{i}@ejemplo.com")
+        assert disco.obtener(clave) is None
+        with motor.cache._lock:
+            _, creado, expira = motor.cache._datos[clave]
+        assert round(expira - creado) == min(ttl_para("email"), settings.CACHE_NEGATIVE_TTL)
+    disco.cerrar()
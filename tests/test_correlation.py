@@ -0,0 +1,23 @@
+from backend_api.core.correlation import Correlador, VistaItem
+
+
+def _usuario(ubicaciones):
+    perfiles = [{"sitio": f"Sitio{i}", "estado": "Encontrado", "metadatos": {"ubicacion": u}} for i, u in enumerate(ubicaciones)]
+    return {"tipo": "user", "input": "alias", "exito": True, "datos": {"username": {"perfiles_encontrados": perfiles}}}
+
+
+def _ip(pais):
+    return {"tipo": "ip", "input": "1.2.3.4", "exito": True, "datos": {"ip_api": {"pais": pais}}}
+
+
+def test_pais_salta_ubicaciones_no_reconocidas():
+    # Un perfil anterior con texto libre no reconocido no oculta el país de los siguientes
+    assert VistaItem(_usuario(["En algún lugar", "Madrid, España"])).pais == "Spain"
+    assert VistaItem(_usuario(["En algún lugar", None])).pais is None
+
+
+def test_correlacion_de_pais_con_ubicacion_previa_no_reconocida():
+    sesion = Correlador().nueva_sesion()
+    sesion.agregar(_usuario(["Tierra media", "Madrid, España"]))
+    correlaciones = sesion.agregar(_ip("Spain"))
+    assert any("Spain" in str(c) for c in correlaciones)
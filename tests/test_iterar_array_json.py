@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from backend_api.services.osint_domain import iterar_array_json
+
+
+FILAS = [
+    {"name_value": "a.ejemplo.com\nb.ejemplo.com", "id": 1},
+    {"name_value": "c.ejemplo.com", "anidado": {"lista": [1, 2, {"x": None}]}},
+    "texto suelto",
+    12.5,
+    True,
+    None,
+    [],
+    {}
+]
+
+
+def _trocear(texto, corte):
+    return [texto[:corte], texto[corte:]]
+
+
+def test_elementos_partidos_en_cualquier_posicion():
+    texto = json.dumps(FILAS)
+    for corte in range(len(texto) + 1):
+        assert list(iterar_array_json(_trocear(texto, corte))) == FILAS, corte
+
+
+def test_trozos_de_un_caracter():
+    texto = json.dumps(FILAS, indent=2)
+    assert list(iterar_array_json(texto)) == FILAS
+
+
+def test_comillas_y_corchetes_escapados_en_cadenas():
+    filas = [
+        {"name_value": "tiene \"comillas\" y ]corchetes[ y }llaves{"},
+        "\\",
+        "barra final \\\\",
+        "\\\"]",
+        {"k]": "v,", "[": ["]", "\\]"]}
+    ]
+    texto = json.dumps(filas)
+    for corte in range(len(texto) + 1):
+        assert list(iterar_array_json(_trocear(texto, corte))) == filas, corte
+    assert list(iterar_array_json(texto)) == filas
+
+
+def test_array_truncado_lanza_value_error():
+    texto = json.dumps(FILAS)
+    for corte in (1, len(texto) // 2, len(texto) - 1):
+        with pytest.raises(ValueError):
+            list(iterar_array_json([texto[:corte]]))
+
+
+def test_elemento_invalido_lanza_value_error():
+    with pytest.raises(ValueError):
+        list(iterar_array_json(['[{"a": 1}, {"b": }]']))
+
+
+def test_array_vacio():
+    assert list(iterar_array_json(["[]"])) == []
+    assert list(iterar_array_json(["[", " ", "]"])) == []
+
+
+def test_respuesta_vacia_lanza_value_error():
+    with pytest.raises(ValueError):
+        list(iterar_array_json([]))
+
+
+def test_consumidor_puede_parar_antes_del_final():
+    # Lo que sigue al primer elemento nunca se lee: no importa que esté truncado
+    elementos = iterar_array_json(['[{"a": 1}, ', '{"b": '])
+    assert next(elementos) == {"a": 1}
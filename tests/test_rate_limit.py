@@ -0,0 +1,139 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend_api.core import http_client, rate_limit
+from backend_api.core.budget import Presupuesto, bajo_presupuesto
+from backend_api.core.config import settings
+from backend_api.core.executor import ejecutar_sync
+from backend_api.core.rate_limit import LimitadorTasa, LimiteTasaExcedido, turno_anticipado
+
+
+class Reloj:
+    def __init__(self, ahora=1000.0):
+        self.ahora = ahora
+
+    def __call__(self):
+        return self.ahora
+
+
+def _limitador(por_minuto=60, rafaga=1):
+    reloj = Reloj()
+    return LimitadorTasa("prueba", por_minuto, rafaga, reloj=reloj), reloj
+
+
+def test_rafaga_sin_espera_y_despues_un_turno_por_intervalo():
+    lim, _ = _limitador(por_minuto=60, rafaga=3)
+    assert [lim._reservar(60) for _ in range(5)] == [0, 0, 0, 1.0, 2.0]
+
+
+def test_la_rafaga_se_recupera_con_el_tiempo():
+    lim, reloj = _limitador(por_minuto=60, rafaga=3)
+    for _ in range(3):
+        lim._reservar(60)
+    reloj.ahora += 2
+    assert [lim._reservar(60) for _ in range(3)] == [0, 0, 1.0]
+    reloj.ahora += 60
+    # El reposo no acumula más turnos que la ráfaga
+    assert [lim._reservar(60) for _ in range(4)] == [0, 0, 0, 1.0]
+
+
+def test_ritmo_constante_al_intervalo_no_espera():
+    lim, reloj = _limitador(por_minuto=30, rafaga=1)
+    for _ in range(10):
+        assert lim._reservar(60) == 0
+        reloj.ahora += lim.intervalo
+
+
+def test_llamadas_seguidas_se_espacian_al_intervalo():
+    lim, _ = _limitador(por_minuto=30, rafaga=1)
+    assert [lim._reservar(60) for _ in range(4)] == [0, 2.0, 4.0, 6.0]
+
+
+def test_turno_fuera_de_tope_se_rechaza_sin_reservar():
+    lim, _ = _limitador(por_minuto=60, rafaga=1)
+    lim._reservar(60)
+    with pytest.raises(LimiteTasaExcedido):
+        lim._reservar(0.5)
+    assert lim._reservar(60) == 1.0
+
+
+def test_devolver_libera_el_turno():
+    lim, _ = _limitador(por_minuto=60, rafaga=1)
+    lim._reservar(60)
+    lim._reservar(60)
+    lim.devolver()
+    assert lim._reservar(60) == 1.0
+
+
+def test_adquirir_sync_rechaza_esperas_mayores_que_el_tope(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_SYNC_WAIT", 5.0)
+    lim, _ = _limitador(por_minuto=6, rafaga=1)
+    lim.adquirir_sync()
+    with pytest.raises(LimiteTasaExcedido):
+        lim.adquirir_sync()
+    # El rechazo no deja reservado ningún turno
+    assert lim._reservar(60) == 10.0
+
+
+def test_turno_que_no_cabe_en_el_plazo_cuenta_como_rechazo():
+    lim, _ = _limitador(por_minuto=6, rafaga=1)
+    lim._reservar(60)
+    presupuesto = Presupuesto(plazo=2)
+    with pytest.raises(LimiteTasaExcedido):
+        asyncio.run(bajo_presupuesto(presupuesto, lim.adquirir()))
+    assert presupuesto.rechazos == 1
+
+
+def test_turno_anticipado_sin_usar_se_devuelve(monkeypatch):
+    lim, _ = _limitador(por_minuto=60, rafaga=1)
+    monkeypatch.setattr(rate_limit, "obtener_limitador", lambda nombre: lim)
+
+    async def sin_llamada():
+        async with turno_anticipado("prueba"):
+            pass
+
+    asyncio.run(sin_llamada())
+    assert lim._reservar(60) == 0
+
+
+def test_turno_anticipado_lo_usa_la_funcion_sincrona(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_SYNC_WAIT", 0.0)
+    lim, _ = _limitador(por_minuto=60, rafaga=1)
+    monkeypatch.setattr(rate_limit, "obtener_limitador", lambda nombre: lim)
+
+    async def con_llamada():
+        async with turno_anticipado("prueba"):
+            # El crédito llega al hilo del pool: no se reserva un segundo turno
+            await ejecutar_sync(lim.adquirir_sync)
+
+    asyncio.run(con_llamada())
+    assert lim._reservar(60) == 1.0
+
+
+@pytest.mark.parametrize("exc, enviada, devuelto", [
+    (httpx.ConnectError("sin conexión"), False, True),
+    (httpx.PoolTimeout("pool lleno"), False, True),
+    (asyncio.CancelledError(), False, True),
+    (httpx.ReadTimeout("sin respuesta"), False, False),
+    (asyncio.CancelledError(), True, False)
+])
+def test_devolver_solo_turnos_de_peticiones_no_enviadas(exc, enviada, devuelto):
+    lim, _ = _limitador(por_minuto=60, rafaga=1)
+    lim._reservar(60)
+    http_client._devolver(lim, exc, enviada)
+    assert lim._reservar(60) == (0 if devuelto else 1.0)
+
+
+def test_peticion_sin_conexion_devuelve_el_turno(monkeypatch):
+    lim, _ = _limitador(por_minuto=60, rafaga=1)
+
+    def sin_conexion(request):
+        raise httpx.ConnectError("sin conexión", request=request)
+
+    monkeypatch.setattr(http_client, "limitador_para_host", lambda host: lim)
+    monkeypatch.setattr(http_client, "_cliente", httpx.Client(transport=httpx.MockTransport(sin_conexion)))
+    with pytest.raises(httpx.ConnectError):
+        http_client.get("https://proveedor.test/api")
+    assert lim._reservar(60) == 0